@@ -1,21 +1,62 @@
 import os
+import time
+import threading
+_APP_START = time.perf_counter()
 os.environ["STREAMLIT_WATCHER_TYPE"] = "none"  # 關閉熱重載，避免 torch._classes bug
 
 import streamlit as st
-import core.RetrieverUtils as retriever
-import torch
-import core.Score as rank_score
+
+# 首次畫面（標題與輸入框）出現的目標時間；faiss、torch、langchain 等重型套件都延後到第一次查詢才載入
+TTFR_TARGET_SECONDS = float(os.getenv("QUIZHUNTER_TTFR_TARGET", "1.0"))
 
 @st.cache_resource
 def load_retriever_system():
+    import core.RetrieverUtils as retriever
     return retriever.bm25_hnsw_retriever()
 
+@st.cache_resource
+def _ttfr_metrics():
+    # 整個行程共用，Streamlit 重跑腳本時不會重設
+    return {"lock": threading.Lock(), "sessions": 0, "over_target": 0, "total_seconds": 0.0, "max_seconds": 0.0}
+
+def ttfr_stats():
+    m = _ttfr_metrics()
+    with m["lock"]:
+        return {
+            "target_seconds": TTFR_TARGET_SECONDS,
+            "sessions": m["sessions"],
+            "over_target": m["over_target"],
+            "mean_seconds": m["total_seconds"] / m["sessions"] if m["sessions"] else None,
+            "max_seconds": m["max_seconds"],
+        }
+
+def record_ttfr():
+    # 每個 session 只量第一次畫面；Streamlit 每次互動都重跑整個腳本，起點存在 session_state 才不會被重設
+    if "ttfr_seconds" in st.session_state:
+        return
+    ttfr = st.session_state.ttfr_seconds = time.perf_counter() - st.session_state.ttfr_start
+    m = _ttfr_metrics()
+    with m["lock"]:
+        m["sessions"] += 1
+        m["total_seconds"] += ttfr
+        m["max_seconds"] = max(m["max_seconds"], ttfr)
+        if ttfr > TTFR_TARGET_SECONDS:
+            m["over_target"] += 1
+    if ttfr > TTFR_TARGET_SECONDS:
+        print(f"[WARN] time-to-first-render {ttfr:.2f}s 超過目標 {TTFR_TARGET_SECONDS:.2f}s")
+    else:
+        print(f"[INFO] time-to-first-render {ttfr:.2f}s")
+
 def interface():
+    # 第一次執行時 _APP_START 就是這個 session 的起點；之後的重跑沿用
+    st.session_state.setdefault("ttfr_start", _APP_START)
     st.set_page_config(page_title="QuizHunter", layout="wide")
     st.title("QuizHunter Chatbot")
 
     query = st.text_input("請輸入想要查找的類似問題 👇")
 
+    record_ttfr()
+
     # 初始化 Session State
     if "last_query" not in st.session_state:
         st.session_state.last_query = None
@@ -35,9 +76,16 @@ def interface():
             st.session_state.last_query = query
             st.session_state.last_result = first_result
 
+            # 批次評分過的題目直接用存好的難度（core/BatchScorer.py），沒有才即時呼叫 Gemini
+            difficulty = first_result.get("difficulty")
             try:
-                stars, gold, answers, correctness, auto, gem = rank_score.DifficultyScorer(first_result).score()
-                st.session_state.last_score = (stars, gold, auto, gem)
+                if difficulty:
+                    st.session_state.last_score = (difficulty["stars"], difficulty["gold"],
+                                                   difficulty["star_auto"], difficulty["star_gemini"])
+                else:
+                    import core.Score as rank_score
+                    stars, gold, answers, correctness, auto, gem = rank_score.DifficultyScorer(first_result).score()
+                    st.session_state.last_score = (stars, gold, auto, gem)
             except Exception as e:
                 st.error("⚠️ 無法取得 Gemini 回應，可能已超出配額或速率限制，請稍候再試。")
                 st.exception(e)  # 若你要顯示原始錯誤訊息（可選）
@@ -82,6 +130,14 @@ def interface():
             st.warning(f"找不到關鍵字圖片：{keywords_path}")
 
 def main():
+    if os.getenv("QUIZHUNTER_IMPORT_REPORT"):
+        # 設定 QUIZHUNTER_IMPORT_REPORT=1 時，印出本次執行中各模組的載入時間
+        from core.ImportProfiler import ImportProfiler
+        with ImportProfiler() as profiler:
+            interface()
+        print(profiler.report())
+        print(f"[INFO] time-to-first-render：{ttfr_stats()}")
+        return
     interface()
 
 if __name__ == '__main__':
@@ -0,0 +1,32 @@
+import time
+import threading
+from typing import Optional, List
+
+
+# 本機測試與基準用的假 LLM，介面與 GoogleGeminiLLM._call 相同，不呼叫 Gemini。
+# 用法：DifficultyScorer(question, llm=FakeLLM(latency=0.5))，或 python -m core.BatchScorer --fake
+
+
+class FakeLLM:
+    # 本機測試用：依 prompt 內容回覆固定格式，可加延遲或前幾次故意失敗
+    def __init__(self, latency: float = 0.0, fail_first: int = 0, choice: str = "C"):
+        self.latency = latency
+        self.fail_first = fail_first
+        self.choice = choice
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None) -> str:
+        with self._lock:
+            self.calls += 1
+            calls = self.calls
+        time.sleep(self.latency)
+        if calls <= self.fail_first:
+            raise RuntimeError("fake LLM failure")
+        if "難度" in prompt and "顆星" in prompt:
+            return "難度：3 顆星"
+        if "學生作答" in prompt:
+            return "正確" if f"學生作答：{self.choice}" in prompt else "錯誤"
+        if "作答理由" in prompt:
+            return "理解完整"
+        return f"選項：{self.choice}\n理由：依題意判斷。"
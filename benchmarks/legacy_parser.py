@@ -0,0 +1,52 @@
+import re
+
+# 舊版以回溯 regex 解析題目的實作，只保留作為 benchmarks/parser_bench.py 的對照組；
+# 正式流程一律使用 core/QuestionExtractor.py 的逐行狀態機。
+
+
+def extract_groups_regex(md_text):
+    group_pattern = re.compile(r'^\s*(\d+)\s*-\s*(\d+)\s*為題組\s*\n([\s\S]*?)(?=\n\s*\d+\.)', re.M)
+    groups = {}
+    for match in group_pattern.finditer(md_text):
+        start, end, context = int(match.group(1)), int(match.group(2)), match.group(3).strip()
+        groups[f"{start}-{end}"] = {"start": start, "end": end, "context": context}
+    return groups
+
+
+def extract_questions_regex(md_text, groups, year="unknown", subject="unknown"):
+    questions = []
+    question_pattern = re.compile(r'^\s*(\d+)\.\s*([\s\S]*?)(?=\n\s*\d+\.|\Z)', re.M)
+    option_pattern = re.compile(
+        r'\(([A-Za-z甲乙丙丁戊己庚辛壬癸])\)\s*(.*?)(?=\s*(?:\([A-Za-z甲乙丙丁戊己庚辛壬癸]\)|\n\s*\d+\.|\n\s*\d+\s*-\s*\d+\s*為題組|\Z))',
+        re.S)
+
+    for match in question_pattern.finditer(md_text):
+        q_num, content = int(match.group(1)), match.group(2).strip()
+        if q_num == 0:
+            continue
+        stem = content
+        options = {}
+        first_option_match = re.search(r'\([A-Za-z甲乙丙丁戊己庚辛壬癸]\)', content)
+        if first_option_match:
+            stem = content[:first_option_match.start()].strip()
+            options_text = content[first_option_match.start():].strip()
+            found_options = option_pattern.findall(options_text)
+            for label, text in found_options:
+                cleaned_text = ' '.join(text.split())
+                options[label] = cleaned_text
+
+        group_id = next((gid for gid, g in groups.items() if g["start"] <= q_num <= g["end"]), None)
+        group_context = groups[group_id]["context"] if group_id else ""
+
+        questions.append({
+            "id": q_num,
+            "year": year,
+            "subject": subject,
+            "group_id": group_id,
+            "group_context": ' '.join(group_context.split()),
+            "stem": ' '.join(stem.split()),
+            "options": options
+        })
+
+    questions.sort(key=lambda x: x["id"])
+    return questions
@@ -0,0 +1,144 @@
+import os
+import sys
+import json
+import glob
+import time
+import argparse
+import platform
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from core.QuestionExtractor import QuestionExtractor
+from benchmarks.legacy_parser import extract_groups_regex, extract_questions_regex
+
+# 題目解析器的效能基準：逐行狀態機（extract_groups / extract_questions）對舊的 regex 版本
+# （benchmarks/legacy_parser.py），在刻意構造的輸入上量測隨輸入長度的變化，
+# 並確認兩者輸出完全相同。
+# 用法：python -m benchmarks.parser_bench --sizes 1000 2000 4000 8000 --output parser_bench.json
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def long_whitespace_option(n):
+    # 選項內容中有很長的空白：舊版選項 regex 在每個位置都重掃整段空白
+    return "1. 下列何者正確？\n(A) 甲" + " " * n + "乙 (B) 丙\n"
+
+
+def unterminated_groups(n):
+    # 很多題組標題之後都沒有題號行：舊版題組 regex 每個標題都掃到文件結尾才失敗
+    return "".join(f"{i}-{i + 1}為題組\n沒有題號的長篇敘述 {i}\n" for i in range(1, n + 1))
+
+
+def many_groups(n):
+    # 題組與題目都很多：舊版每題線性掃過所有題組
+    parts = []
+    for i in range(1, n + 1):
+        q = 2 * i - 1
+        parts.append(f"{q}-{q + 1}為題組\n題組說明 {i}\n{q}. 題幹 (A) 一 (B) 二\n{q + 1}. 題幹 (A) 三 (B) 四\n")
+    return "".join(parts)
+
+
+def long_unnumbered_passage(n):
+    # 一題後面接很長、沒有題號的段落，段落中夾雜像題號但不是題號的行
+    lines = ["1. 閱讀下文後回答問題"]
+    lines += [f"{i} 年的資料顯示 (甲) 與 (乙) 的差異" for i in range(n)]
+    return "\n".join(lines) + "\n(A) 是 (B) 否\n"
+
+
+CASES = {
+    "long_whitespace_option": long_whitespace_option,
+    "unterminated_groups": unterminated_groups,
+    "many_groups": many_groups,
+    "long_unnumbered_passage": long_unnumbered_passage,
+}
+
+
+def timed(fn, repeat):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def parse_state_machine(extractor, text):
+    return extractor.extract_questions(text, extractor.extract_groups(text))
+
+
+def parse_regex(extractor, text):
+    return extract_questions_regex(text, extract_groups_regex(text), year=extractor.year, subject=extractor.subject)
+
+
+def bench_case(name, sizes, repeat):
+    extractor = QuestionExtractor("bench.pdf")
+    rows = []
+    for n in sizes:
+        text = CASES[name](n)
+        new_seconds, new = timed(lambda: parse_state_machine(extractor, text), repeat)
+        old_seconds, old = timed(lambda: parse_regex(extractor, text), repeat)
+        rows.append({
+            "n": n,
+            "chars": len(text),
+            "state_machine_ms": new_seconds * 1000,
+            "regex_ms": old_seconds * 1000,
+            "identical": new == old,
+        })
+        print(f"[INFO] {name} n={n} state_machine={new_seconds * 1000:.1f}ms regex={old_seconds * 1000:.1f}ms",
+              file=sys.stderr)
+    # 每單位輸入的時間成長倍數：線性約為 1，平方時輸入加倍約為 2
+    for prev, row in zip(rows, rows[1:]):
+        scale = row["n"] / prev["n"]
+        row["state_machine_growth"] = row["state_machine_ms"] / max(prev["state_machine_ms"], 1e-9) / scale
+        row["regex_growth"] = row["regex_ms"] / max(prev["regex_ms"], 1e-9) / scale
+    return rows
+
+
+def bench_markdown(md_glob, repeat):
+    # 真實試卷（pymupdf4llm 轉出的 markdown）上的時間與一致性
+    extractor = QuestionExtractor("bench.pdf")
+    rows = []
+    for path in sorted(glob.glob(md_glob)):
+        with open(path, encoding="utf-8") as f:
+            text = extractor.clean_md_text(f.read())
+        new_seconds, new = timed(lambda: parse_state_machine(extractor, text), repeat)
+        old_seconds, old = timed(lambda: parse_regex(extractor, text), repeat)
+        rows.append({"path": path, "questions": len(new), "state_machine_ms": new_seconds * 1000,
+                     "regex_ms": old_seconds * 1000, "identical": new == old})
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="QuizHunter question parser benchmark")
+    parser.add_argument("--cases", nargs="+", default=list(CASES), choices=list(CASES))
+    parser.add_argument("--sizes", type=int, nargs="+", default=[500, 1000, 2000, 4000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--markdown", help="另外量測真實 markdown，例如 'md/*.md'")
+    parser.add_argument("--output", help="輸出 JSON 路徑，預設印到 stdout")
+    args = parser.parse_args(argv)
+
+    report = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "args": vars(args),
+        "cases": {name: bench_case(name, args.sizes, args.repeat) for name in args.cases},
+    }
+    if args.markdown:
+        report["markdown"] = bench_markdown(args.markdown, args.repeat)
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+import os
+import sys
+import json
+import glob
+import time
+import random
+import argparse
+import platform
+import resource
+import subprocess
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import faiss
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from core.AnnIndex import AnnIndex
+from core.ColumnarStore import open_store
+from core.SparseBM25 import SparseBM25, tokenize
+
+# 檢索效能基準：HNSW 對暴力內積的 recall@k、查詢延遲分位數、QPS、建索引時間與 RSS 峰值
+# 每個規模（與端對端量測）各在一個新的子行程裡跑，peak_rss_bytes 只反映該次量測，不會沿用前一個規模的峰值
+# 用法：python -m benchmarks.retrieval_bench --scales 1 10 100 --output bench.json
+
+
+def peak_rss_bytes():
+    # 目前行程從啟動到現在的 RSS 峰值
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def latency_summary(seconds):
+    ms = np.asarray(seconds) * 1000
+    return {
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p95_ms": float(np.percentile(ms, 95)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "mean_ms": float(ms.mean()),
+        "qps": float(len(ms) / (ms.sum() / 1000)) if ms.sum() else None,
+    }
+
+
+def load_bank(store_glob):
+    # 文字與向量都取自同一批向量檔，確保逐列對齊
+    stores = [open_store(p) for p in sorted(glob.glob(store_glob))]
+    if not stores:
+        raise SystemExit(f"找不到向量檔：{store_glob}")
+    texts = [s.text("embed_texts", i) for s in stores for i in range(len(s))]
+    embs = np.vstack([np.asarray(s.embs, dtype=np.float32) for s in stores])
+    embs /= np.linalg.norm(embs, axis=1, keepdims=True) + 1e-12
+    return texts, embs
+
+
+def perturb_text(text, rng):
+    # 隨機刪掉約 5% 的字並交換兩段，做出「相似但不同」的題目
+    chars = [c for c in text if rng.random() > 0.05]
+    if len(chars) > 20:
+        cut = rng.randrange(len(chars))
+        chars = chars[cut:] + chars[:cut]
+    return "".join(chars)
+
+
+def synthesize(texts, embs, scale, seed=0, noise=0.05):
+    if scale <= 1:
+        return list(texts), embs
+    rng = random.Random(seed)
+    np_rng = np.random.default_rng(seed)
+    out_texts = list(texts)
+    out_embs = [embs]
+    for _ in range(scale - 1):
+        out_texts.extend(perturb_text(t, rng) for t in texts)
+        noisy = embs + np_rng.normal(0, noise, embs.shape).astype(np.float32)
+        out_embs.append(noisy / (np.linalg.norm(noisy, axis=1, keepdims=True) + 1e-12))
+    return out_texts, np.vstack(out_embs).astype(np.float32)
+
+
+def make_queries(texts, embs, n_queries, seed=1, noise=0.05):
+    rng = random.Random(seed)
+    np_rng = np.random.default_rng(seed)
+    picks = [rng.randrange(len(texts)) for _ in range(n_queries)]
+    q_texts = [perturb_text(texts[i], rng) for i in picks]
+    q_embs = embs[picks] + np_rng.normal(0, noise, (n_queries, embs.shape[1])).astype(np.float32)
+    q_embs /= np.linalg.norm(q_embs, axis=1, keepdims=True) + 1e-12
+    return q_texts, q_embs.astype(np.float32)
+
+
+def bench_dense(embs, q_embs, k, kind="hnsw", ef_search=None, nprobe=None):
+    dim = embs.shape[1]
+    start = time.perf_counter()
+    index = AnnIndex(kind=kind).build(embs)
+    build_seconds = time.perf_counter() - start
+
+    exact = faiss.IndexFlatIP(dim)
+    exact.add(embs)
+    _, truth = exact.search(q_embs, k)
+
+    latencies, found = [], []
+    for q in q_embs:
+        t = time.perf_counter()
+        _, ids = index.search(q[None, :], k, ef_search=ef_search, nprobe=nprobe)
+        latencies.append(time.perf_counter() - t)
+        found.append(ids[0])
+    recall = np.mean([len(set(f) & set(t)) / k for f, t in zip(found, truth)])
+
+    t = time.perf_counter()
+    index.search(q_embs, k, ef_search=ef_search, nprobe=nprobe)
+    batch_seconds = time.perf_counter() - t
+
+    return {
+        "index": index.config(),
+        "ef_search": ef_search,
+        "nprobe": nprobe,
+        "build_seconds": build_seconds,
+        f"recall@{k}": float(recall),
+        "latency": latency_summary(latencies),
+        "batch_qps": len(q_embs) / batch_seconds if batch_seconds else None,
+    }
+
+
+def bench_bm25(texts, q_texts, k):
+    start = time.perf_counter()
+    tokenized = [tokenize(t) for t in texts]
+    tokenize_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    bm25 = SparseBM25()
+    bm25.add_documents(tokenized)
+    bm25.term_doc_matrix()
+    build_seconds = time.perf_counter() - start
+
+    q_tokens = [tokenize(t) for t in q_texts]
+    latencies = []
+    for tokens in q_tokens:
+        t = time.perf_counter()
+        ids, scores = bm25.score(tokens)
+        if len(ids) > k:
+            np.argpartition(-scores, k - 1)[:k]
+        latencies.append(time.perf_counter() - t)
+
+    t = time.perf_counter()
+    bm25.score_many(q_tokens)
+    batch_seconds = time.perf_counter() - t
+
+    return {
+        "tokenize_seconds": tokenize_seconds,
+        "build_seconds": build_seconds,
+        "postings": int(len(bm25.doc_ids)),
+        "latency": latency_summary(latencies),
+        "batch_qps": len(q_tokens) / batch_seconds if batch_seconds else None,
+    }
+
+
+def bench_retriever(json_path, q_texts, k, fusion="weighted"):
+    # 端對端：包含模型編碼，需要可載入的 SentenceTransformer
+    from core.BmHnsw import BM25HNSWRetriever
+    retriever = BM25HNSWRetriever(json_path, cache=None)
+    start = time.perf_counter()
+    retriever.load_and_prepare()
+    build_seconds = time.perf_counter() - start
+
+    latencies = []
+    for q in q_texts:
+        t = time.perf_counter()
+        retriever.search(q, top_k=k, fusion=fusion)
+        latencies.append(time.perf_counter() - t)
+    t = time.perf_counter()
+    retriever.search_many(q_texts, top_k=k, fusion=fusion)
+    batch_seconds = time.perf_counter() - t
+    return {
+        "fusion": fusion,
+        "build_seconds": build_seconds,
+        "latency": latency_summary(latencies),
+        "batch_qps": len(q_texts) / batch_seconds if batch_seconds else None,
+    }
+
+
+def run_scale(args, scale):
+    base_texts, base_embs = load_bank(args.stores)
+    texts, embs = synthesize(base_texts, base_embs, scale, seed=args.seed)
+    q_texts, q_embs = make_queries(texts, embs, args.queries, seed=args.seed + 1)
+    run = {
+        "scale": scale,
+        "corpus_size": len(texts),
+        "dense": [bench_dense(embs, q_embs, args.k, kind, ef_search, nprobe)
+                  for kind in args.index for ef_search in args.ef_search for nprobe in args.nprobe],
+        "bm25": bench_bm25(texts, q_texts, args.k),
+    }
+    run["peak_rss_bytes"] = peak_rss_bytes()
+    return run
+
+
+def run_end_to_end(args):
+    base_texts, base_embs = load_bank(args.stores)
+    q_texts, _ = make_queries(base_texts, base_embs, args.queries, seed=args.seed + 1)
+    result = bench_retriever(args.json, q_texts, args.k, args.fusion)
+    result["peak_rss_bytes"] = peak_rss_bytes()
+    return result
+
+
+def isolated(fn, *args):
+    # 在新的子行程（spawn）裡執行，跑完即結束，ru_maxrss 不受前面的量測影響
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+        return pool.submit(fn, *args).result()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="QuizHunter retrieval benchmark")
+    parser.add_argument("--json", default="Quiz_json/all.json")
+    parser.add_argument("--stores", default="Quiz_clean_Embedding_npz/*.npz")
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 10])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--index", nargs="+", default=["hnsw"], choices=["flat", "hnsw", "ivfpq", "auto"])
+    parser.add_argument("--ef-search", type=int, nargs="+", default=[None], help="HNSW 每次查詢的 efSearch")
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[None], help="IVF-PQ 每次查詢的 nprobe")
+    parser.add_argument("--end-to-end", action="store_true", help="也量測含模型編碼的 BM25HNSWRetriever")
+    parser.add_argument("--fusion", default="weighted", choices=["weighted", "rrf"], help="端對端量測的分數融合方式")
+    parser.add_argument("--output", help="輸出 JSON 路徑，預設印到 stdout")
+    args = parser.parse_args(argv)
+
+    report = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "faiss": faiss.__version__,
+        "args": vars(args),
+        "runs": [],
+    }
+    for scale in args.scales:
+        run = isolated(run_scale, args, scale)
+        report["runs"].append(run)
+        print(f"[INFO] scale={scale} n={run['corpus_size']} done", file=sys.stderr)
+
+    if args.end_to_end:
+        report["end_to_end"] = isolated(run_end_to_end, args)
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+import os
+import json
+import numpy as np
+import faiss
+
+# 可切換的向量索引：
+#   flat   精確內積，小題庫最準也夠快
+#   hnsw   圖索引，可調 M / efConstruction / efSearch
+#   ivfpq  倒排 + 乘積量化，大題庫省記憶體，查詢時調 nprobe
+#   auto   依題庫大小自動選擇
+DEFAULT_PARAMS = {
+    "flat": {},
+    "hnsw": {"m": 32, "ef_construction": 100, "ef_search": 64},
+    "ivfpq": {"nlist": None, "pq_m": None, "nbits": 8, "nprobe": 16},
+}
+FLAT_MAX = 5_000
+HNSW_MAX = 1_000_000
+
+
+def choose_kind(n):
+    if n <= FLAT_MAX:
+        return "flat"
+    if n <= HNSW_MAX:
+        return "hnsw"
+    return "ivfpq"
+
+
+class AnnIndex:
+    def __init__(self, kind="auto", **params):
+        self.kind = kind
+        self.params = params
+        self.index = None
+
+    @property
+    def ntotal(self):
+        return self.index.ntotal if self.index is not None else 0
+
+    def config(self):
+        return {"kind": self.kind, **self.params}
+
+    def build(self, embs):
+        embs = np.ascontiguousarray(embs, dtype=np.float32)
+        n, dim = embs.shape
+        if self.kind == "auto":
+            self.kind = choose_kind(n)
+        self.params = {**DEFAULT_PARAMS[self.kind], **self.params}
+
+        if self.kind == "flat":
+            self.index = faiss.IndexFlatIP(dim)
+        elif self.kind == "hnsw":
+            self.index = faiss.IndexHNSWFlat(dim, self.params["m"], faiss.METRIC_INNER_PRODUCT)
+            self.index.hnsw.efConstruction = self.params["ef_construction"]
+            self.index.hnsw.efSearch = self.params["ef_search"]
+        elif self.kind == "ivfpq":
+            nlist = self.params["nlist"] or max(1, int(4 * np.sqrt(n)))
+            pq_m = self.params["pq_m"] or (dim // 8 if dim % 8 == 0 else dim // 4)
+            self.params.update(nlist=nlist, pq_m=pq_m)
+            self.index = faiss.index_factory(
+                dim, f"IVF{nlist},PQ{pq_m}x{self.params['nbits']}", faiss.METRIC_INNER_PRODUCT)
+            print(f"Training IVF-PQ (nlist={nlist}, PQ{pq_m}x{self.params['nbits']}) on {n} vectors...")
+            self.index.train(embs)
+            faiss.extract_index_ivf(self.index).nprobe = self.params["nprobe"]
+        else:
+            raise ValueError(f"Unknown index kind: {self.kind}")
+
+        self.index.add(embs)
+        return self
+
+    def add(self, embs):
+        self.index.add(np.ascontiguousarray(embs, dtype=np.float32))
+
+    def search(self, queries, k, ef_search=None, nprobe=None):
+        queries = np.ascontiguousarray(queries, dtype=np.float32)
+        params = None
+        if self.kind == "hnsw" and ef_search is not None:
+            params = faiss.SearchParametersHNSW()
+            params.efSearch = max(ef_search, k)
+        elif self.kind == "ivfpq" and nprobe is not None:
+            params = faiss.SearchParametersIVF()
+            params.nprobe = nprobe
+        if params is None:
+            return self.index.search(queries, k)
+        return self.index.search(queries, k, params=params)
+
+    def save(self, path):
+        os.makedirs(path, exist_ok=True)
+        faiss.write_index(self.index, os.path.join(path, "index.faiss"))
+        with open(os.path.join(path, "ann.json"), "w", encoding="utf-8") as f:
+            json.dump(self.config(), f)
+
+    @classmethod
+    def load(cls, path):
+        with open(os.path.join(path, "ann.json"), encoding="utf-8") as f:
+            config = json.load(f)
+        ann = cls(**config)
+        index_path = os.path.join(path, "index.faiss")
+        if ann.kind == "ivfpq":
+            # IVF 用 mmap 讀會變成唯讀的 OnDiskInvertedLists，之後 add() 會失敗，所以一律整個讀進記憶體
+            ann.index = faiss.read_index(index_path)
+        else:
+            try:
+                ann.index = faiss.read_index(index_path, faiss.IO_FLAG_MMAP)
+            except RuntimeError:
+                # 部分索引型別不支援 mmap，退回一般讀取
+                ann.index = faiss.read_index(index_path)
+        if ann.kind == "hnsw":
+            ann.index.hnsw.efSearch = ann.params["ef_search"]
+        elif ann.kind == "ivfpq":
+            faiss.extract_index_ivf(ann.index).nprobe = ann.params["nprobe"]
+        return ann
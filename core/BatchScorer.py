@@ -0,0 +1,85 @@
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from tqdm import tqdm
+from core.DifficultyStore import DifficultyStore, content_hash
+from core.QuestionKey import question_key
+from core.QuestionStore import load_questions
+from core.RetrieverUtils import build_content
+from core.Score import DifficultyScorer, GuardedLLM, TokenBucket
+
+# 離線批次評估整個題庫的難度，結果寫進 DifficultyStore：
+#   - 每題評完立刻寫入，中斷後重跑會跳過已完成（且內容沒變）的題目；以內容 hash 判斷，內容相同的題目只評一次
+#   - 同時最多 workers 題在評分，所有題目共用同一個限速器，總呼叫速率不會隨 workers 放大
+# 用法：python -m core.BatchScorer --json Quiz_json/all.json --store difficulty.sqlite --workers 2
+
+
+def pending_questions(questions, store, rescore=False):
+    done = set() if rescore else store.hashes()
+    todo = []
+    for q in questions:
+        content = build_content(q)
+        h = content_hash(content)
+        if h not in done:
+            done.add(h)
+            todo.append((question_key(q), content))
+    return todo
+
+
+def score_bank(json_path, store_path="difficulty.sqlite", workers=2, llm=None, rate_per_second=4.0,
+               burst=4, timeout=60.0, max_retries=3, limit=None, rescore=False):
+    questions = load_questions(json_path)
+    store = DifficultyStore(store_path)
+    todo = pending_questions(questions, store, rescore=rescore)
+    if limit is not None:
+        todo = todo[:limit]
+    print(f"📋 題庫 {len(questions)} 題，已評分 {len(store)} 題，本次評分 {len(todo)} 題")
+    if not todo:
+        return store
+
+    if llm is None:
+        llm = DifficultyScorer.google_llm_model()
+    # 每題內部也會並行呼叫 LLM，所以呼叫執行緒數要涵蓋 workers × 每題的並行數
+    shared = GuardedLLM(llm, limiter=TokenBucket(rate_per_second, burst), timeout=timeout,
+                        max_retries=max_retries, max_workers=workers * 8)
+
+    def score_one(key, content):
+        result = DifficultyScorer({"content": content}, llm=shared).score()
+        store.put(content_hash(content), result, key=key)
+        return result
+
+    failed = []
+    start = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(score_one, key, content): key for key, content in todo}
+            for future in tqdm(as_completed(futures), total=len(futures), desc="Scoring"):
+                try:
+                    future.result()
+                except Exception as e:
+                    failed.append(futures[future])
+                    print(f"❌ {futures[future]} 評分失敗：{e}")
+    finally:
+        shared.shutdown()
+
+    print(f"✅ 完成 {len(todo) - len(failed)} 題（{time.perf_counter() - start:.1f}s），失敗 {len(failed)} 題；"
+          f"重跑即可續評失敗的題目")
+    return store
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="題庫難度批次評分")
+    parser.add_argument("--json", default="Quiz_json/all.json")
+    parser.add_argument("--store", default="difficulty.sqlite")
+    parser.add_argument("--workers", type=int, default=2, help="同時評分的題數")
+    parser.add_argument("--rate", type=float, default=4.0, help="每秒最多 LLM 呼叫數")
+    parser.add_argument("--limit", type=int, help="本次最多評幾題")
+    parser.add_argument("--rescore", action="store_true", help="忽略既有結果全部重評")
+    parser.add_argument("--fake", action="store_true", help="使用本機 FakeLLM，不呼叫 Gemini")
+    args = parser.parse_args()
+    llm = None
+    if args.fake:
+        from benchmarks.fake_llm import FakeLLM
+        llm = FakeLLM(latency=0.05)
+    score_bank(args.json, args.store, workers=args.workers, rate_per_second=args.rate, limit=args.limit,
+               rescore=args.rescore, llm=llm)
@@ -1,35 +1,63 @@
 import os
 import json
+import uuid
+import shutil
+import hashlib
 import numpy as np
-from tqdm import tqdm
-import faiss
-from sentence_transformers import SentenceTransformer
-from rank_bm25 import BM25Okapi
+from core.ModelRegistry import get_model
+from core.AnnIndex import AnnIndex
+from core.DifficultyStore import content_hash
+from core.Fusion import fuse
+from core.QuestionKey import question_key
+from core.QuestionStore import load_questions
+from core.QueryCache import normalize_query, shared_query_cache
+from core.RetrieverUtils import build_content
+from core.SparseBM25 import SparseBM25, tokenize, tokenize_many
+
+
+SNAPSHOT_VERSION = 4
 
 
 class BM25HNSWRetriever:
-    def __init__(self, data_path, model_name="shibing624/text2vec-base-chinese"):
+    def __init__(self, data_path, model_name="shibing624/text2vec-base-chinese", cache=shared_query_cache,
+                 index_config=None, difficulty_store=None):
         self.data_path = data_path
-        self.model = SentenceTransformer(model_name)
+        self.model_name = model_name
+        # 例如 {"kind": "hnsw", "m": 32, "ef_search": 128}，可選 flat / hnsw / ivfpq / auto（見 core/AnnIndex.py）
+        self.index_config = dict(index_config or {"kind": "auto"})
+        self.model = get_model(model_name)
+        self.cache = cache
+        # 批次評好的難度（core/DifficultyStore.py），有的話每筆結果都帶 "difficulty" 欄位
+        self.difficulty_store = difficulty_store
+        # 題庫內容每變動一次就遞增，讓舊的查詢結果快取自動失效；generation 只在這個實例內有意義，
+        # 共用 shared_query_cache 時再加上實例 token，別的 retriever 的結果不會被拿來用
+        self.generation = 0
+        self.instance_token = uuid.uuid4().hex
         self.data = []
         self.contents = []
         self.embeddings = None
         self.bm25 = None
         self.faiss_index = None
+        # 題庫裡同一個 年度-題號 可能對應多題（例如年度為 unknown），所以一個 key 對應多列
+        self.key_to_rows = {}
+        self.deleted = set()
+
+    def tokenize(self, text):
+        return tokenize(text)
+
+    def _reindex_keys(self):
+        # 墓碑列不算，刪除或更新後就找不到
+        self.key_to_rows = {}
+        for i, q in enumerate(self.data):
+            if i not in self.deleted:
+                self.key_to_rows.setdefault(question_key(q), []).append(i)
 
     def load_and_prepare(self):
-        print(f"Loading JSON data from: {self.data_path}")
-        with open(self.data_path, "r", encoding="utf-8") as f:
-            self.data = json.load(f)
-
-        def build_content(q):
-            parts = []
-            if q.get("group_id"):
-                parts.append(q.get("group_context", ""))
-            parts.append(q["stem"])
-            for k, v in q.get("options", {}).items():
-                parts.append(f"({k}) {v}")
-            return " ".join(parts)
+        print(f"Loading questions from: {self.data_path}")
+        self.data = load_questions(self.data_path)
+        self.deleted = set()
+        self._reindex_keys()
+        self.generation += 1
 
         self.contents = [build_content(q) for q in self.data]
 
@@ -41,50 +69,192 @@ class BM25HNSWRetriever:
         )
 
         print("Building BM25 index...")
-        tokenized_corpus = [text.split(" ") for text in self.contents]
-        self.bm25 = BM25Okapi(tokenized_corpus)
+        self.bm25 = SparseBM25()
+        self.bm25.add_documents(tokenize_many(self.contents, workers=os.cpu_count()))
+
+        print("Building FAISS index (Cosine similarity)...")
+        self.faiss_index = AnnIndex(**self.index_config).build(self.embeddings)
+        print(f"Index: {self.faiss_index.config()}")
+
+    def add_questions(self, questions):
+        if self.faiss_index is None or self.bm25 is None:
+            raise RuntimeError("Please run load_and_prepare() first.")
+        if not questions:
+            return 0
+
+        # 已存在的題目視為更新：同 key 的舊列全部標記刪除，新內容接在最後
+        self.remove_ids([question_key(q) for q in questions if question_key(q) in self.key_to_rows])
+
+        contents = [build_content(q) for q in questions]
+        print(f"Encoding {len(contents)} new questions...")
+        embeddings = self.model.encode(contents, normalize_embeddings=True)
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+
+        start = len(self.data)
+        self.data.extend(questions)
+        self.contents.extend(contents)
+        for i, q in enumerate(questions):
+            self.key_to_rows.setdefault(question_key(q), []).append(start + i)
+        self.embeddings = np.concatenate([np.asarray(self.embeddings), embeddings])
+        self.faiss_index.add(embeddings)
+
+        self.bm25.add_documents(tokenize_many(contents))
+        self.generation += 1
+        return len(questions)
+
+    def remove_ids(self, keys):
+        # HNSW 不支援刪除，只做墓碑標記，搜尋時略過；同一個 key 的每一列都會刪除，回傳刪除的列數
+        removed = 0
+        for key in keys:
+            for row in self.key_to_rows.pop(key, []):
+                if row not in self.deleted:
+                    self.deleted.add(row)
+                    removed += 1
+        if removed:
+            self.generation += 1
+        return removed
+
+    def snapshot_key(self):
+        # 以題庫 JSON 內容 + 模型名稱作為快照的 key，任一改變就會重建
+        h = hashlib.sha256()
+        h.update(f"v{SNAPSHOT_VERSION}:{self.model_name}:".encode("utf-8"))
+        h.update(json.dumps(self.index_config, sort_keys=True).encode("utf-8"))
+        with open(self.data_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+        return h.hexdigest()[:16]
 
-        print("Building FAISS HNSW index (Cosine similarity)...")
-        dim = self.embeddings.shape[1]
-        self.faiss_index = faiss.IndexHNSWFlat(dim, 32, faiss.METRIC_INNER_PRODUCT)
-        self.faiss_index.hnsw.efConstruction = 100
-        self.faiss_index.add(self.embeddings)
+    def save(self, snapshot_dir):
+        if self.faiss_index is None or self.bm25 is None:
+            raise RuntimeError("Please run load_and_prepare() first.")
+
+        path = os.path.join(snapshot_dir, self.snapshot_key())
+        tmp_path = path + ".tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+
+        np.save(os.path.join(tmp_path, "embeddings.npy"), np.ascontiguousarray(self.embeddings, dtype=np.float32))
+        self.faiss_index.save(os.path.join(tmp_path, "ann"))
+        self.bm25.save(os.path.join(tmp_path, "bm25"))
+        with open(os.path.join(tmp_path, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({
+                "version": SNAPSHOT_VERSION,
+                "model_name": self.model_name,
+                "data": self.data,
+                "contents": self.contents,
+                "deleted": sorted(self.deleted),
+            }, f, ensure_ascii=False)
+
+        # 先寫到暫存資料夾再換名，避免中斷時留下不完整的快照
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp_path, path)
+        print(f"Saved index snapshot to: {path}")
+        return path
+
+    def load(self, snapshot_dir):
+        path = os.path.join(snapshot_dir, self.snapshot_key())
+        meta_path = os.path.join(path, "meta.json")
+        if not os.path.exists(meta_path):
+            return False
+
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("version") != SNAPSHOT_VERSION or meta.get("model_name") != self.model_name:
+            return False
 
-    def search(self, query, top_k=5, alpha=0.3):
+        print(f"Loading index snapshot from: {path}")
+        self.data = meta["data"]
+        self.contents = meta["contents"]
+        self.deleted = set(meta.get("deleted", []))
+        self._reindex_keys()
+        self.generation += 1
+        self.embeddings = np.load(os.path.join(path, "embeddings.npy"), mmap_mode="r")
+        self.faiss_index = AnnIndex.load(os.path.join(path, "ann"))
+        self.bm25 = SparseBM25.load(os.path.join(path, "bm25"))
+        return True
+
+    def load_or_build(self, snapshot_dir="index_snapshots"):
+        if self.load(snapshot_dir):
+            return self
+        self.load_and_prepare()
+        self.save(snapshot_dir)
+        return self
+
+    def search(self, query, top_k=5, alpha=0.3, ef_search=None, nprobe=None, fusion="weighted"):
+        return self.search_many([query], top_k=top_k, alpha=alpha, ef_search=ef_search, nprobe=nprobe,
+                                fusion=fusion)[0]
+
+    def search_many(self, queries, top_k=5, alpha=0.3, ef_search=None, nprobe=None, fusion="weighted"):
+        # ef_search / nprobe 只影響這次查詢，可用來在 recall 與延遲之間取捨
+        # fusion 可選 "weighted"（alpha 加權）或 "rrf"（見 core/Fusion.py）
         if self.faiss_index is None or self.bm25 is None:
             raise RuntimeError("Please run load_and_prepare() first.")
+        if not queries:
+            return []
+
+        results = [None] * len(queries)
+        keys = [self._result_key(q, top_k, alpha, ef_search, nprobe, fusion) for q in queries]
+        if self.cache is not None:
+            results = [self.cache.get_results(k) for k in keys]
+        pending = [i for i, r in enumerate(results) if r is None]
+        if not pending:
+            return self._attach_difficulty(results)
+        texts = [queries[i] for i in pending]
 
-        query_embedding = self.model.encode([query], normalize_embeddings=True)
-        faiss_scores, faiss_ids = self.faiss_index.search(query_embedding, top_k * 10)
-        faiss_scores, faiss_ids = faiss_scores[0], faiss_ids[0]
-
-        bm25_scores = np.array(self.bm25.get_scores(query.split(" ")))
-        bm25_scores = (bm25_scores - bm25_scores.min()) / (bm25_scores.max() - bm25_scores.min() + 1e-8)
-
-        hybrid = []
-        for idx, faiss_score in zip(faiss_ids, faiss_scores):
-            bm25_score = bm25_scores[idx]
-            score = alpha * faiss_score + (1 - alpha) * bm25_score
-            hybrid.append((idx, score))
-
-        hybrid = sorted(hybrid, key=lambda x: x[1], reverse=True)[:top_k]
-
-        results = []
-        for idx, score in hybrid:
-            q = self.data[idx]
-            results.append({
-                "id": q["id"],
-                "year": q.get("year", "unknown"),
-                "subject": q.get("subject", "unknown"),
-                "content": self.contents[idx],
-                "score": score
-            })
+        # 所有查詢一次編碼、一次 FAISS 搜尋、一次稀疏矩陣乘法算 BM25
+        if self.cache is not None:
+            query_embeddings = self.cache.encode(self.model, self.model_name, texts, normalize_embeddings=True)
+        else:
+            query_embeddings = self.model.encode(texts, normalize_embeddings=True)
+        query_embeddings = np.asarray(query_embeddings, dtype=np.float32)
+        n_candidates = top_k * 10
+        faiss_scores, faiss_ids = self.faiss_index.search(
+            query_embeddings, n_candidates + len(self.deleted), ef_search=ef_search, nprobe=nprobe)
+        bm25_matrix = self.bm25.score_many([self.tokenize(q) for q in texts])
+        exclude = np.fromiter(self.deleted, dtype=np.int64, count=len(self.deleted))
+
+        for row, i in enumerate(pending):
+            lo, hi = bm25_matrix.indptr[row], bm25_matrix.indptr[row + 1]
+            q_emb = query_embeddings[row]
+            ids, fused, dense, bm25 = fuse(
+                faiss_ids[row], faiss_scores[row], bm25_matrix.indices[lo:hi], bm25_matrix.data[lo:hi],
+                top_k, self.bm25.corpus_size, method=fusion, alpha=alpha, n_candidates=n_candidates,
+                dense_lookup=lambda rows, q=q_emb: np.asarray(self.embeddings[rows], dtype=np.float32) @ q,
+                exclude=exclude)
+            results[i] = [self._format_hit(idx, f, d, b) for idx, f, d, b in zip(ids, fused, dense, bm25)]
+            if self.cache is not None:
+                self.cache.put_results(keys[i], results[i])
+        return self._attach_difficulty(results)
+
+    def _attach_difficulty(self, results):
+        # 難度在快取之外另外查，批次評分跑完後不必清掉查詢結果快取；
+        # 以題目內容的 hash 對應，撞號的題目不會拿到別題的難度，沒評過的為 None（app 會改為即時評分）
+        if self.difficulty_store is None:
+            return results
+        found = self.difficulty_store.get_many([content_hash(hit["content"]) for hits in results for hit in hits])
+        for hits in results:
+            for hit in hits:
+                hit["difficulty"] = found.get(content_hash(hit["content"]))
         return results
 
+    def _result_key(self, query, top_k, alpha, ef_search, nprobe, fusion):
+        return ("bm25_hnsw", self.data_path, self.model_name, json.dumps(self.index_config, sort_keys=True),
+                self.instance_token, self.generation, normalize_query(query), top_k, alpha, ef_search, nprobe, fusion)
+
+    def _format_hit(self, idx, score, dense_score, bm25_score):
+        q = self.data[idx]
+        return {
+            "id": q["id"],
+            "year": q.get("year", "unknown"),
+            "subject": q.get("subject", "unknown"),
+            "content": self.contents[idx],
+            "score": float(score),
+            "scores": {"dense": float(dense_score), "bm25": float(bm25_score), "fused": float(score)}
+        }
 
 if __name__ == "__main__":
     retriever = BM25HNSWRetriever("C:\\Users\\0524e\\OneDrive\\文件\\GitHub\\Quiz_Hunter\\Quiz_json\\all.json")  # ← JSON 題庫
-    retriever.load_and_prepare()
+    retriever.load_or_build()
 
     query = "下列哪一種物質與適當的催化劑共熱，可得到氧氣？"
     results = retriever.search(query, top_k=3, alpha=0.5)
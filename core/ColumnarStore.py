@@ -0,0 +1,172 @@
+import os
+import sys
+import json
+import shutil
+import numpy as np
+
+STORE_VERSION = 1
+TEXT_COLUMNS = ("embed_texts", "stem_texts", "contexts", "options")
+
+# 題庫向量的欄式儲存格式（一個資料夾）：
+#   embs.npy / norms.npy          連續的向量矩陣（可存 float16）與每列的 L2 norm
+#   ids.npy / *_codes.npy         題號與年度、科目的整數編碼，類別表放在 meta.json
+#   <欄位>.bin + <欄位>.off.npy   UTF-8 文字串接成一個 blob，用 offset 取第 i 列
+# 讀取時全部 mmap，只有真的要顯示的列才解碼文字。
+
+
+def _encode_categories(values):
+    categories = sorted({str(v) for v in values})
+    lookup = {v: i for i, v in enumerate(categories)}
+    return categories, np.array([lookup[str(v)] for v in values], dtype=np.int16)
+
+
+def write_store(path, ids, embs, embed_texts, stem_texts, contexts, options, years, subjects, float16=False):
+    embs = np.asarray(embs, dtype=np.float32)
+    tmp_path = path + ".tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    np.save(os.path.join(tmp_path, "embs.npy"), embs.astype(np.float16 if float16 else np.float32))
+    np.save(os.path.join(tmp_path, "norms.npy"), np.linalg.norm(embs, axis=1).astype(np.float32))
+    np.save(os.path.join(tmp_path, "ids.npy"), np.asarray(ids, dtype=np.int32))
+
+    columns = {
+        "embed_texts": embed_texts,
+        "stem_texts": stem_texts,
+        "contexts": contexts,
+        "options": [json.dumps(o, ensure_ascii=False) for o in options],
+    }
+    for name, texts in columns.items():
+        offsets = [0]
+        with open(os.path.join(tmp_path, f"{name}.bin"), "wb") as f:
+            for text in texts:
+                data = str(text).encode("utf-8")
+                f.write(data)
+                offsets.append(offsets[-1] + len(data))
+        np.save(os.path.join(tmp_path, f"{name}.off.npy"), np.asarray(offsets, dtype=np.int64))
+
+    year_categories, year_codes = _encode_categories(years)
+    subject_categories, subject_codes = _encode_categories(subjects)
+    np.save(os.path.join(tmp_path, "year_codes.npy"), year_codes)
+    np.save(os.path.join(tmp_path, "subject_codes.npy"), subject_codes)
+
+    with open(os.path.join(tmp_path, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump({
+            "version": STORE_VERSION,
+            "count": int(embs.shape[0]),
+            "dim": int(embs.shape[1]) if embs.ndim == 2 else 0,
+            "dtype": "float16" if float16 else "float32",
+            "years": year_categories,
+            "subjects": subject_categories,
+        }, f, ensure_ascii=False)
+
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp_path, path)
+
+
+class ColumnarStore:
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        if self.meta.get("version") != STORE_VERSION:
+            raise ValueError(f"不支援的向量檔版本：{path}")
+
+        self.embs = self._load("embs.npy")
+        self.norms = self._load("norms.npy")
+        self.ids = self._load("ids.npy")
+        self.year_codes = self._load("year_codes.npy")
+        self.subject_codes = self._load("subject_codes.npy")
+        self.year_categories = self.meta["years"]
+        self.subject_categories = self.meta["subjects"]
+
+        self._blobs, self._offsets = {}, {}
+        for name in TEXT_COLUMNS:
+            self._offsets[name] = self._load(f"{name}.off.npy")
+            blob_path = os.path.join(path, f"{name}.bin")
+            # 空檔案無法 mmap
+            if os.path.getsize(blob_path):
+                self._blobs[name] = np.memmap(blob_path, dtype=np.uint8, mode="r")
+            else:
+                self._blobs[name] = np.empty(0, dtype=np.uint8)
+
+    def _load(self, name):
+        return np.load(os.path.join(self.path, name), mmap_mode="r")
+
+    def __len__(self):
+        return int(self.meta["count"])
+
+    def text(self, column, i):
+        lo, hi = self._offsets[column][i], self._offsets[column][i + 1]
+        return self._blobs[column][lo:hi].tobytes().decode("utf-8")
+
+    def year(self, i):
+        return self.year_categories[self.year_codes[i]]
+
+    def subject(self, i):
+        return self.subject_categories[self.subject_codes[i]]
+
+    def row(self, i):
+        return {
+            "id": int(self.ids[i]),
+            "year": self.year(i),
+            "subject": self.subject(i),
+            "embed_text": self.text("embed_texts", i),
+            "context": self.text("contexts", i),
+            "stem": self.text("stem_texts", i),
+            "options": json.loads(self.text("options", i)),
+        }
+
+
+class NpzStore:
+    # 舊版 .npz 向量檔，提供與 ColumnarStore 相同的介面
+    def __init__(self, path):
+        self.path = path
+        arr = np.load(path, allow_pickle=True)
+        self.embs = arr["embs"]
+        self.norms = np.linalg.norm(self.embs, axis=1).astype(np.float32)
+        self.ids = arr["ids"]
+        self._columns = {k: arr[k] for k in ("embed_texts", "stem_texts", "contexts", "options", "years", "subjects")}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def text(self, column, i):
+        if column == "options":
+            return json.dumps(self._columns["options"][i], ensure_ascii=False)
+        return str(self._columns[column][i])
+
+    def year(self, i):
+        return str(self._columns["years"][i])
+
+    def subject(self, i):
+        return str(self._columns["subjects"][i])
+
+    def row(self, i):
+        return {
+            "id": int(self.ids[i]),
+            "year": self.year(i),
+            "subject": self.subject(i),
+            "embed_text": self.text("embed_texts", i),
+            "context": self.text("contexts", i),
+            "stem": self.text("stem_texts", i),
+            "options": dict(self._columns["options"][i]),
+        }
+
+
+def open_store(path):
+    if os.path.isdir(path):
+        return ColumnarStore(path)
+    return NpzStore(path)
+
+
+def convert_npz(npz_path, store_path, float16=False):
+    arr = np.load(npz_path, allow_pickle=True)
+    write_store(store_path, arr["ids"], arr["embs"], arr["embed_texts"], arr["stem_texts"],
+                arr["contexts"], arr["options"], arr["years"], arr["subjects"], float16=float16)
+
+
+if __name__ == "__main__":
+    # 用法：python -m core.ColumnarStore 輸入.npz 輸出資料夾 [--float16]
+    convert_npz(sys.argv[1], sys.argv[2], float16="--float16" in sys.argv[3:])
+    print(f"已轉換 {sys.argv[1]} → {sys.argv[2]}")
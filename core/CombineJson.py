@@ -1,25 +1,41 @@
 import json
 import os
+import argparse
 from glob import glob
+from core.QuestionStore import concat, count_questions, is_jsonl, iter_questions
 
-# 設定資料夾路徑，請改成你放 JSON 檔案的資料夾
-json_folder = "C:\\Users\\0524e\\OneDrive\\文件\\GitHub\\Quiz_Hunter\\Quiz_json"  # 替換成實際路徑，例如 "./year_jsons"
 
-# 搜尋資料夾中所有 .json 檔案
-json_files = sorted(glob(os.path.join(json_folder, "*.json")))
+def combine_json(json_paths, output_path):
+    # 回傳輸出檔路徑（.json 與 .jsonl 相同）；題目請用 core.QuestionStore.iter_questions 讀
+    # 輸出為 .jsonl 時直接把各年度檔案接在一起（見 core/QuestionStore.py），不必整份解析
+    if is_jsonl(output_path):
+        concat(json_paths, output_path)
+        print(f"✅ 合併完成，共 {count_questions(output_path)} 題，輸出檔案路徑為：{output_path}")
+        return output_path
 
-# 儲存所有題目的列表
-all_questions = []
+    # 依序讀取每個年度的 json 並合併成一份題庫
+    all_questions = []
+    for file_path in json_paths:
+        all_questions.extend(iter_questions(file_path))
 
-# 依序讀取每個 json 檔案並合併資料
-for file_path in json_files:
-    with open(file_path, encoding='utf-8') as f:
-        year_data = json.load(f)
-        all_questions.extend(year_data)
+    with open(output_path, "w", encoding='utf-8') as f:
+        json.dump(all_questions, f, ensure_ascii=False, indent=2)
 
-# 輸出合併後的 JSON 檔案
-output_path = os.path.join(json_folder, "combined_106_to_113.json")
-with open(output_path, "w", encoding='utf-8') as f:
-    json.dump(all_questions, f, ensure_ascii=False, indent=2)
+    print(f"✅ 合併完成，共 {len(all_questions)} 題，輸出檔案路徑為：{output_path}")
+    return output_path
 
-print(f"✅ 合併完成，輸出檔案路徑為：{output_path}")
+
+if __name__ == "__main__":
+    # 用法：python -m core.CombineJson --folder Quiz_json
+    parser = argparse.ArgumentParser(description="合併各年度題目 JSON")
+    parser.add_argument("--folder", default="Quiz_json", help="放各年度 JSON 檔案的資料夾")
+    parser.add_argument("--output", help="預設為 <folder>/combined_106_to_113.json；以 .jsonl 結尾時輸出 JSONL")
+    args = parser.parse_args()
+
+    output_path = args.output or os.path.join(args.folder, "combined_106_to_113.json")
+    # 重跑時不要把上次的輸出（以及 all.json 這類合併檔）再合併進去
+    candidates = glob(os.path.join(args.folder, "*.json")) + glob(os.path.join(args.folder, "*.jsonl"))
+    json_files = [p for p in sorted(candidates)
+                  if os.path.abspath(p) != os.path.abspath(output_path)
+                  and os.path.splitext(os.path.basename(p))[0].isdigit()]
+    combine_json(json_files, output_path)
@@ -0,0 +1,83 @@
+import json
+import time
+import hashlib
+import sqlite3
+from contextlib import closing, contextmanager
+
+# 題目難度的 sidecar 檔：存批次評分（core/BatchScorer.py）的結果，讓檢索結果直接帶出難度，線上查詢不必再呼叫 LLM。
+# 以題目內容（build_content）的 hash 為主鍵：題庫裡 年度-題號 會撞號（例如年度為 unknown），
+# 用題號當 key 會讓不同題目互相覆蓋、也會把別題的難度與正解帶給檢索結果。
+# 舊版以 年度-題號 為 key 的 difficulty 表不再讀取，重跑批次評分即可。
+
+
+def content_hash(content):
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()[:16]
+
+
+class DifficultyStore:
+    def __init__(self, path="difficulty.sqlite"):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS scores ("
+                "content_hash TEXT PRIMARY KEY, key TEXT, stars INTEGER, star_auto INTEGER, star_gemini INTEGER, "
+                "gold TEXT, answers TEXT, correctness TEXT, scored_at REAL)")
+
+    @contextmanager
+    def _connect(self):
+        # sqlite3 的 with 只負責 commit / rollback，不會關閉連線，要另外 closing
+        with closing(sqlite3.connect(self.path, timeout=30)) as conn, conn:
+            yield conn
+
+    @staticmethod
+    def _row_to_dict(row):
+        content_hash, key, stars, star_auto, star_gemini, gold, answers, correctness, scored_at = row
+        return {
+            "key": key,
+            "stars": stars,
+            "star_auto": star_auto,
+            "star_gemini": star_gemini,
+            "gold": gold,
+            "answers": json.loads(answers),
+            "correctness": json.loads(correctness),
+            "content_hash": content_hash,
+            "scored_at": scored_at,
+        }
+
+    def put(self, content_hash, result, key=None):
+        # result 為 DifficultyScorer.score() 的回傳值；key（年度-題號）只是方便人看，不參與查詢
+        stars, gold, answers, correctness, star_auto, star_gemini = result
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO scores VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (content_hash, key, int(stars), int(star_auto), int(star_gemini), gold,
+                 json.dumps(answers, ensure_ascii=False), json.dumps(correctness), time.time()))
+
+    def get(self, content_hash):
+        return self.get_many([content_hash]).get(content_hash)
+
+    def get_many(self, hashes):
+        found = {}
+        hashes = list(dict.fromkeys(hashes))
+        with self._connect() as conn:
+            for i in range(0, len(hashes), 500):
+                chunk = hashes[i:i + 500]
+                rows = conn.execute(
+                    f"SELECT * FROM scores WHERE content_hash IN ({','.join('?' * len(chunk))})", chunk)
+                for row in rows:
+                    found[row[0]] = self._row_to_dict(row)
+        return found
+
+    def hashes(self):
+        # 已評分的內容 hash，批次續跑時用來判斷要不要重評
+        with self._connect() as conn:
+            return {row[0] for row in conn.execute("SELECT content_hash FROM scores")}
+
+    def __contains__(self, content_hash):
+        with self._connect() as conn:
+            return conn.execute("SELECT 1 FROM scores WHERE content_hash = ?", (content_hash,)).fetchone() is not None
+
+    def __len__(self):
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM scores").fetchone()[0]
@@ -0,0 +1,50 @@
+import hashlib
+import sqlite3
+from contextlib import closing, contextmanager
+import numpy as np
+
+
+class EmbeddingCache:
+    # 以 hash(模型名稱 + 向量化文字) 為 key 的 SQLite 向量快取
+    def __init__(self, path="embedding_cache.sqlite"):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, dim INTEGER, vec BLOB)")
+
+    @contextmanager
+    def _connect(self):
+        # sqlite3 的 with 只負責 commit / rollback，不會關閉連線，要另外 closing
+        with closing(sqlite3.connect(self.path, timeout=30)) as conn, conn:
+            yield conn
+
+    @staticmethod
+    def make_key(model_name, text):
+        return hashlib.sha256(f"{model_name}\0{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, keys):
+        found = {}
+        keys = list(dict.fromkeys(keys))
+        with self._connect() as conn:
+            # SQLite 單一查詢的參數數量有限制，分批查
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                rows = conn.execute(
+                    f"SELECT key, vec FROM embeddings WHERE key IN ({','.join('?' * len(chunk))})", chunk)
+                for key, vec in rows:
+                    found[key] = np.frombuffer(vec, dtype=np.float32)
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, items):
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, dim, vec) VALUES (?, ?, ?)",
+                [(key, len(vec), np.asarray(vec, dtype=np.float32).tobytes()) for key, vec in items])
+
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
@@ -1,13 +1,21 @@
-import json, numpy as np
-from sentence_transformers import SentenceTransformer
+import numpy as np
+from core.ModelRegistry import get_model
+from core.ColumnarStore import write_store
+from core.EmbeddingCache import EmbeddingCache
+from core.QuestionStore import iter_questions
 
 class EmbeddingGenerator:
-    def __init__(self, json_path, model_name='sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2'):
+    def __init__(self, json_path=None, model_name='sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2',
+                 cache_path="embedding_cache.sqlite", model=None):
         self.json_path = json_path
-        self.model = SentenceTransformer(model_name)
+        self.model_name = model_name
+        # 預設從共用的模型登錄表取得，同一行程內只載入一次
+        self.model = model if model is not None else get_model(model_name)
+        self.cache = EmbeddingCache(cache_path) if cache_path else None
 
 
-    def make_embedding_text(self, q):
+    @staticmethod
+    def make_embedding_text(q):
         # 僅用題組上下文 + 題幹 + 選項
         parts = []
         if q.get("group_id"):
@@ -19,10 +27,44 @@ class EmbeddingGenerator:
         return " ".join(parts).strip()
     
     
-    def generate_embeddings(self, output_npz_path):
-        with open(self.json_path, encoding="utf-8") as f:
-            questions = json.load(f)
+    def encode(self, texts):
+        if self.cache is None:
+            return self.model.encode(texts, convert_to_numpy=True, batch_size=32)
 
+        # 只編碼快取裡沒有的文字，其餘直接從快取組回來
+        keys = [EmbeddingCache.make_key(self.model_name, t) for t in texts]
+        cached = self.cache.get_many(keys)
+        missing = list(dict.fromkeys(k for k in keys if k not in cached))
+        if missing:
+            text_of = dict(zip(keys, texts))
+            vecs = self.model.encode([text_of[k] for k in missing], convert_to_numpy=True, batch_size=32)
+            self.cache.put_many(zip(missing, vecs))
+            cached.update(zip(missing, np.asarray(vecs, dtype=np.float32)))
+
+        # 以不重複的文字計算：重複出現又沒命中的文字只編碼一次，不能算成命中
+        unique = len(set(keys))
+        hits = unique - len(missing)
+        print(f"Embedding 快取命中 {hits}/{unique}（{hits / max(unique, 1):.1%}），實際編碼 {len(missing)} 題")
+        return np.vstack([cached[k] for k in keys]) if keys else np.empty((0, 0), dtype=np.float32)
+
+    def generate_embeddings(self, output_npz_path, float16=False, json_path=None, years=None, subjects=None,
+                            batch_size=256):
+        # 逐題讀取（.jsonl 可串流，見 core/QuestionStore.py），每 batch_size 題編碼一次
+        questions, embs, batch = [], [], []
+        for q in iter_questions(json_path or self.json_path, years=years, subjects=subjects):
+            batch.append(q)
+            if len(batch) >= batch_size:
+                embs.append(self.encode([self.make_embedding_text(x) for x in batch]))
+                questions.extend(batch)
+                batch = []
+        if batch:
+            embs.append(self.encode([self.make_embedding_text(x) for x in batch]))
+            questions.extend(batch)
+        self.write_embeddings(questions, np.vstack(embs) if embs else np.empty((0, 0), dtype=np.float32),
+                              output_npz_path, float16=float16)
+
+    def write_embeddings(self, questions, embs, output_npz_path, float16=False):
+        # 輸出路徑以 .npz 結尾時寫舊格式，否則寫成可 mmap 的欄式資料夾（見 core/ColumnarStore.py）
         ids         = [q["id"]                for q in questions]
         embed_texts = [self.make_embedding_text(q) for q in questions]
         stem_texts  = [q["stem"]              for q in questions]
@@ -31,7 +73,11 @@ class EmbeddingGenerator:
         years       = [q.get("year","")        for q in questions]
         subjects    = [q.get("subject","")     for q in questions]
 
-        embs = self.model.encode(embed_texts, convert_to_numpy=True, batch_size=32)
+        if not str(output_npz_path).endswith(".npz"):
+            write_store(output_npz_path, ids, embs, embed_texts, stem_texts, contexts, options,
+                        years, subjects, float16=float16)
+            print(f"已存 embeddings（欄式格式，含年度、科目）至 {output_npz_path}")
+            return
 
         np.savez(
             output_npz_path,
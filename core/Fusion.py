@@ -0,0 +1,76 @@
+import numpy as np
+
+# 混合檢索的分數融合：先取向量與 BM25 各自前 N 名的聯集，再用 NumPy 一次算完
+#   weighted  alpha * 向量分數 + (1 - alpha) * 正規化後的 BM25 分數
+#   rrf       Reciprocal Rank Fusion：Σ 1 / (rrf_k + 名次)，不受兩邊分數尺度影響
+FUSION_METHODS = ("weighted", "rrf")
+
+
+def top_n(ids, scores, n):
+    # argpartition 取前 n 名再只排序這 n 個，不對整個陣列排序
+    if len(scores) > n:
+        part = np.argpartition(-scores, n - 1)[:n]
+        ids, scores = ids[part], scores[part]
+    order = np.argsort(-scores, kind="stable")
+    return ids[order], scores[order]
+
+
+def _lookup(sorted_ids, values, query_ids):
+    # 在已排序的稀疏列中查分數，找不到的為 0
+    out = np.zeros(len(query_ids), dtype=np.float32)
+    if len(sorted_ids):
+        pos = np.searchsorted(sorted_ids, query_ids).clip(max=len(sorted_ids) - 1)
+        hit = sorted_ids[pos] == query_ids
+        out[hit] = values[pos[hit]]
+    return out
+
+
+def _ranks(scores, present):
+    # 依分數由高到低給名次（從 1 開始），不在該來源候選名單中的為 0
+    ranks = np.zeros(len(scores), dtype=np.int64)
+    idx = np.flatnonzero(present)
+    ranks[idx[np.argsort(-scores[idx], kind="stable")]] = np.arange(1, len(idx) + 1)
+    return ranks
+
+
+def fuse(dense_ids, dense_scores, bm25_ids, bm25_scores, top_k, corpus_size,
+         method="weighted", alpha=0.3, n_candidates=None, rrf_k=60, dense_lookup=None, exclude=None):
+    if method not in FUSION_METHODS:
+        raise ValueError(f"Unknown fusion method: {method}")
+    n_candidates = n_candidates or top_k * 10
+
+    valid = dense_ids >= 0
+    dense_ids, dense_scores = dense_ids[valid].astype(np.int64), dense_scores[valid]
+    lex_ids, _ = top_n(np.asarray(bm25_ids, dtype=np.int64), bm25_scores, n_candidates)
+
+    candidates = np.union1d(dense_ids, lex_ids)
+    if exclude is not None and len(exclude):
+        candidates = candidates[~np.isin(candidates, exclude)]
+    if not len(candidates):
+        empty = np.empty(0, dtype=np.float32)
+        return candidates, empty, empty, empty
+
+    # 向量分數：ANN 已給的直接用，只出現在 BM25 名單的再補算精確內積
+    order = np.argsort(dense_ids)
+    dense = _lookup(dense_ids[order], dense_scores[order], candidates)
+    in_dense = np.isin(candidates, dense_ids)
+    if dense_lookup is not None and not in_dense.all():
+        dense[~in_dense] = dense_lookup(candidates[~in_dense])
+        in_dense[:] = True
+
+    # BM25 分數直接從完整的稀疏列查，沒命中的文件分數為 0
+    bm25 = _lookup(np.asarray(bm25_ids), np.asarray(bm25_scores, dtype=np.float32), candidates)
+
+    if method == "weighted":
+        bm25_min = bm25_scores.min() if len(bm25_ids) == corpus_size and len(bm25_ids) else 0.0
+        bm25_max = bm25_scores.max() if len(bm25_ids) else 0.0
+        bm25_norm = (bm25 - bm25_min) / (bm25_max - bm25_min + 1e-8)
+        fused = alpha * dense + (1 - alpha) * bm25_norm
+    else:
+        dense_rank = _ranks(dense, in_dense)
+        bm25_rank = _ranks(bm25, np.isin(candidates, lex_ids))
+        fused = (np.where(dense_rank > 0, 1.0 / (rrf_k + dense_rank), 0.0)
+                 + np.where(bm25_rank > 0, 1.0 / (rrf_k + bm25_rank), 0.0))
+
+    keep, _ = top_n(np.arange(len(candidates)), fused, top_k)
+    return candidates[keep], fused[keep].astype(np.float32), dense[keep], bm25[keep]
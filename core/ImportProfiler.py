@@ -0,0 +1,53 @@
+import sys
+import time
+import builtins
+import importlib
+
+
+class ImportProfiler:
+    # 類似 python -X importtime：記錄每個首次載入模組的累計時間與自身時間
+    def __init__(self):
+        self.records = []
+        self._stack = []
+        self._original_import = None
+
+    def __enter__(self):
+        self._original_import = builtins.__import__
+        builtins.__import__ = self._import
+        return self
+
+    def __exit__(self, *exc):
+        builtins.__import__ = self._original_import
+        return False
+
+    def _import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        if level or name in sys.modules:
+            return self._original_import(name, globals, locals, fromlist, level)
+
+        self._stack.append(0.0)
+        start = time.perf_counter()
+        try:
+            return self._original_import(name, globals, locals, fromlist, level)
+        finally:
+            elapsed = time.perf_counter() - start
+            children = self._stack.pop()
+            if self._stack:
+                self._stack[-1] += elapsed
+            self.records.append((name, elapsed, elapsed - children, len(self._stack)))
+
+    def total_seconds(self):
+        return sum(cumulative for _, cumulative, _, depth in self.records if depth == 0)
+
+    def report(self, top=20):
+        lines = [f"{'cumulative':>11} {'self':>9}  module"]
+        for name, cumulative, self_time, depth in sorted(self.records, key=lambda r: r[1], reverse=True)[:top]:
+            lines.append(f"{cumulative * 1000:9.1f}ms {self_time * 1000:7.1f}ms  {'  ' * depth}{name}")
+        lines.append(f"total import time: {self.total_seconds() * 1000:.1f}ms")
+        return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    # 用法：python -m core.ImportProfiler app
+    with ImportProfiler() as profiler:
+        importlib.import_module(sys.argv[1] if len(sys.argv) > 1 else "app")
+    print(profiler.report())
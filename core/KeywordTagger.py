@@ -0,0 +1,111 @@
+import re
+import numpy as np
+from core.ModelRegistry import get_model, canonical_name
+from core.EmbeddingCache import EmbeddingCache
+from core.ColumnarStore import open_store
+from core.EmbeddingGenerator import EmbeddingGenerator
+
+# 批次版的 KeyBERT 標籤抽取（預設模式：不用 MMR / Max Sum）：
+#   - 整年的文件一次處理：候選詞先全部收集、去重，只編碼一次
+#   - 文件向量可直接用 Quiz_clean_Embedding_npz 裡算好的（同一個 MiniLM），只有缺的才編碼
+#   - 候選詞向量存在記憶體與 EmbeddingCache，跨題目、跨年度重複出現的詞不再編碼
+# 分數與 KeyBERT 相同：文件向量與候選詞向量的 cosine，取前 top_n。
+
+# 與 KeyBERT 預設的 CountVectorizer 相同的斷詞規則（文件已先用 jieba 斷好並以空白連接）
+TOKEN_PATTERN = re.compile(r"(?u)\b\w\w+\b")
+
+
+def candidate_phrases(doc, ngram_range=(1, 1)):
+    tokens = TOKEN_PATTERN.findall(doc.lower())
+    lo, hi = ngram_range
+    phrases = {}
+    for n in range(lo, hi + 1):
+        for i in range(len(tokens) - n + 1):
+            phrases[" ".join(tokens[i:i + n])] = None
+    return list(phrases)
+
+
+def _normalize(vecs):
+    vecs = np.asarray(vecs, dtype=np.float32)
+    norms = np.linalg.norm(vecs, axis=1, keepdims=True)
+    return vecs / np.maximum(norms, 1e-12)
+
+
+def store_doc_embeddings(questions, store_paths):
+    # 依向量化文字從向量檔取出文件向量：只有題目的向量化文字與向量檔裡的 embed_texts 完全相同時才沿用，
+    # 題號撞號、年度為 unknown 或題目文字被修改過都不會拿到別題的向量；找不到的題目為 None，之後再補編碼
+    if isinstance(store_paths, str):
+        store_paths = [store_paths]
+    rows = {}
+    for path in store_paths:
+        store = open_store(path)
+        for i in range(len(store)):
+            rows.setdefault(store.text("embed_texts", i), (store, i))
+    found = []
+    for q in questions:
+        hit = rows.get(EmbeddingGenerator.make_embedding_text(q))
+        found.append(None if hit is None else np.asarray(hit[0].embs[hit[1]], dtype=np.float32))
+    return found
+
+
+class KeywordTagger:
+    def __init__(self, model_name='paraphrase-multilingual-MiniLM-L12-v2', cache_path="embedding_cache.sqlite",
+                 batch_size=256):
+        self.model_name = canonical_name(model_name)
+        self.model = get_model(model_name)
+        self.cache = EmbeddingCache(cache_path) if cache_path else None
+        self.batch_size = batch_size
+        self.phrase_vectors = {}
+        self.encoded_phrases = 0
+        self.encoded_docs = 0
+
+    def _encode(self, texts):
+        return _normalize(self.model.encode(texts, convert_to_numpy=True, batch_size=self.batch_size))
+
+    def phrase_embeddings(self, phrases):
+        # 記憶體 → SQLite 快取 → 模型，缺的候選詞合成一批編碼
+        missing = [p for p in phrases if p not in self.phrase_vectors]
+        if missing and self.cache is not None:
+            keys = {p: EmbeddingCache.make_key(self.model_name, p) for p in missing}
+            cached = self.cache.get_many(keys.values())
+            for p in missing:
+                if keys[p] in cached:
+                    self.phrase_vectors[p] = _normalize(cached[keys[p]][None, :])[0]
+            missing = [p for p in missing if p not in self.phrase_vectors]
+        if missing:
+            vecs = self._encode(missing)
+            self.encoded_phrases += len(missing)
+            self.phrase_vectors.update(zip(missing, vecs))
+            if self.cache is not None:
+                self.cache.put_many((EmbeddingCache.make_key(self.model_name, p), v) for p, v in zip(missing, vecs))
+        return np.vstack([self.phrase_vectors[p] for p in phrases]) if phrases else None
+
+    def extract(self, docs, top_n=5, ngram_range=(1, 1), doc_embeddings=None):
+        # 回傳每份文件的 [(候選詞, 分數), ...]，與 KeyBERT.extract_keywords 的格式相同
+        candidates = [candidate_phrases(doc, ngram_range) for doc in docs]
+        vocab = list(dict.fromkeys(p for cands in candidates for p in cands))
+        if not vocab:
+            return [[] for _ in docs]
+        index = {p: i for i, p in enumerate(vocab)}
+        phrase_matrix = self.phrase_embeddings(vocab)
+
+        # 預先算好的文件向量維度不對（例如來自別的模型）時不用，全部重新編碼
+        doc_vecs = list(doc_embeddings) if doc_embeddings is not None else [None] * len(docs)
+        if any(v is not None and len(v) != phrase_matrix.shape[1] for v in doc_vecs):
+            print(f"[WARN] 預先算好的文件向量維度與 {self.model_name} 不符，改為重新編碼")
+            doc_vecs = [None] * len(docs)
+        todo = [i for i, v in enumerate(doc_vecs) if v is None and candidates[i]]
+        if todo:
+            for i, v in zip(todo, self._encode([docs[i] for i in todo])):
+                doc_vecs[i] = v
+            self.encoded_docs += len(todo)
+
+        results = []
+        for cands, vec in zip(candidates, doc_vecs):
+            if not cands:
+                results.append([])
+                continue
+            sims = phrase_matrix[[index[p] for p in cands]] @ _normalize(vec[None, :])[0]
+            top = np.argsort(-sims, kind="stable")[:top_n]
+            results.append([(cands[i], round(float(sims[i]), 4)) for i in top])
+        return results
@@ -0,0 +1,122 @@
+import os
+import time
+import hashlib
+import sqlite3
+import threading
+from contextlib import closing, contextmanager
+
+DEFAULT_TTL = 7 * 24 * 3600
+DEFAULT_MAX_ENTRIES = 20000
+
+
+def normalize_prompt(prompt):
+    # prompt 多半是縮排過的三引號字串：去掉每行前後空白與空行，縮排不同也算同一個 prompt
+    return "\n".join(line.strip() for line in prompt.strip().splitlines() if line.strip())
+
+
+class PromptCache:
+    # 以 hash(模型名稱 + 正規化後的 prompt) 為 key 的 SQLite 回應快取
+    # WAL 模式讓多個行程（例如多個 Streamlit worker）可以同時讀寫同一個檔案
+    def __init__(self, path="llm_cache.sqlite", ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.hit_seconds = 0.0
+        self.miss_seconds = 0.0
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses "
+                "(key TEXT PRIMARY KEY, model TEXT, response TEXT, created REAL, accessed REAL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+
+    @contextmanager
+    def _connect(self):
+        # sqlite3 的 with 只負責 commit / rollback，不會關閉連線，要另外 closing
+        with closing(sqlite3.connect(self.path, timeout=30)) as conn, conn:
+            yield conn
+
+    @staticmethod
+    def make_key(model, prompt):
+        return hashlib.sha256(f"{model}\0{normalize_prompt(prompt)}".encode("utf-8")).hexdigest()
+
+    def _lookup(self, key, touch):
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute("SELECT response, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if self.ttl is not None and now - row[1] > self.ttl:
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                return None
+            if touch:
+                conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            return row[0]
+
+    def contains(self, model, prompt):
+        # 只查不計入統計，也不更新存取時間
+        return self._lookup(self.make_key(model, prompt), touch=False) is not None
+
+    def get(self, model, prompt):
+        response = self._lookup(self.make_key(model, prompt), touch=True)
+        with self._lock:
+            if response is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return response
+
+    def put(self, model, prompt, response):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, response, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (self.make_key(model, prompt), model, response, now, now))
+            if self.max_entries is not None:
+                # 超過上限時淘汰最久沒被讀取的
+                conn.execute(
+                    "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY accessed "
+                    "LIMIT max(0, (SELECT COUNT(*) FROM responses) - ?))", (self.max_entries,))
+
+    def cached_call(self, model, prompt, fn):
+        # 命中就直接回傳，沒命中才呼叫 fn() 並寫回；同時累計兩種情況的耗時
+        start = time.perf_counter()
+        response = self.get(model, prompt)
+        if response is not None:
+            with self._lock:
+                self.hit_seconds += time.perf_counter() - start
+            return response
+        response = fn()
+        self.put(model, prompt, response)
+        with self._lock:
+            self.miss_seconds += time.perf_counter() - start
+        return response
+
+    def purge_expired(self):
+        if self.ttl is None:
+            return 0
+        with self._connect() as conn:
+            return conn.execute("DELETE FROM responses WHERE created < ?", (time.time() - self.ttl,)).rowcount
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM responses")
+
+    def __len__(self):
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "avg_hit_ms": self.hit_seconds / self.hits * 1000 if self.hits else None,
+            "avg_miss_ms": self.miss_seconds / self.misses * 1000 if self.misses else None,
+            "entries": len(self),
+            "path": os.path.abspath(self.path),
+        }
@@ -0,0 +1,124 @@
+import os
+import time
+import threading
+
+# 同一個行程內共用的 SentenceTransformer 模型，第一次 encode 時才載入
+
+_registry_lock = threading.Lock()
+_handles = {}
+_num_threads = None
+
+
+def canonical_name(model_name):
+    # KeyBERT 用短名稱，其他模組用完整名稱，兩者其實是同一份權重
+    if "/" not in model_name and not os.path.exists(model_name):
+        return f"sentence-transformers/{model_name}"
+    return model_name
+
+
+def set_num_threads(n):
+    # 也可用環境變數 QUIZHUNTER_NUM_THREADS 在第一次載入模型時設定
+    global _num_threads
+    import torch
+    torch.set_num_threads(n)
+    _num_threads = n
+
+
+def _rss_bytes():
+    # 目前的 RSS；沒有 psutil 時回傳 None（ru_maxrss 是峰值，拿來相減會誤導）
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return psutil.Process().memory_info().rss
+
+
+class SharedModel:
+    def __init__(self, model_name, device="cpu"):
+        self.model_name = model_name
+        self.device = device
+        self._model = None
+        self._load_lock = threading.Lock()
+        self._encode_lock = threading.Lock()
+        self.load_seconds = None
+        self.param_bytes = None
+        self.rss_delta_bytes = None
+        self.encode_calls = 0
+
+    @property
+    def loaded(self):
+        return self._model is not None
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._load_lock:
+                if self._model is None:
+                    from sentence_transformers import SentenceTransformer
+                    if _num_threads is None and os.getenv("QUIZHUNTER_NUM_THREADS"):
+                        set_num_threads(int(os.getenv("QUIZHUNTER_NUM_THREADS")))
+                    rss_before = _rss_bytes()
+                    start = time.perf_counter()
+                    model = SentenceTransformer(self.model_name, device=self.device)
+                    self.load_seconds = time.perf_counter() - start
+                    rss_after = _rss_bytes()
+                    if rss_before is not None and rss_after is not None:
+                        self.rss_delta_bytes = rss_after - rss_before
+                    self.param_bytes = sum(p.numel() * p.element_size() for p in model.parameters())
+                    print(f"[INFO] 已載入模型 {self.model_name}（{self.load_seconds:.1f} 秒）")
+                    self._model = model
+        return self._model
+
+    def encode(self, *args, **kwargs):
+        # 多個執行緒（例如多個 Streamlit session）共用時一次只跑一個 encode
+        model = self.model
+        with self._encode_lock:
+            self.encode_calls += 1
+            return model.encode(*args, **kwargs)
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.model, name)
+
+    def stats(self):
+        return {
+            "loaded": self.loaded,
+            "device": self.device,
+            "load_seconds": self.load_seconds,
+            "param_bytes": self.param_bytes,
+            "rss_delta_bytes": self.rss_delta_bytes,
+            "encode_calls": self.encode_calls,
+        }
+
+
+def get_model(model_name, device="cpu"):
+    key = (canonical_name(model_name), device)
+    with _registry_lock:
+        if key not in _handles:
+            _handles[key] = SharedModel(key[0], device)
+        return _handles[key]
+
+
+def keybert_backend(model_name, device="cpu"):
+    # 給 KeyBERT 用的 backend：encode 一律經過 SharedModel.encode 的鎖，不直接碰底下的 SentenceTransformer
+    from keybert.backend import BaseEmbedder
+
+    class SharedModelBackend(BaseEmbedder):
+        def __init__(self, handle):
+            super().__init__()
+            self.embedding_model = handle
+
+        def embed(self, documents, verbose=False):
+            return self.embedding_model.encode(documents, show_progress_bar=verbose)
+
+    return SharedModelBackend(get_model(model_name, device))
+
+
+def stats():
+    with _registry_lock:
+        handles = dict(_handles)
+    return {
+        "num_threads": _num_threads,
+        "models": {f"{name}@{device}": h.stats() for (name, device), h in handles.items()},
+    }
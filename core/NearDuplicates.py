@@ -0,0 +1,192 @@
+import os
+import sys
+import glob
+import json
+import argparse
+import numpy as np
+from core.ColumnarStore import open_store
+from core.QuestionKey import question_key
+
+BLOCK_ROWS = 4096
+
+# 離線找出整個題庫中「幾乎重複」的題目：
+#   1. 把所有向量檔視為一個大矩陣，切成 BLOCK_ROWS 列的區塊
+#   2. 只算上三角的區塊對 (i <= j) 的 cosine，記憶體只需 BLOCK_ROWS × BLOCK_ROWS
+#   3. 相似度 >= threshold 的題目對當作邊，存成鄰接圖（CSR）
+#   4. 用 union-find 把連通的題目併成重複群組
+# 用法：python -m core.NearDuplicates --stores "Quiz_clean_Embedding_npz/*.npz" --threshold 0.9
+
+
+class UnionFind:
+    def __init__(self, n):
+        self.parent = np.arange(n)
+        self.size = np.ones(n, dtype=np.int64)
+
+    def find(self, x):
+        root = x
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[x] != root:
+            self.parent[x], x = root, self.parent[x]
+        return root
+
+    def union(self, a, b):
+        a, b = self.find(a), self.find(b)
+        if a == b:
+            return
+        if self.size[a] < self.size[b]:
+            a, b = b, a
+        self.parent[b] = a
+        self.size[a] += self.size[b]
+
+    def groups(self):
+        roots = np.array([self.find(x) for x in range(len(self.parent))])
+        order = np.argsort(roots, kind="stable")
+        bounds = np.flatnonzero(np.diff(roots[order])) + 1
+        return [g for g in np.split(order, bounds) if len(g) > 1]
+
+
+def iter_blocks(stores, block_rows=BLOCK_ROWS):
+    # 依序讀出 (全域起始列, 正規化後的 float32 區塊)，跨檔案的列號連續編排
+    offset = 0
+    for store in stores:
+        for lo in range(0, len(store), block_rows):
+            block = np.asarray(store.embs[lo:lo + block_rows], dtype=np.float32)
+            norms = np.asarray(store.norms[lo:lo + block_rows]).reshape(-1, 1) + 1e-12
+            yield offset + lo, block / norms
+        offset += len(store)
+
+
+def find_pairs(stores, threshold=0.9, block_rows=BLOCK_ROWS):
+    # 回傳 (src, dst, score)，src < dst；每次只有兩個區塊與一塊分數矩陣在記憶體中
+    if not 0 < threshold <= 1:
+        raise ValueError(f"threshold must be in (0, 1], got {threshold}")
+    src, dst, sims = [], [], []
+    for lo_i, block_i in iter_blocks(stores, block_rows):
+        for lo_j, block_j in iter_blocks(stores, block_rows):
+            if lo_j < lo_i:
+                continue
+            scores = block_i @ block_j.T
+            hit = scores >= threshold
+            if lo_j == lo_i:
+                # 同一個區塊只取上三角（不含對角線），先遮掉再比門檻，遮掉的格子不會被當成配對
+                hit &= np.triu(np.ones(hit.shape, dtype=bool), k=1)
+            rows, cols = np.nonzero(hit)
+            src.append(rows + lo_i)
+            dst.append(cols + lo_j)
+            sims.append(scores[rows, cols])
+    if not src:
+        return np.empty(0, np.int64), np.empty(0, np.int64), np.empty(0, np.float32)
+    return (np.concatenate(src).astype(np.int64), np.concatenate(dst).astype(np.int64),
+            np.concatenate(sims).astype(np.float32))
+
+
+def to_csr(n, src, dst, scores):
+    # 對稱化後依來源列排序，每列的鄰居再依相似度由高到低
+    rows = np.concatenate([src, dst])
+    cols = np.concatenate([dst, src])
+    vals = np.concatenate([scores, scores])
+    order = np.lexsort((-vals, rows))
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=n), out=indptr[1:])
+    return indptr, cols[order], vals[order]
+
+
+def store_keys(stores):
+    return [question_key({"year": store.year(i), "id": int(store.ids[i])})
+            for store in stores for i in range(len(store))]
+
+
+def save_graph(path, keys, indptr, indices, scores, threshold):
+    np.savez_compressed(path, keys=np.asarray(keys), indptr=indptr, indices=indices,
+                        scores=scores, threshold=np.float32(threshold))
+
+
+def load_graph(path):
+    arr = np.load(path)
+    return {
+        "keys": arr["keys"].tolist(),
+        "indptr": arr["indptr"],
+        "indices": arr["indices"],
+        "scores": arr["scores"],
+        "threshold": float(arr["threshold"]),
+    }
+
+
+def build_clusters(stores, src, dst, scores):
+    n = sum(len(s) for s in stores)
+    uf = UnionFind(n)
+    for a, b in zip(src.tolist(), dst.tolist()):
+        uf.union(a, b)
+
+    # 全域列號 → (第幾個檔, 檔內列號)，只有出現在群組中的題目才解碼文字
+    starts = np.cumsum([0] + [len(s) for s in stores])
+    best = {}
+    for a, b, score in zip(src.tolist(), dst.tolist(), scores.tolist()):
+        best[a] = max(best.get(a, 0.0), score)
+        best[b] = max(best.get(b, 0.0), score)
+
+    clusters = []
+    for members in uf.groups():
+        rows = []
+        for g in members.tolist():
+            s = int(np.searchsorted(starts, g, side="right") - 1)
+            store, i = stores[s], g - starts[s]
+            rows.append({
+                "key": question_key({"year": store.year(i), "id": int(store.ids[i])}),
+                "year": store.year(i),
+                "id": int(store.ids[i]),
+                "subject": store.subject(i),
+                "stem": store.text("stem_texts", i),
+                "max_score": round(best[g], 4),
+            })
+        clusters.append({
+            "size": len(rows),
+            "years": sorted({r["year"] for r in rows}),
+            "members": sorted(rows, key=lambda r: (r["year"], r["id"])),
+        })
+    clusters.sort(key=lambda c: (-c["size"], c["members"][0]["key"]))
+    return clusters
+
+
+def run(store_paths, output_dir="results/near_duplicates", threshold=0.9, block_rows=BLOCK_ROWS):
+    stores = [open_store(p) for p in store_paths]
+    if not stores:
+        raise ValueError("沒有可用的向量檔")
+    n = sum(len(s) for s in stores)
+    print(f"🔍 比對 {n} 題（{len(stores)} 個向量檔，區塊 {block_rows} 列，門檻 {threshold}）...")
+
+    src, dst, scores = find_pairs(stores, threshold=threshold, block_rows=block_rows)
+    indptr, indices, neighbour_scores = to_csr(n, src, dst, scores)
+    clusters = build_clusters(stores, src, dst, scores)
+
+    os.makedirs(output_dir, exist_ok=True)
+    graph_path = os.path.join(output_dir, "neighbour_graph.npz")
+    clusters_path = os.path.join(output_dir, "clusters.json")
+    save_graph(graph_path, store_keys(stores), indptr, indices, neighbour_scores, threshold)
+    with open(clusters_path, "w", encoding="utf-8") as f:
+        json.dump({
+            "threshold": threshold,
+            "questions": n,
+            "pairs": int(len(src)),
+            "stores": [str(p) for p in store_paths],
+            "clusters": clusters,
+        }, f, ensure_ascii=False, indent=2)
+
+    cross_year = sum(1 for c in clusters if len(c["years"]) > 1)
+    print(f"✅ {len(src)} 組相似題、{len(clusters)} 個重複群組（跨年度 {cross_year} 個）")
+    print(f"   鄰接圖：{graph_path}\n   群組：{clusters_path}")
+    return clusters
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="題庫近似重複題分群")
+    parser.add_argument("--stores", default="Quiz_clean_Embedding_npz/*.npz")
+    parser.add_argument("--threshold", type=float, default=0.9)
+    parser.add_argument("--block-rows", type=int, default=BLOCK_ROWS)
+    parser.add_argument("--output", default="results/near_duplicates")
+    args = parser.parse_args()
+    paths = sorted(glob.glob(args.stores))
+    if not paths:
+        sys.exit(f"找不到向量檔：{args.stores}")
+    run(paths, output_dir=args.output, threshold=args.threshold, block_rows=args.block_rows)
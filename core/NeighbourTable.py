@@ -0,0 +1,247 @@
+import os
+import sys
+import glob
+import json
+import hashlib
+import numpy as np
+from core.ColumnarStore import open_store
+from core.NearDuplicates import iter_blocks
+from core.QuestionKey import question_key
+
+DEFAULT_K = 10
+BLOCK_ROWS = 4096
+TABLE_VERSION = 3
+
+# 題庫內每一題的前 k 名相似題，事先批次算好存成一個 .npz：
+#   keys      每列的題目 key（年度-題號），不保證唯一（年度 unknown、重複收錄的題目會撞號）
+#   text_ids  每列向量化文字的 hash，key 重複時用來分辨是哪一題
+#   indices   N × k 的鄰居列號（不足 k 個時補 -1）
+#   scores    N × k 的 cosine 相似度，由高到低
+#   stores    建表時用到的向量檔與其簽章，新增年度時只補算新的部分
+# 和 SimilaritySearcher 一樣，向量化文字完全相同的題目（自己或重複收錄的複本）不算鄰居。
+# 查「108-23 的相似題」只需查表，不必載入模型也不必重新編碼；
+# key 對到多列又無法用文字分辨時視為查不到，由呼叫端改用即時搜尋，不會回傳別題的鄰居。
+
+
+def _store_keys(store):
+    return [question_key({"year": store.year(i), "id": int(store.ids[i])}) for i in range(len(store))]
+
+
+def _signature(store, block_rows=BLOCK_ROWS):
+    # 以內容簽章（題目 key + 向量化文字 + 向量），非增量模式重寫出內容相同的檔案時簽章不變
+    h = hashlib.sha256()
+    h.update("\0".join(_store_keys(store)).encode("utf-8"))
+    for i in range(len(store)):
+        h.update(store.text("embed_texts", i).encode("utf-8") + b"\0")
+    for lo in range(0, len(store), block_rows):
+        h.update(np.ascontiguousarray(store.embs[lo:lo + block_rows]).tobytes())
+    return h.hexdigest()
+
+
+def text_id(text):
+    # 向量化文字的 64 位元 hash
+    return int.from_bytes(hashlib.blake2b(text.strip().encode("utf-8"), digest_size=8).digest(),
+                          "little", signed=True)
+
+
+def _text_ids(stores):
+    # 每列的文字 hash，用來排除文字完全相同的鄰居，也用來分辨 key 相同的題目
+    return np.array([text_id(store.text("embed_texts", i)) for store in stores for i in range(len(store))],
+                    dtype=np.int64)
+
+
+def _merge_topk(best_scores, best_idx, scores, idx, k):
+    scores = np.concatenate([best_scores, scores], axis=1)
+    idx = np.concatenate([best_idx, idx], axis=1)
+    if scores.shape[1] > k:
+        part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        scores = np.take_along_axis(scores, part, axis=1)
+        idx = np.take_along_axis(idx, part, axis=1)
+    return scores, idx
+
+
+def _block_topk(query_lo, query_block, candidates, k, block_rows, text_ids):
+    # candidates 為 (store, 全域起始列) 的列表；只保留每列目前的前 k 名，不保留整塊分數
+    # text_ids 為全域列號對應的文字 hash，文字相同（包含自己）的列不列入
+    n = len(query_block)
+    best_scores = np.full((n, 0), -np.inf, dtype=np.float32)
+    best_idx = np.full((n, 0), -1, dtype=np.int64)
+    query_texts = text_ids[query_lo:query_lo + n]
+    for store, offset in candidates:
+        for lo, block in iter_blocks([store], block_rows):
+            scores = query_block @ block.T
+            cols = np.arange(offset + lo, offset + lo + len(block))
+            scores[query_texts[:, None] == text_ids[cols][None, :]] = -np.inf
+            take = min(k, scores.shape[1])
+            part = np.argpartition(-scores, take - 1, axis=1)[:, :take]
+            best_scores, best_idx = _merge_topk(
+                best_scores, best_idx, np.take_along_axis(scores, part, axis=1), cols[part], k)
+    return best_scores, best_idx
+
+
+def _finalize(scores, idx, k):
+    # 依分數排序並補齊到 k 欄
+    n = len(scores)
+    if scores.shape[1] < k:
+        scores = np.hstack([scores, np.full((n, k - scores.shape[1]), -np.inf, dtype=np.float32)])
+        idx = np.hstack([idx, np.full((n, k - idx.shape[1]), -1, dtype=np.int64)])
+    order = np.argsort(-scores, axis=1, kind="stable")
+    scores = np.take_along_axis(scores, order, axis=1)
+    idx = np.take_along_axis(idx, order, axis=1)
+    idx[~np.isfinite(scores)] = -1
+    return scores.astype(np.float32), idx
+
+
+class NeighbourTable:
+    def __init__(self, path):
+        self.path = path
+        with np.load(path) as arr:
+            meta = json.loads(str(arr["meta"]))
+            if meta.get("version") != TABLE_VERSION:
+                raise ValueError(f"不支援的鄰居表版本：{path}")
+            self.keys = arr["keys"].tolist()
+            self.text_ids = arr["text_ids"]
+            self.indices = arr["indices"]
+            self.scores = arr["scores"]
+        self.k = meta["k"]
+        self.store_meta = meta["stores"]
+        self.key_to_rows = {}
+        for row, key in enumerate(self.keys):
+            self.key_to_rows.setdefault(key, []).append(row)
+        self._stores = None
+
+    def __contains__(self, key):
+        # 只有能唯一對到一列的 key 才算在表內
+        return self.find(key) is not None
+
+    def __len__(self):
+        return len(self.keys)
+
+    @property
+    def stores(self):
+        # 只有要顯示題目內容時才開向量檔（mmap）
+        if self._stores is None:
+            self._stores = [open_store(s["path"]) for s in self.store_meta]
+        return self._stores
+
+    def find(self, key, text=None):
+        # 回傳 key 對應的列號；key 重複時以向量化文字（EmbeddingGenerator.make_embedding_text）分辨，
+        # 仍無法唯一決定時回傳 None
+        rows = self.key_to_rows.get(key, [])
+        if len(rows) > 1 and text is not None:
+            tid = text_id(text)
+            rows = [r for r in rows if self.text_ids[r] == tid]
+        return rows[0] if len(rows) == 1 else None
+
+    def _row(self, key, text):
+        row = self.find(key, text)
+        if row is None:
+            raise KeyError(key)
+        return row
+
+    def neighbours(self, key, top_k=5, text=None):
+        row = self._row(key, text)
+        return [(self.keys[i], float(s)) for i, s in zip(self.indices[row, :top_k], self.scores[row, :top_k])
+                if i >= 0]
+
+    def similar(self, key, top_k=5, text=None):
+        # 回傳格式與 SimilaritySearcher.search_many 相同
+        row = self._row(key, text)
+        starts = np.cumsum([0] + [s["count"] for s in self.store_meta])
+        hits = []
+        for i, score in zip(self.indices[row, :top_k], self.scores[row, :top_k]):
+            if i < 0:
+                continue
+            s = int(np.searchsorted(starts, i, side="right") - 1)
+            hit = self.stores[s].row(int(i - starts[s]))
+            del hit["embed_text"]
+            hit["score"] = float(score)
+            hits.append(hit)
+        return hits
+
+    @staticmethod
+    def _save(path, keys, text_ids, indices, scores, k, store_meta):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, keys=np.asarray(keys), text_ids=text_ids, indices=indices, scores=scores,
+                     meta=np.asarray(json.dumps({"version": TABLE_VERSION, "k": k, "stores": store_meta},
+                                                ensure_ascii=False)))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def build(cls, store_paths, path, k=DEFAULT_K, block_rows=BLOCK_ROWS):
+        return cls._extend(path, [], [], None, None, list(store_paths), k, block_rows)
+
+    @classmethod
+    def refresh(cls, store_paths, path, k=DEFAULT_K, block_rows=BLOCK_ROWS):
+        # 既有向量檔都沒變時，只為新加入的年度計算鄰居，並用新題目更新舊題目的前 k 名；
+        # 有檔案被修改或移除、或 k 改變時才整個重建
+        if not os.path.exists(path):
+            return cls.build(store_paths, path, k=k, block_rows=block_rows)
+        try:
+            table = cls(path)
+        except (ValueError, KeyError):
+            return cls.build(store_paths, path, k=k, block_rows=block_rows)
+
+        wanted = {os.path.abspath(p): p for p in store_paths}
+        old_paths = [os.path.abspath(s["path"]) for s in table.store_meta]
+        unchanged = (table.k == k and set(old_paths) <= set(wanted) and all(
+            os.path.exists(s["path"]) and _signature(open_store(s["path"])) == s["signature"]
+            for s in table.store_meta))
+        if not unchanged:
+            print("♻️ 向量檔有變動，重建鄰居表")
+            return cls.build(store_paths, path, k=k, block_rows=block_rows)
+
+        new_paths = [p for a, p in wanted.items() if a not in set(old_paths)]
+        if not new_paths:
+            return table
+        return cls._extend(path, table.store_meta, table.keys, table.indices, table.scores,
+                           new_paths, k, block_rows)
+
+    @classmethod
+    def _extend(cls, path, old_meta, old_keys, old_indices, old_scores, new_paths, k, block_rows):
+        old_stores = [open_store(s["path"]) for s in old_meta]
+        new_stores = [open_store(p) for p in new_paths]
+        n_old = sum(len(s) for s in old_stores)
+
+        offsets, total = [], 0
+        for store in old_stores + new_stores:
+            offsets.append(total)
+            total += len(store)
+        everything = list(zip(old_stores + new_stores, offsets))
+        text_ids = _text_ids(old_stores + new_stores)
+        new_only = everything[len(old_stores):]
+        print(f"🧮 計算 {total - n_old} 題的前 {k} 名相似題（題庫共 {total} 題）...")
+
+        indices = np.full((total, k), -1, dtype=np.int64)
+        scores = np.full((total, k), -np.inf, dtype=np.float32)
+        if n_old:
+            indices[:n_old], scores[:n_old] = old_indices, old_scores
+
+        # 舊題目：只和新題目比，再與原本的前 k 名合併
+        if n_old and new_only:
+            for lo, block in iter_blocks(old_stores, block_rows):
+                hi = lo + len(block)
+                s, i = _block_topk(lo, block, new_only, k, block_rows, text_ids)
+                s, i = _merge_topk(scores[lo:hi], indices[lo:hi], s, i, k)
+                scores[lo:hi], indices[lo:hi] = _finalize(s, i, k)
+
+        # 新題目：和整個題庫比
+        for lo, block in iter_blocks(new_stores, block_rows):
+            lo += n_old
+            s, i = _block_topk(lo, block, everything, k, block_rows, text_ids)
+            scores[lo:lo + len(block)], indices[lo:lo + len(block)] = _finalize(s, i, k)
+
+        keys = list(old_keys) + [key for store in new_stores for key in _store_keys(store)]
+        store_meta = list(old_meta) + [{"path": p, "count": len(s), "signature": _signature(s)}
+                                       for p, s in zip(new_paths, new_stores)]
+        cls._save(path, keys, text_ids, indices, scores, k, store_meta)
+        print(f"✅ 鄰居表已儲存：{path}")
+        return cls(path)
+
+
+if __name__ == "__main__":
+    # 用法：python -m core.NeighbourTable "Quiz_clean_Embedding_npz/*.npz" 輸出.npz [k]
+    paths = sorted(glob.glob(sys.argv[1] if len(sys.argv) > 1 else "Quiz_clean_Embedding_npz/*.npz"))
+    out = sys.argv[2] if len(sys.argv) > 2 else "results/neighbours.npz"
+    NeighbourTable.refresh(paths, out, k=int(sys.argv[3]) if len(sys.argv) > 3 else DEFAULT_K)
@@ -0,0 +1,91 @@
+import copy
+import time
+import threading
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+
+
+def normalize_query(text):
+    # 全形轉半形、合併空白，讓同一題的不同貼法對到同一個 key
+    return " ".join(unicodedata.normalize("NFKC", text).split())
+
+
+class LRUCache:
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                value, stored_at = item
+                if self.ttl is None or time.monotonic() - stored_at <= self.ttl:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic())
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+
+class QueryCache:
+    def __init__(self, max_embeddings=4096, max_results=1024, ttl=3600):
+        self.embeddings = LRUCache(max_embeddings, ttl)
+        self.results = LRUCache(max_results, ttl)
+
+    def encode(self, model, model_name, texts, **encode_kwargs):
+        # 只把沒快取過的查詢送進模型，仍然是一次 batch
+        keys = [(model_name, normalize_query(t), tuple(sorted(encode_kwargs.items()))) for t in texts]
+        vectors = [self.embeddings.get(k) for k in keys]
+        missing = [i for i, v in enumerate(vectors) if v is None]
+        if missing:
+            encoded = model.encode([texts[i] for i in missing], convert_to_numpy=True, **encode_kwargs)
+            for i, vec in zip(missing, encoded):
+                vec = np.asarray(vec, dtype=np.float32)
+                vec.flags.writeable = False
+                self.embeddings.put(keys[i], vec)
+                vectors[i] = vec
+        return np.vstack(vectors)
+
+    def get_results(self, key):
+        hit = self.results.get(key)
+        return copy.deepcopy(hit) if hit is not None else None
+
+    def put_results(self, key, results):
+        self.results.put(key, copy.deepcopy(results))
+
+    def stats(self):
+        return {"embeddings": self.embeddings.stats(), "results": self.results.stats()}
+
+
+# 同一個行程內所有 retriever / Streamlit session 共用
+shared_query_cache = QueryCache()
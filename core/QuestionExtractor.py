@@ -1,7 +1,251 @@
 import re, json
 from pathlib import Path
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ProcessPoolExecutor
 import pymupdf4llm
 
+# 逐行解析用的樣式：都只在行首做一次錨定比對，不會回溯掃過整份文件
+QUESTION_START = re.compile(r'\s*(\d+)\.')
+GROUP_HEADER = re.compile(r'\s*(\d+)\s*-\s*(\d+)\s*為題組\s*')
+# 題組標題被拆成多行時（例如「11」「-12為題組」），前面幾行只會是這個樣式
+GROUP_HEADER_PREFIX = re.compile(r'\s*\d+(?:\s*-(?:\s*\d+)?)?\s*')
+OPTION_LABEL = re.compile(r'\(([A-Za-z甲乙丙丁戊己庚辛壬癸])\)')
+# 選項內容遇到下一個題號行或題組標題就結束
+OPTION_CUT = re.compile(r'\n\s*\d+(?:\.|\s*-\s*\d+\s*為題組)')
+# markdown 標題符號；層級（# 的個數）是 pymupdf4llm 依當次轉換的頁面統計字體大小決定的
+HEADING = re.compile(r'^[ \t]*#{1,6}[ \t]+', re.M)
+
+
+def normalize_headings(text):
+    # 逐頁轉換時同一個標題的層級會和整份轉換不同，串流模式一律改成單一個 #：
+    # 標題仍保留（pipeline.py 的 _SECTION_HEADER 靠它辨識大題標題），只是層級不再隨分頁變動
+    return HEADING.sub('# ', text)
+
+
+def _markdown_pages(pdf_path, pages):
+    # 在子行程執行：轉出指定頁的 markdown，一頁一個字串
+    return [chunk["text"] for chunk in pymupdf4llm.to_markdown(pdf_path, pages=list(pages), page_chunks=True)]
+
+
+def iter_page_markdown(pdf_path, workers=None, pages_per_task=2):
+    # 逐頁產生 markdown；workers > 1 時分散到多個行程，但仍依頁序輸出。
+    # 同時在處理中的工作最多 workers * 2 個，記憶體只和這個窗口大小有關
+    import pymupdf
+    with pymupdf.open(pdf_path) as doc:
+        page_count = doc.page_count
+    tasks = [range(lo, min(lo + pages_per_task, page_count)) for lo in range(0, page_count, pages_per_task)]
+
+    if not workers or workers <= 1:
+        for pages in tasks:
+            yield from _markdown_pages(str(pdf_path), pages)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        window = []
+        for pages in tasks:
+            window.append(pool.submit(_markdown_pages, str(pdf_path), pages))
+            if len(window) >= workers * 2:
+                yield from window.pop(0).result()
+        for future in window:
+            yield from future.result()
+
+
+class GroupIndex:
+    # 題組的區間查詢：把各題組的 [起, 訖] 攤成互不重疊的區段，用 bisect 找題號所在的區段。
+    # 題組區間重疊時，以先出現的題組為準（與依序掃過 groups 取第一個符合者相同）
+    def __init__(self, groups=None):
+        self.groups = {}
+        self._starts = []
+        self._segments = []  # (起, 訖, 題組 id)，依起點排序且互不重疊
+        for gid, g in (groups or {}).items():
+            self.add(gid, g["start"], g["end"], g["context"])
+
+    def add(self, gid, start, end, context):
+        if gid in self.groups:
+            # 同一個範圍再出現一次時只更新內容，順序不變（與 dict 重新賦值相同）
+            self.groups[gid]["context"] = context
+            return
+        self.groups[gid] = {"start": start, "end": end, "context": context}
+
+        # 只把 [start, end] 中還沒被先前題組佔走的部分分給這個題組
+        pos = max(bisect_right(self._starts, start) - 1, 0)
+        cursor = start
+        pieces = []
+        while cursor <= end and pos < len(self._segments):
+            seg_start, seg_end, _ = self._segments[pos]
+            if seg_end < cursor:
+                pos += 1
+                continue
+            if seg_start > end:
+                break
+            if seg_start > cursor:
+                pieces.append((cursor, seg_start - 1, gid))
+            cursor = seg_end + 1
+            pos += 1
+        if cursor <= end:
+            pieces.append((cursor, end, gid))
+        for piece in pieces:
+            i = bisect_right(self._starts, piece[0])
+            self._starts.insert(i, piece[0])
+            self._segments.insert(i, piece)
+
+    def lookup(self, q_num):
+        i = bisect_right(self._starts, q_num) - 1
+        if i >= 0 and self._segments[i][1] >= q_num:
+            return self._segments[i][2]
+        return None
+
+    def context(self, gid):
+        return self.groups[gid]["context"]
+
+
+class GroupScanner:
+    # 逐行辨識「11-12為題組」：標題後的第一行一律算進題組內容，之後遇到題號行就結束。
+    # 到文件結尾都沒遇到題號行的題組不成立；唯一例外是標題與第一行之間隔著空白行、
+    # 且第一行就是題號行，此時題組內容為空（與舊 regex 回溯後的結果相同）
+    def __init__(self, index):
+        self.index = index
+        self._group = None         # [起, 訖, 內容行]
+        self._first = False
+        self._gap = False
+        self._first_is_start = False
+        self._pending = []         # 可能是跨行題組標題的前幾行
+
+    def process(self, line, is_question_start):
+        if self._pending:
+            # 正在累積可能跨行的題組標題
+            self._pending.append((line, is_question_start))
+            joined = "\n".join(text for text, _ in self._pending)
+            header = GROUP_HEADER.fullmatch(joined)
+            if header:
+                self._pending = []
+                self._open(header)
+            elif not GROUP_HEADER_PREFIX.fullmatch(joined):
+                # 不是標題：第一行當一般行略過，其餘各行重新判斷
+                rest, self._pending = self._pending[1:], []
+                for text, start in rest:
+                    self.process(text, start)
+            return
+        if not line.strip():
+            # 空白行不影響題組的起訖，只保留在內容中間
+            if self._group is not None:
+                if self._first:
+                    self._gap = True
+                else:
+                    self._group[2].append(line)
+            return
+        if self._group is not None:
+            if self._first:
+                self._group[2].append(line)
+                self._first = False
+                self._first_is_start = is_question_start
+            elif not is_question_start:
+                self._group[2].append(line)
+            else:
+                self._add("\n".join(self._group[2]).strip())
+            return
+        header = GROUP_HEADER.fullmatch(line)
+        if header:
+            self._open(header)
+        elif GROUP_HEADER_PREFIX.fullmatch(line):
+            self._pending = [(line, is_question_start)]
+
+    def _open(self, header):
+        self._group = [int(header.group(1)), int(header.group(2)), []]
+        self._first, self._gap, self._first_is_start = True, False, False
+
+    def _add(self, context):
+        start, end, _ = self._group
+        self.index.add(f"{start}-{end}", start, end, context)
+        self._group = None
+
+    def close(self):
+        if self._group is not None and self._gap and self._first_is_start:
+            self._add("")
+        self._group = None
+        self._pending = []
+
+
+class QuestionStream:
+    # 逐行讀入清理過的 markdown，題目一完整就輸出，跨頁的題目與題組也能接起來。
+    # 題號行（「12.」開頭）結束上一題；題號後沒有文字時，下一行一律算進這一題。
+    # 未傳入 groups 時邊讀邊辨識題組，此時題組必須出現在其題目之前（學測試卷都是如此）；
+    # 整份文件一次解析時先掃出全部題組再傳進來，結果與舊的 regex 版本（benchmarks/legacy_parser.py）完全相同。
+    def __init__(self, build_question, groups=None):
+        self.build_question = build_question
+        self.groups = groups if groups is not None else GroupIndex()
+        self._scanner = GroupScanner(self.groups) if groups is None else None
+        self._partial = ""
+        self._question = None      # [題號, 內容行]
+        self._swallow = False
+
+    def feed(self, text):
+        lines = (self._partial + text).split("\n")
+        self._partial = lines.pop()
+        for line in lines:
+            yield from self._process_line(line)
+
+    def close(self):
+        if self._partial:
+            yield from self._process_line(self._partial)
+            self._partial = ""
+        if self._scanner is not None:
+            self._scanner.close()
+        if self._question is not None:
+            yield from self._emit()
+
+    def _process_line(self, line):
+        start = QUESTION_START.match(line)
+        if self._scanner is not None:
+            self._scanner.process(line, start is not None)
+        if not line.strip():
+            return
+
+        if self._question is not None and self._swallow:
+            self._question[1].append(line)
+            self._swallow = False
+        elif start:
+            if self._question is not None:
+                yield from self._emit()
+            rest = line[start.end():]
+            self._question = [int(start.group(1)), [rest] if rest.strip() else []]
+            self._swallow = not rest.strip()
+        elif self._question is not None:
+            self._question[1].append(line)
+
+    def _emit(self):
+        q_num, lines = self._question
+        self._question = None
+        self._swallow = False
+        if q_num != 0:
+            yield self.build_question(q_num, "\n".join(lines).strip(), self.groups)
+
+
+def split_options(content):
+    # 題幹到第一個選項標籤為止；每個選項的內容到下一個標籤、題號行或題組標題為止。
+    # 標籤、切點各只找一次，整體是線性時間
+    labels = list(OPTION_LABEL.finditer(content))
+    if not labels:
+        return content, {}
+    stem = content[:labels[0].start()]
+    text = content[labels[0].start():].rstrip()
+    offset = labels[0].start()
+    cuts = [m.start() for m in OPTION_CUT.finditer(text)]
+
+    options = {}
+    for k, label in enumerate(labels):
+        begin = label.end() - offset
+        while begin < len(text) and text[begin].isspace():
+            begin += 1
+        end = labels[k + 1].start() - offset if k + 1 < len(labels) else len(text)
+        # 只看落在內容開頭之後的切點：標籤後面的空白已被吃掉時，緊接的換行不算切點
+        c = bisect_left(cuts, begin)
+        if c < len(cuts):
+            end = min(end, cuts[c])
+        options[label.group(1)] = ' '.join(text[begin:max(begin, end)].split())
+    return stem, options
+
+
 class QuestionExtractor:
     def __init__(self, pdf_path):
         self.pdf_path = Path(pdf_path)
@@ -34,49 +278,62 @@ class QuestionExtractor:
             self.subject =  "unknown"
 
     def extract_groups(self, md_text):
-        group_pattern = re.compile(r'^\s*(\d+)\s*-\s*(\d+)\s*為題組\s*\n([\s\S]*?)(?=\n\s*\d+\.)', re.M)
-        groups = {}
-        for match in group_pattern.finditer(md_text):
-            start, end, context = int(match.group(1)), int(match.group(2)), match.group(3).strip()
-            groups[f"{start}-{end}"] = {"start": start, "end": end, "context": context}
-        return groups
+        index = GroupIndex()
+        scanner = GroupScanner(index)
+        for line in md_text.split("\n"):
+            scanner.process(line, QUESTION_START.match(line) is not None)
+        scanner.close()
+        return index.groups
 
     def extract_questions(self, md_text, groups):
-        questions = []
-        question_pattern = re.compile(r'^\s*(\d+)\.\s*([\s\S]*?)(?=\n\s*\d+\.|\Z)', re.M)
-        option_pattern = re.compile(
-            r'\(([A-Za-z甲乙丙丁戊己庚辛壬癸])\)\s*(.*?)(?=\s*(?:\([A-Za-z甲乙丙丁戊己庚辛壬癸]\)|\n\s*\d+\.|\n\s*\d+\s*-\s*\d+\s*為題組|\Z))',
-            re.S)
-
-        for match in question_pattern.finditer(md_text):
-            q_num, content = int(match.group(1)), match.group(2).strip()
-            if q_num == 0:
+        stream = QuestionStream(self.build_question, groups=GroupIndex(groups))
+        questions = list(stream.feed(md_text)) + list(stream.close())
+        questions.sort(key=lambda x: x["id"])
+        return questions
+
+    def build_question(self, q_num, content, groups):
+        stem, options = split_options(content)
+        group_id = groups.lookup(q_num)
+        group_context = groups.context(group_id) if group_id else ""
+
+        return {
+            "id": q_num,
+            "year": self.year,
+            "subject": self.subject,
+            "group_id": group_id,
+            "group_context": ' '.join(group_context.split()),
+            "stem": ' '.join(stem.split()),
+            "options": options
+        }
+
+    def iter_questions(self, workers=None, pages_per_task=2):
+        # 串流模式：逐頁轉 markdown、逐頁清理後餵給 QuestionStream，題目一完整就 yield，
+        # 下游（例如編碼）不必等整份 PDF 抽完。年度與科目從頁尾抓到之前，先把題目留著。
+        # 與 process_pdf 的差別只有標題符號：這裡一律是單一個 #（見 normalize_headings），整份轉換則依層級為 # ~ ######
+        self.year = self.subject = "unknown"
+        stream = QuestionStream(self.build_question)
+        held, found = [], False
+        for page in iter_page_markdown(self.pdf_path, workers=workers, pages_per_task=pages_per_task):
+            if not found:
+                self.extract_exam_info(page)
+                found = self.year != "unknown"
+            clean = self.clean_md_text(normalize_headings(page))
+            questions = list(stream.feed(clean + "\n")) if clean else []
+            if not found:
+                held.extend(questions)
                 continue
-            stem = content
-            options = {}
-            first_option_match = re.search(r'\([A-Za-z甲乙丙丁戊己庚辛壬癸]\)', content)
-            if first_option_match:
-                stem = content[:first_option_match.start()].strip()
-                options_text = content[first_option_match.start():].strip()
-                found_options = option_pattern.findall(options_text)
-                for label, text in found_options:
-                    cleaned_text = ' '.join(text.split())
-                    options[label] = cleaned_text
-
-            group_id = next((gid for gid, g in groups.items() if g["start"] <= q_num <= g["end"]), None)
-            group_context = groups[group_id]["context"] if group_id else ""
-
-            questions.append({
-                "id": q_num,
-                "year": self.year,
-                "subject": self.subject,
-                "group_id": group_id,
-                "group_context": ' '.join(group_context.split()),
-                "stem": ' '.join(stem.split()),
-                "options": options
-            })
+            for q in held + questions:
+                q["year"], q["subject"] = self.year, self.subject
+                yield q
+            held = []
+        for q in held + list(stream.close()):
+            q["year"], q["subject"] = self.year, self.subject
+            yield q
 
-        questions.sort(key=lambda x: x["id"])
+    def process_pdf_streaming(self, output_json_path, workers=None):
+        questions = sorted(self.iter_questions(workers=workers), key=lambda x: x["id"])
+        Path(output_json_path).write_text(json.dumps(questions, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"✅ 提取完成 年度: {self.year}, 科目: {self.subject}, 共 {len(questions)} 題，儲存於 {output_json_path}")
         return questions
 
     def process_pdf(self, output_json_path):
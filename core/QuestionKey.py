@@ -0,0 +1,3 @@
+def question_key(q):
+    # 題號只在同一年度內唯一，跨年度需加上年份，例如 "108-23"
+    return f"{q.get('year', 'unknown')}-{q['id']}"
@@ -0,0 +1,131 @@
+import os
+import sys
+import json
+import shutil
+import argparse
+
+# 以 JSONL（一行一題）存放題目：
+#   - QuestionWriter 只在檔尾追加，寫一題就落地一行，不必把整份題庫留在記憶體
+#   - iter_questions 逐行讀取，年度 / 科目篩選在讀的同時做，記憶體用量與題庫大小無關
+#   - 多個年度合併只是把檔案接在一起（concat），不必解析再重新序列化
+# 舊的 .json（整份陣列）仍可讀，只是無法串流，會整份載入後再逐題產出。
+
+
+def is_jsonl(path):
+    return str(path).endswith(".jsonl")
+
+
+def _as_filter(values):
+    if values is None:
+        return None
+    if isinstance(values, (str, int)):
+        values = [values]
+    return {str(v) for v in values}
+
+
+def _dumps(q):
+    # 不跳脫中文：檔案較小，科目篩選也能直接對原始行做字串比對
+    return json.dumps(q, ensure_ascii=False)
+
+
+def iter_questions(path, years=None, subjects=None):
+    years, subjects = _as_filter(years), _as_filter(subjects)
+
+    def keep(q):
+        return ((years is None or str(q.get("year", "")) in years)
+                and (subjects is None or str(q.get("subject", "")) in subjects))
+
+    if not is_jsonl(path):
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        yield from (q for q in data if keep(q))
+        return
+
+    # 有篩選時，整行連篩選值的字串都不含就不可能符合，不必 json.loads（含的話解析後再確認一次）；
+    # 別的工具以 \u 跳脫寫出的行無法這樣比對，一律解析
+    needles = [v for v in (years, subjects) if v is not None]
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            if "\\u" not in line and any(not any(v in line for v in values) for values in needles):
+                continue
+            q = json.loads(line)
+            if keep(q):
+                yield q
+
+
+def load_questions(path, years=None, subjects=None):
+    return list(iter_questions(path, years=years, subjects=subjects))
+
+
+def count_questions(path):
+    if not is_jsonl(path):
+        return len(load_questions(path))
+    with open(path, "rb") as f:
+        return sum(1 for line in f if line.strip())
+
+
+class QuestionWriter:
+    # 用法：with QuestionWriter("all.jsonl") as w: w.write(q)
+    def __init__(self, path, append=True):
+        self.path = str(path)
+        self.count = 0
+        self._f = open(self.path, "a" if append else "w", encoding="utf-8")
+
+    def write(self, q):
+        self._f.write(_dumps(q) + "\n")
+        self.count += 1
+
+    def write_many(self, questions):
+        for q in questions:
+            self.write(q)
+        return self.count
+
+    def close(self):
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def write_questions(path, questions):
+    # 整份重寫：先寫暫存檔再換名，中斷時不會留下只寫一半的題庫
+    tmp_path = str(path) + ".tmp"
+    with QuestionWriter(tmp_path, append=False) as w:
+        w.write_many(questions)
+    os.replace(tmp_path, path)
+    return w.count
+
+
+def concat(paths, output_path):
+    # .jsonl 直接接檔案內容；舊的 .json 才需要解析後逐題寫出
+    tmp_path = str(output_path) + ".tmp"
+    with open(tmp_path, "wb") as out:
+        for path in paths:
+            if is_jsonl(path):
+                with open(path, "rb") as f:
+                    shutil.copyfileobj(f, out, 1 << 20)
+                    # 最後一行沒有換行時補上，避免和下一個檔案的第一題接在同一行
+                    if f.tell():
+                        f.seek(-1, os.SEEK_END)
+                        if f.read(1) != b"\n":
+                            out.write(b"\n")
+            else:
+                for q in iter_questions(path):
+                    out.write((_dumps(q) + "\n").encode("utf-8"))
+    os.replace(tmp_path, output_path)
+    return output_path
+
+
+if __name__ == "__main__":
+    # 用法：python -m core.QuestionStore Quiz_json/106.json Quiz_json/107.json ... --output Quiz_json/all.jsonl
+    parser = argparse.ArgumentParser(description="把題目 JSON 轉成 / 合併為 JSONL 題庫")
+    parser.add_argument("inputs", nargs="+")
+    parser.add_argument("--output", required=True)
+    args = parser.parse_args()
+    concat(args.inputs, args.output)
+    print(f"✅ 已輸出 {count_questions(args.output)} 題至 {args.output}", file=sys.stderr)
@@ -1,14 +1,35 @@
-import core.BmHnsw as bh
+import os
 import glob
-from core.SimilaritySearcher import SimilaritySearcher
+
+# faiss、jieba、sentence_transformers 等只在真正建立 retriever 時才載入
+
+DIFFICULTY_STORE_PATH = os.getenv("QUIZHUNTER_DIFFICULTY_STORE", "difficulty.sqlite")
+
+
+def build_content(q):
+    # retriever 索引與顯示用的題目全文；BatchScorer 與 DifficultyStore 也用它算內容 hash，放在這裡不必載入 faiss
+    parts = []
+    if q.get("group_id"):
+        parts.append(q.get("group_context", ""))
+    parts.append(q["stem"])
+    for k, v in q.get("options", {}).items():
+        parts.append(f"({k}) {v}")
+    return " ".join(parts)
+
 
 def bm25_hnsw_retriever():
-    retriever = bh.BM25HNSWRetriever("C:\\Users\\0524e\\OneDrive\\文件\\GitHub\\Quiz_Hunter\\Quiz_json\\all.json")  # ← JSON 題庫
-    retriever.load_and_prepare()
+    import core.BmHnsw as bh
+    from core.DifficultyStore import DifficultyStore
+    # 先跑過 python -m core.BatchScorer 才會有難度檔；沒有的話 app 退回即時評分
+    difficulty_store = DifficultyStore(DIFFICULTY_STORE_PATH) if os.path.exists(DIFFICULTY_STORE_PATH) else None
+    retriever = bh.BM25HNSWRetriever("C:\\Users\\0524e\\OneDrive\\文件\\GitHub\\Quiz_Hunter\\Quiz_json\\all.json",  # ← JSON 題庫
+                                     difficulty_store=difficulty_store)
+    retriever.load_or_build()  # 有相同題庫與模型的快照時直接讀檔，不重新編碼
     return retriever
 
 
 def vector_embedding_retriever():
+    from core.SimilaritySearcher import SimilaritySearcher
     npz_files = glob.glob("./Quiz_clean_Embedding_npz/*.npz")
     if not npz_files:
         print(" 無法找到任何 .npz 向量檔案，請確認後再試一次。")
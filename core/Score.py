@@ -1,19 +1,186 @@
 import os
 import re
+import time
+import atexit
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
 from typing import Optional, List, Any
 
-import google.generativeai as genai
-from dotenv import load_dotenv
-from transformers import pipeline
 from langchain.llms.base import LLM
 from pydantic import PrivateAttr
 
 
+# --- 出題與批改的 prompt ---
+def answer_question(llm, question: str, context: str, role: Optional[str] = None) -> str:
+    # 任何實作 _call(prompt) 的物件都能使用，方便換成限速包裝或假模型
+    if role:
+        role_instruction = {
+            "small": "你只具備國中程度的知識與理解力，容易混淆名詞或依直覺猜測答案，常常忽略關鍵細節。請依據片段記憶與語感作答，避免過度推理。",
+            "medium": "你只具備高一自然科學生的程度，知道一些常見的化學名詞與基本反應，會試著根據題目的字面意思作答，但容易被關鍵詞或看起來熟悉的選項誤導。請依據你記得的知識和直覺作答，並避免過度推理或使用反應式。",
+            "large": "你是高中自然科普通的學生，具備邏輯與整合推理能力，能掌握題幹細節並作出合理分析。"
+        }.get(role, "請根據你能力回答")
+
+        prompt = f"""
+        你是一位 {role} 中文語言模型：
+        {role_instruction}
+
+        請閱讀以下題目後根據能力進行回答，並用以下格式回答：
+
+        選項：X
+        理由：...
+
+        題目：{question}
+        {context}
+        """
+    else:
+        prompt = f"""
+        根據以下內容回答問題，請用以下格式回答：
+
+        選項：X
+        理由：...
+
+        題目：{question}
+        {context}
+        """
+    return llm._call(prompt)
+
+
+def judge_answer(llm, question: str, context: str, candidate: str, reason: str) -> str:
+    # 第一層：判斷選項是否正確
+    prompt_1 = f"""
+    你是一位自然科題目批改助理，請判斷以下學生的選項是否正確。
+
+    題目：{question}
+    {context}
+    學生作答：{candidate}
+
+    請回覆：「正確」或「錯誤」。
+    """
+    result_1 = llm._call(prompt_1)
+
+    if "錯誤" in result_1:
+        return "錯誤"
+
+    # 第二層：判斷理由是否展現出完整自信理解
+    prompt_2 = f"""
+    你是一位自然科老師，請判斷以下學生對於題目的理解是否清晰、具信心、且無模糊推測。
+
+    題目：{question}
+    {context}
+    作答理由：{reason}
+
+    若學生的理由中有以下語句，表示其理解不完整、不具信心，請回覆「理解不完全」：
+    「感覺」「好像」「應該是」「不太懂」「不確定」「我猜」「我沒辦法判斷」「我無法理解」「這我不清楚」「不太會判斷」「這題有點難」
+
+    若理由清晰完整，請回覆「理解完整」。
+    """
+    result_2 = llm._call(prompt_2)
+
+    if "理解不完全" in result_2:
+        return "錯誤"
+
+    return "正確"
+
+
+# --- 呼叫控制：限速、逾時與重試 ---
+class TokenBucket:
+    # 每秒補充 rate 個 token，最多累積 burst 個；每次呼叫前取一個，不夠就等
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class GuardedLLM:
+    # 包裝任何實作 _call(prompt, stop) 的 LLM，對外提供同樣的 _call 介面
+    def __init__(self, llm, limiter: Optional[TokenBucket] = None, timeout: Optional[float] = 30.0,
+                 max_retries: int = 3, backoff: float = 1.0, max_workers: int = 8):
+        self.llm = llm
+        self.limiter = limiter
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        # 逾時的呼叫無法中斷，只能放著讓它在背景跑完，所以另開一個執行緒池。
+        # 每個執行中的呼叫（包含已逾時、還在背景跑的）都佔一個名額，真的結束才歸還：
+        # 重試不會疊在還沒跑完的呼叫上，同時進行的呼叫數不超過 max_workers，也不會在池裡排隊耗掉逾時時間
+        self.max_workers = max_workers
+        self._slots = threading.BoundedSemaphore(max_workers)
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+    def _submit(self, prompt, stop):
+        # 名額全被卡住的呼叫佔滿時，最多等 timeout 秒就放棄，不會無限期卡住
+        if not self._slots.acquire(timeout=self.timeout):
+            raise TimeoutError(f"No free LLM slot after {self.timeout}s")
+        if self.limiter is not None:
+            self.limiter.acquire()
+        try:
+            with self._pool_lock:
+                # shutdown() 之後再呼叫會開一個新的池
+                if self._pool is None:
+                    self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="llm-call")
+                future = self._pool.submit(self.llm._call, prompt, stop)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def shutdown(self, wait=False):
+        # 預設不等還在背景跑的逾時呼叫
+        with self._pool_lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=wait, cancel_futures=True)
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None) -> str:
+        # 已有快取的 prompt 不佔限速額度，也不需要逾時保護
+        is_cached = getattr(self.llm, "is_cached", None)
+        if is_cached is not None and is_cached(prompt):
+            return self.llm._call(prompt, stop)
+        for attempt in range(self.max_retries + 1):
+            try:
+                # 等名額與限速的時間也算在這次呼叫的逾時內
+                start = time.monotonic()
+                future = self._submit(prompt, stop)
+                remaining = None if self.timeout is None else max(0.0, self.timeout - (time.monotonic() - start))
+                return future.result(timeout=remaining)
+            except FutureTimeout:
+                error = TimeoutError(f"LLM call timed out after {self.timeout}s")
+            except Exception as e:
+                error = e
+            if attempt == self.max_retries:
+                raise error
+            # 指數退避加上隨機抖動，避免同時失敗的呼叫又同時重試
+            delay = self.backoff * (2 ** attempt)
+            time.sleep(delay + random.uniform(0, delay))
+
+
 # --- Google Gemini LLM 包裝 ---
 class GoogleGeminiLLM(LLM):
     api_key: str
     model: str = "gemini-1.5-flash"
+    # 相同模型與 prompt 的回應存在本機 SQLite（core/LLMCache.py），cache_path 設為 None 即停用
+    cache_path: Optional[str] = os.getenv("QUIZHUNTER_LLM_CACHE", "llm_cache.sqlite")
+    cache_ttl: Optional[float] = 7 * 24 * 3600
     _client: Any = PrivateAttr()
+    _cache: Any = PrivateAttr(default=None)
 
     @property
     def _llm_type(self) -> str:
@@ -21,92 +188,79 @@ class GoogleGeminiLLM(LLM):
 
     def __init__(self, **data):
         super().__init__(**data)
+        import google.generativeai as genai
         genai.configure(api_key=self.api_key)
         self._client = genai.GenerativeModel(model_name=self.model)
+        if self.cache_path:
+            from core.LLMCache import PromptCache
+            self._cache = PromptCache(self.cache_path, ttl=self.cache_ttl)
 
-    def _call(self, prompt: str, stop: Optional[List[str]] = None) -> str:
+    def _generate(self, prompt: str) -> str:
         response = self._client.generate_content(prompt)
         return response.text.strip()
 
-    def answer_question(self, question: str, context: str, role: Optional[str] = None) -> str:
-        if role:
-            role_instruction = {
-                "small": "你只具備國中程度的知識與理解力，容易混淆名詞或依直覺猜測答案，常常忽略關鍵細節。請依據片段記憶與語感作答，避免過度推理。",
-                "medium": "你只具備高一自然科學生的程度，知道一些常見的化學名詞與基本反應，會試著根據題目的字面意思作答，但容易被關鍵詞或看起來熟悉的選項誤導。請依據你記得的知識和直覺作答，並避免過度推理或使用反應式。",
-                "large": "你是高中自然科普通的學生，具備邏輯與整合推理能力，能掌握題幹細節並作出合理分析。"
-            }.get(role, "請根據你能力回答")
-
-            prompt = f"""
-            你是一位 {role} 中文語言模型：
-            {role_instruction}
-
-            請閱讀以下題目後根據能力進行回答，並用以下格式回答：
-
-            選項：X
-            理由：...
+    def _call(self, prompt: str, stop: Optional[List[str]] = None) -> str:
+        if self._cache is None:
+            return self._generate(prompt)
+        return self._cache.cached_call(self.model, prompt, lambda: self._generate(prompt))
 
-            題目：{question}
-            {context}
-            """
-        else:
-            prompt = f"""
-            根據以下內容回答問題，請用以下格式回答：
+    def is_cached(self, prompt: str) -> bool:
+        return self._cache is not None and self._cache.contains(self.model, prompt)
 
-            選項：X
-            理由：...
+    def cache_stats(self) -> Optional[dict]:
+        return self._cache.stats() if self._cache is not None else None
 
-            題目：{question}
-            {context}
-            """
-        return self._call(prompt)
+    def answer_question(self, question: str, context: str, role: Optional[str] = None) -> str:
+        return answer_question(self, question, context, role=role)
 
     def judge_answer(self, question: str, context: str, candidate: str, reason: str) -> str:
-        # 第一層：判斷選項是否正確
-        prompt_1 = f"""
-        你是一位自然科題目批改助理，請判斷以下學生的選項是否正確。
-
-        題目：{question}
-        {context}
-        學生作答：{candidate}
+        return judge_answer(self, question, context, candidate, reason)
 
-        請回覆：「正確」或「錯誤」。
-        """
-        result_1 = self._call(prompt_1)
 
-        if "錯誤" in result_1:
-            return "錯誤"
+# --- 行程內共用的 Gemini 呼叫入口 ---
+_shared_lock = threading.Lock()
+_shared_llms = {}
 
-        # 第二層：判斷理由是否展現出完整自信理解
-        prompt_2 = f"""
-        你是一位自然科老師，請判斷以下學生對於題目的理解是否清晰、具信心、且無模糊推測。
 
-        題目：{question}
-        {context}
-        作答理由：{reason}
+def shared_llm(rate_per_second: float = 4.0, burst: int = 4, timeout: Optional[float] = 30.0,
+               max_retries: int = 3, backoff: float = 1.0, max_workers: int = 8) -> GuardedLLM:
+    # 第一次評分時才建立；app 每次查詢都新建 DifficultyScorer，相同設定的限速器與執行緒池整個行程共用一份
+    settings = (rate_per_second, burst, timeout, max_retries, backoff, max_workers)
+    with _shared_lock:
+        llm = _shared_llms.get(settings)
+        if llm is None:
+            llm = _shared_llms[settings] = GuardedLLM(
+                DifficultyScorer.google_llm_model(), limiter=TokenBucket(rate_per_second, burst), timeout=timeout,
+                max_retries=max_retries, backoff=backoff, max_workers=max_workers)
+            atexit.register(llm.shutdown)
+    return llm
 
-        若學生的理由中有以下語句，表示其理解不完整、不具信心，請回覆「理解不完全」：
-        「感覺」「好像」「應該是」「不太懂」「不確定」「我猜」「我沒辦法判斷」「我無法理解」「這我不清楚」「不太會判斷」「這題有點難」
 
-        若理由清晰完整，請回覆「理解完整」。
-        """
-        result_2 = self._call(prompt_2)
-
-        if "理解不完全" in result_2:
-            return "錯誤"
-
-        return "正確"
+# --- DifficultyScorer 評估器 ---
+LEVELS = ["small", "medium", "large"]
 
 
-# --- DifficultyScorer 評估器 ---
 class DifficultyScorer:
-    def __init__(self, question: dict):
+    def __init__(self, question: dict, llm=None, concurrent: bool = True, max_workers: int = 8,
+                 rate_per_second: float = 4.0, burst: int = 4, timeout: Optional[float] = 30.0,
+                 max_retries: int = 3, backoff: float = 1.0):
         self.question = question
         self.context = self._normalize_context(question["content"])
         self.stem = self._extract_stem(self.context)
-
-        self.models = {
-            "gold": self.google_llm_model()
-        }
+        self.concurrent = concurrent
+        self.max_workers = max_workers
+
+        # 預設使用整個行程共用的 Gemini（shared_llm，依限速與重試設定各共用一份）；所有呼叫都經過限速、逾時與重試。
+        # 傳入現成的 GuardedLLM 時直接沿用；傳入其他 LLM（例如 benchmarks/fake_llm.py 的假模型）時
+        # 另包一層，評分結束就關掉它的執行緒池
+        self._owned = None
+        if llm is None:
+            llm = shared_llm(rate_per_second, burst, timeout=timeout, max_retries=max_retries, backoff=backoff,
+                             max_workers=max_workers)
+        elif not isinstance(llm, GuardedLLM):
+            llm = self._owned = GuardedLLM(llm, limiter=TokenBucket(rate_per_second, burst), timeout=timeout,
+                                           max_retries=max_retries, backoff=backoff, max_workers=max_workers)
+        self.models = {"gold": llm}
 
     def _extract_stem(self, content):
         return content.split("(A)")[0].strip()
@@ -116,7 +270,9 @@ class DifficultyScorer:
         context = self._extract_stem(content) + "\n選項：\n" + "\n".join(options)
         return context
 
-    def google_llm_model(self):
+    @staticmethod
+    def google_llm_model():
+        from dotenv import load_dotenv
         load_dotenv("config.env")
         api_key = os.getenv("GOOGLE_API_KEY")
         return GoogleGeminiLLM(api_key=api_key)
@@ -135,27 +291,53 @@ class DifficultyScorer:
         match = re.search(r"難度[:：]?\s*(\d)", reply)
         return int(match.group(1)) if match else 3
 
-    def score(self):
-        gold = self.models["gold"].answer_question(self.stem, self.context)
+    def _answer(self, level):
+        llm = self.models["gold"]
+        try:
+            pred = answer_question(llm, self.stem, self.context, role=level)
+            match = re.search(r"選項[:：]?\s*([A-E])", pred)
+            choice = match.group(1) if match else "未知"
+            reason_match = re.search(r"理由[:：]?\s*(.*)", pred)
+            reason = reason_match.group(1).strip() if reason_match else "（無理由）"
+            return {"choice": choice, "reason": reason}
+        except Exception as e:
+            print(f"[{level}] 模擬失敗: {e}")
+            return {"choice": "", "reason": "錯誤"}
+
+    def _judge(self, answer):
+        judgment = judge_answer(self.models["gold"], self.stem, self.context, answer["choice"], answer["reason"])
+        return "正確" in judgment
+
+    def _answer_and_judge(self, level):
+        # 同一個角色的批改必須等作答完成，但不必等其他角色
+        answer = self._answer(level)
+        return answer, self._judge(answer)
 
-        answers = {}
-        for level in ["small", "medium", "large"]:
-            try:
-                pred = self.models["gold"].answer_question(self.stem, self.context, role=level)
-                match = re.search(r"選項[:：]?\s*([A-E])", pred)
-                choice = match.group(1) if match else "未知"
-                reason_match = re.search(r"理由[:：]?\s*(.*)", pred)
-                reason = reason_match.group(1).strip() if reason_match else "（無理由）"
-                answers[level] = {"choice": choice, "reason": reason}
-            except Exception as e:
-                print(f"[{level}] 模擬失敗: {e}")
-                answers[level] = {"choice": "", "reason": "錯誤"}
-
-        correctness = {}
-        for level in ["small", "medium", "large"]:
-            a = answers[level]
-            judgment = self.models["gold"].judge_answer(self.stem, self.context, a["choice"], a["reason"])
-            correctness[level] = "正確" in judgment
+    def score(self):
+        try:
+            return self._score()
+        finally:
+            if self._owned is not None:
+                self._owned.shutdown()
+
+    def _score(self):
+        llm = self.models["gold"]
+        if self.concurrent:
+            # 正解、難度評分與三個角色的「作答→批改」同時進行，總等待時間約為最長的一條鏈
+            with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="scorer") as pool:
+                gold_future = pool.submit(answer_question, llm, self.stem, self.context)
+                rating_future = pool.submit(self.gemini_rating)
+                level_futures = {level: pool.submit(self._answer_and_judge, level) for level in LEVELS}
+                results = {level: f.result() for level, f in level_futures.items()}
+                gold = gold_future.result()
+                star_gemini = rating_future.result()
+            answers = {level: results[level][0] for level in LEVELS}
+            correctness = {level: results[level][1] for level in LEVELS}
+        else:
+            gold = answer_question(llm, self.stem, self.context)
+            answers = {level: self._answer(level) for level in LEVELS}
+            correctness = {level: self._judge(answers[level]) for level in LEVELS}
+            star_gemini = self.gemini_rating()
 
         if correctness["small"] and correctness["medium"] and correctness["large"]:
             star_auto = 2
@@ -166,7 +348,6 @@ class DifficultyScorer:
         else:
             star_auto = 5
 
-        star_gemini = self.gemini_rating()
         final_star = round((star_auto * 0.4 + star_gemini * 0.6))
 
         return final_star, gold, answers, correctness, star_auto, star_gemini
@@ -178,12 +359,19 @@ if __name__ == "__main__":
         "content": "在某密閉容器中，加入過量的鐵粉並通入適量的氯氣，發現反應生成紅棕色的固體，並伴隨放熱現象。下列關於此反應的敘述，何者正確？ (A) 此反應為還原反應，生成物為 FeCl (B) 此反應吸熱，表示生成物比反應物穩定 (C) 此反應屬於氧化還原反應，生成物為 FeCl₃ (D) 氯氣作為還原劑，將鐵還原為 Fe²⁺ (E) 若容器內壓力上升，代表反應消耗氣體體積小於生成氣體"
     }
 
-    scorer = DifficultyScorer(query)
+    # python -m core.Score --fake：用本機假模型測試並行流程，不呼叫 Gemini
+    import sys
+    llm = None
+    if "--fake" in sys.argv:
+        from benchmarks.fake_llm import FakeLLM
+        llm = FakeLLM(latency=0.5)
+    scorer = DifficultyScorer(query, llm=llm)
+    start = time.perf_counter()
     stars, gold, answers, correctness, auto, gem = scorer.score()
     print(f"\U0001f511 正解（Gemini）：{gold}")
     print(f"\U0001f9e0 難度（自動答題評估）：{auto} 星")
     print(f"\U0001f4ca 難度（Gemini語意評估）：{gem} 星")
-    print(f"⭐️ 綜合難度評等：{stars} 星")
+    print(f"⭐️ 綜合難度評等：{stars} 星（{time.perf_counter() - start:.2f}s）")
     for k in ["small", "medium", "large"]:
         a = answers[k]
         mark = "✅" if correctness[k] else "❌"
@@ -1,45 +1,104 @@
 import numpy as np
-from sentence_transformers import SentenceTransformer, util
+from core.ModelRegistry import get_model
+from core.ColumnarStore import open_store
+from core.QueryCache import normalize_query, shared_query_cache
+
+BLOCK_ROWS = 65536
+
+def print_hits(hits):
+    print("\n🚀 相似題目結果（題組+題幹+選項對比）：\n")
+    for shown, hit in enumerate(hits, 1):
+        print(f"{shown}. 📌 年度：{hit['year']} | 科目：{hit['subject']} | 相似度：{hit['score']:.4f}")
+        if hit["context"]:
+            print(f"    題組背景：{hit['context']}")
+        print(f"    題幹：{hit['stem']}")
+        print("    選項：")
+        for lab, txt in hit["options"].items():
+            print(f"      ({lab}) {txt}")
+        print()
+
+    if not hits:
+        print("⚠️ 沒有找到不同於輸入的相似題目。")
 
 class SimilaritySearcher:
-    def __init__(self, npz_paths, model_name='sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2'):
-        self.model = SentenceTransformer(model_name)
-        self.embs = []
-        # 用一個 dict 一次讀完所有欄位
-        self.data = {k: [] for k in (
-            "embed_texts","stem_texts","contexts","options","years","subjects")}
-        for path in npz_paths:
-            arr = np.load(path, allow_pickle=True)
-            self.embs.append(arr["embs"])
-            for k in self.data:
-                self.data[k].extend(arr[k])
-        self.embs = np.vstack(self.embs)
+    def __init__(self, npz_paths, model_name='sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2',
+                 cache=shared_query_cache, model=None):
+        self.model_name = model_name
+        self.model = model if model is not None else get_model(model_name)
+        self.cache = cache
+        self.npz_paths = tuple(npz_paths)
+        # 每個向量檔各自 mmap，不再把所有向量 vstack 成一份新的複本
+        self.stores = [open_store(path) for path in npz_paths]
+
+    def _top_hits(self, q_embs, k):
+        # 逐檔、逐區塊算 cosine 並只留每區塊的前 k 名，float16 也只在區塊內轉型
+        q = np.atleast_2d(np.asarray(q_embs, dtype=np.float32))
+        q = q / (np.linalg.norm(q, axis=1, keepdims=True) + 1e-12)
+        cand_scores, cand_stores, cand_rows = [], [], []
+        for s, store in enumerate(self.stores):
+            for lo in range(0, len(store), BLOCK_ROWS):
+                block = np.asarray(store.embs[lo:lo + BLOCK_ROWS], dtype=np.float32)
+                norms = np.asarray(store.norms[lo:lo + BLOCK_ROWS]) + 1e-12
+                scores = (q @ block.T) / norms
+                if scores.shape[1] > k:
+                    idx = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+                else:
+                    idx = np.broadcast_to(np.arange(scores.shape[1]), scores.shape)
+                cand_scores.append(np.take_along_axis(scores, idx, axis=1))
+                cand_stores.append(np.full(idx.shape, s))
+                cand_rows.append(idx + lo)
+        if not cand_scores:
+            empty = np.empty((len(q), 0), dtype=np.int64)
+            return empty.astype(np.float32), empty, empty
+
+        scores = np.concatenate(cand_scores, axis=1)
+        order = np.argsort(-scores, axis=1)[:, :k]
+        return (np.take_along_axis(scores, order, axis=1),
+                np.take_along_axis(np.concatenate(cand_stores, axis=1), order, axis=1),
+                np.take_along_axis(np.concatenate(cand_rows, axis=1), order, axis=1))
+
+    def search_many(self, queries, top_k=5):
+        # queries 為 (題組上下文, 題幹) 的列表；一次編碼、一次向量搜尋
+        texts = [f"{context} {stem}".strip() if context else stem.strip() for context, stem in queries]
+        if not texts:
+            return []
+
+        results = [None] * len(texts)
+        keys = [("similarity", self.npz_paths, self.model_name, normalize_query(t), top_k) for t in texts]
+        if self.cache is not None:
+            results = [self.cache.get_results(k) for k in keys]
+        pending = [i for i, r in enumerate(results) if r is None]
+        if not pending:
+            return results
+
+        if self.cache is not None:
+            q_embs = self.cache.encode(self.model, self.model_name, [texts[i] for i in pending])
+        else:
+            q_embs = self.model.encode([texts[i] for i in pending], convert_to_numpy=True)
+        all_scores, all_stores, all_rows = self._top_hits(q_embs, top_k*2)
+
+        for n, i in enumerate(pending):
+            query = texts[i]
+            rows = []
+            for score, s, idx in zip(all_scores[n], all_stores[n], all_rows[n]):
+                store = self.stores[s]
+                # 跳過和 query 一模一樣的；只有命中的列才解碼文字
+                if store.text("embed_texts", idx).strip() == query:
+                    continue
+                hit = store.row(idx)
+                del hit["embed_text"]
+                hit["score"] = float(score)
+                rows.append(hit)
+                if len(rows) >= top_k:
+                    break
+            results[i] = rows
+            if self.cache is not None:
+                self.cache.put_results(keys[i], rows)
+        return results
 
     def search(self, context, stem, top_k=5):
         # 用題組上下文+題幹做 query
-        query = f"{context} {stem}".strip() if context else stem.strip()
-        q_emb  = self.model.encode(query, convert_to_numpy=True)
-        hits   = util.semantic_search(q_emb, self.embs, top_k=top_k*2)[0]
-
-        print("\n🚀 相似題目結果（題組+題幹+選項對比）：\n")
-        shown = 0
-        for hit in hits:
-            idx, score = hit["corpus_id"], hit["score"]
-            # 跳過和 query 一模一樣的
-            if self.data["embed_texts"][idx].strip() == query.strip():
-                continue
-
-            shown += 1
-            print(f"{shown}. 📌 年度：{self.data['years'][idx]} | 科目：{self.data['subjects'][idx]} | 相似度：{score:.4f}")
-            if self.data["contexts"][idx]:
-                print(f"    題組背景：{self.data['contexts'][idx]}")
-            print(f"    題幹：{self.data['stem_texts'][idx]}")
-            print("    選項：")
-            for lab, txt in self.data["options"][idx].items():
-                print(f"      ({lab}) {txt}")
-            print()
-            if shown >= top_k:
-                break
-
-        if shown == 0:
-            print("⚠️ 沒有找到不同於輸入的相似題目。")
\ No newline at end of file
+        hits = self.search_many([(context, stem)], top_k=top_k)[0]
+
+        print_hits(hits)
+        return hits
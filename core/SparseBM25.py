@@ -0,0 +1,149 @@
+import os
+import json
+import numpy as np
+from scipy import sparse
+from core.Tokenizer import Tokenizer
+
+# BM25 的斷詞規則：轉小寫、去掉空白與標點符號（斷詞與快取見 core/Tokenizer.py）
+bm25_tokenizer = Tokenizer(lowercase=True, drop_noise=True)
+
+
+def tokenize(text):
+    return bm25_tokenizer.tokenize(text)
+
+
+def tokenize_many(texts, workers=None):
+    return bm25_tokenizer.tokenize_many(texts, workers=workers)
+
+
+# 以 CSR 倒排索引實作的 BM25，查詢只掃描含有查詢詞的 posting
+class SparseBM25:
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.vocab = {}
+        # CSR：詞 t 的 posting 位於 doc_ids[indptr[t]:indptr[t + 1]]
+        self.indptr = np.zeros(1, dtype=np.int64)
+        self.doc_ids = np.empty(0, dtype=np.int32)
+        self.tfs = np.empty(0, dtype=np.float32)
+        self.weights = np.empty(0, dtype=np.float32)
+        self.doc_len = np.empty(0, dtype=np.float32)
+        self._pending = []
+        self._matrix = None
+
+    @property
+    def corpus_size(self):
+        return len(self.doc_len) + len(self._pending)
+
+    def add_documents(self, tokenized_docs):
+        for tokens in tokenized_docs:
+            term_ids = [self.vocab.setdefault(w, len(self.vocab)) for w in tokens]
+            self._pending.append(np.asarray(term_ids, dtype=np.int64))
+
+    def _compact(self):
+        if not self._pending:
+            return
+        n_old = len(self.doc_len)
+        n_terms = len(self.vocab)
+
+        # 新文件轉成 (詞, 文件, tf) 三元組，再與既有 CSR 合併後依詞排序
+        new_terms, new_docs, new_tfs = [], [], []
+        for offset, term_ids in enumerate(self._pending):
+            uniq, counts = np.unique(term_ids, return_counts=True)
+            new_terms.append(uniq)
+            new_docs.append(np.full(len(uniq), n_old + offset, dtype=np.int32))
+            new_tfs.append(counts.astype(np.float32))
+        old_terms = np.repeat(np.arange(len(self.indptr) - 1), np.diff(self.indptr))
+
+        terms = np.concatenate([old_terms] + new_terms)
+        docs = np.concatenate([self.doc_ids] + new_docs)
+        tfs = np.concatenate([self.tfs] + new_tfs)
+        order = np.argsort(terms, kind="stable")
+
+        self.doc_ids = docs[order]
+        self.tfs = tfs[order]
+        self.indptr = np.concatenate([[0], np.cumsum(np.bincount(terms, minlength=n_terms))]).astype(np.int64)
+        self.doc_len = np.concatenate([self.doc_len, [len(t) for t in self._pending]]).astype(np.float32)
+        self._pending = []
+        self._matrix = None
+        self._compute_weights()
+
+    def _compute_weights(self):
+        # 預先算好每個 posting 的 BM25 權重，查詢時只需加總
+        n_docs = len(self.doc_len)
+        if n_docs == 0:
+            self.weights = np.empty(0, dtype=np.float32)
+            return
+        df = np.diff(self.indptr).astype(np.float64)
+        idf = np.log((n_docs - df + 0.5) / (df + 0.5) + 1.0)
+        avgdl = self.doc_len.mean() or 1.0
+        posting_idf = np.repeat(idf, np.diff(self.indptr))
+        norm = self.k1 * (1 - self.b + self.b * self.doc_len[self.doc_ids] / avgdl)
+        self.weights = (posting_idf * self.tfs * (self.k1 + 1) / (self.tfs + norm)).astype(np.float32)
+
+    def score(self, tokens):
+        # 回傳 (doc_ids, scores)，doc_ids 已排序；未出現的文件分數為 0
+        self._compact()
+        term_counts = {}
+        for w in tokens:
+            t = self.vocab.get(w)
+            if t is not None and t < len(self.indptr) - 1:
+                term_counts[t] = term_counts.get(t, 0) + 1
+        if not term_counts:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float32)
+
+        docs = np.concatenate([self.doc_ids[self.indptr[t]:self.indptr[t + 1]] for t in term_counts])
+        vals = np.concatenate([self.weights[self.indptr[t]:self.indptr[t + 1]] * c for t, c in term_counts.items()])
+        doc_ids, inverse = np.unique(docs, return_inverse=True)
+        return doc_ids, np.bincount(inverse, weights=vals).astype(np.float32)
+
+    def term_doc_matrix(self):
+        # (詞 × 文件) 的 BM25 權重矩陣，直接沿用 CSR 陣列，不複製 posting
+        self._compact()
+        if self._matrix is None:
+            self._matrix = sparse.csr_matrix(
+                (self.weights, self.doc_ids, self.indptr),
+                shape=(len(self.indptr) - 1, len(self.doc_len)))
+        return self._matrix
+
+    def score_many(self, tokenized_queries):
+        # 一次計算多個查詢：(查詢 × 詞) 計數矩陣乘上權重矩陣，得到 (查詢 × 文件) 稀疏分數
+        matrix = self.term_doc_matrix()
+        rows, cols = [], []
+        for i, tokens in enumerate(tokenized_queries):
+            for w in tokens:
+                t = self.vocab.get(w)
+                if t is not None and t < matrix.shape[0]:
+                    rows.append(i)
+                    cols.append(t)
+        queries = sparse.csr_matrix(
+            (np.ones(len(rows), dtype=np.float32), (rows, cols)),
+            shape=(len(tokenized_queries), matrix.shape[0]))
+        scores = (queries @ matrix).tocsr()
+        scores.sort_indices()
+        return scores
+
+    def get_scores(self, tokens):
+        doc_ids, scores = self.score(tokens)
+        dense = np.zeros(self.corpus_size, dtype=np.float32)
+        dense[doc_ids] = scores
+        return dense
+
+    def save(self, path):
+        self._compact()
+        os.makedirs(path, exist_ok=True)
+        for name in ("indptr", "doc_ids", "tfs", "weights", "doc_len"):
+            np.save(os.path.join(path, f"{name}.npy"), getattr(self, name))
+        terms = sorted(self.vocab, key=self.vocab.get)
+        with open(os.path.join(path, "vocab.json"), "w", encoding="utf-8") as f:
+            json.dump({"k1": self.k1, "b": self.b, "terms": terms}, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path, mmap_mode="r"):
+        with open(os.path.join(path, "vocab.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        bm25 = cls(k1=meta["k1"], b=meta["b"])
+        bm25.vocab = {w: i for i, w in enumerate(meta["terms"])}
+        for name in ("indptr", "doc_ids", "tfs", "weights", "doc_len"):
+            setattr(bm25, name, np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mmap_mode))
+        return bm25
@@ -0,0 +1,180 @@
+import os
+import json
+import time
+import hashlib
+
+MANIFEST_VERSION = 1
+
+# 以 manifest 驅動的增量建置：每個階段宣告輸入檔、參數與輸出檔，manifest 記下上次成功執行時
+#   inputs    每個輸入檔的內容 hash
+#   params    階段參數（模型名稱、top_k 等）
+#   outputs   每個輸出檔的內容 hash（用來發現輸出被手動改掉或刪掉）
+# 重跑時只有輸入內容、參數或輸出有變動的階段才會執行；上游重跑但輸出內容沒變時，下游照樣略過。
+# hash 另外以 (mtime_ns, size) 快取，檔案沒被碰過就不必重讀內容。
+
+
+def _file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class Fingerprints:
+    def __init__(self, cache=None):
+        # 絕對路徑 → [mtime_ns, size, sha256]
+        self.cache = dict(cache or {})
+        self.seen = set()
+
+    def file(self, path):
+        st = os.stat(path)
+        key = os.path.abspath(path)
+        self.seen.add(key)
+        cached = self.cache.get(key)
+        if cached and cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+            return cached[2]
+        digest = _file_sha256(path)
+        self.cache[key] = [st.st_mtime_ns, st.st_size, digest]
+        return digest
+
+    def __call__(self, path):
+        # 資料夾（例如欄式向量檔）以裡面每個檔案的相對路徑與 hash 組成；不存在時回傳 None
+        if os.path.isdir(path):
+            h = hashlib.sha256()
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    full = os.path.join(root, name)
+                    h.update(os.path.relpath(full, path).replace(os.sep, "/").encode("utf-8"))
+                    h.update(self.file(full).encode("ascii"))
+            return h.hexdigest()
+        if os.path.exists(path):
+            return self.file(path)
+        return None
+
+    def prune(self):
+        # 只保留這次有用到的檔案，避免刪掉的舊快照一直留在 manifest 裡
+        self.cache = {k: v for k, v in self.cache.items() if k in self.seen}
+
+
+class Stage:
+    def __init__(self, name, run, inputs=(), outputs=(), params=None):
+        # run 不帶參數，需要的路徑與設定由呼叫端用 closure 帶進去
+        self.name = name
+        self.run = run
+        self.inputs = [str(p) for p in inputs]
+        self.outputs = [str(p) for p in outputs]
+        self.params = dict(params or {})
+
+
+class StageGraph:
+    def __init__(self, manifest_path):
+        self.manifest_path = str(manifest_path)
+        self.stages = []
+        self.records = {}
+        cache = {}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, encoding="utf-8") as f:
+                manifest = json.load(f)
+            if manifest.get("version") == MANIFEST_VERSION:
+                self.records = manifest.get("stages", {})
+                cache = manifest.get("fingerprints", {})
+        self.fingerprint = Fingerprints(cache)
+
+    def add(self, name, run, inputs=(), outputs=(), params=None):
+        # 依加入順序執行，因此上游階段要先加入
+        if any(s.name == name for s in self.stages):
+            raise ValueError(f"Duplicate stage name: {name}")
+        stage = Stage(name, run, inputs, outputs, params)
+        self.stages.append(stage)
+        return stage
+
+    def _save(self):
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": MANIFEST_VERSION, "stages": self.records,
+                       "fingerprints": self.fingerprint.cache}, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+    def _reason(self, stage, input_hashes):
+        # 回傳需要重跑的原因；None 表示可以略過
+        record = self.records.get(stage.name)
+        if record is None:
+            return "尚未執行過"
+        if record.get("params") != stage.params:
+            return "參數變更"
+        old_inputs = record.get("inputs", {})
+        for path, digest in input_hashes.items():
+            if old_inputs.get(path) != digest:
+                return f"輸入變更：{path}"
+        if set(old_inputs) != set(input_hashes):
+            return "輸入清單變更"
+        old_outputs = record.get("outputs", {})
+        for path in stage.outputs:
+            digest = self.fingerprint(path)
+            if digest is None:
+                return f"輸出不存在：{path}"
+            if old_outputs.get(path) != digest:
+                return f"輸出被修改：{path}"
+        return None
+
+    def plan(self):
+        # 只判斷、不執行（不考慮上游重跑後輸出內容是否會改變）
+        return [(stage.name, self._reason(stage, {p: self.fingerprint(p) for p in stage.inputs}))
+                for stage in self.stages]
+
+    def run(self, force=()):
+        force = set(force)
+        failed_outputs = set()
+        report = []
+        for stage in self.stages:
+            start = time.perf_counter()
+            input_hashes = {p: self.fingerprint(p) for p in stage.inputs}
+            missing = [p for p, digest in input_hashes.items() if digest is None]
+            blocked = [p for p in stage.inputs if p in failed_outputs]
+
+            if blocked or missing:
+                status, reason = "blocked", f"上游失敗：{blocked[0]}" if blocked else f"缺少輸入：{missing[0]}"
+                failed_outputs.update(stage.outputs)
+            else:
+                reason = "強制重跑" if stage.name in force else self._reason(stage, input_hashes)
+                if reason is None:
+                    status = "skipped"
+                else:
+                    try:
+                        stage.run()
+                    except Exception as e:
+                        status, reason = "failed", f"{reason}；{type(e).__name__}: {e}"
+                        failed_outputs.update(stage.outputs)
+                        # 失敗的階段不留紀錄，下次一定重跑
+                        self.records.pop(stage.name, None)
+                    else:
+                        status = "ran"
+                        self.records[stage.name] = {
+                            "inputs": input_hashes,
+                            "params": stage.params,
+                            "outputs": {p: self.fingerprint(p) for p in stage.outputs},
+                            "seconds": time.perf_counter() - start,
+                            "finished_at": time.time(),
+                        }
+                    # 每個階段結束就寫回 manifest，中斷後重跑不會重做已完成的階段
+                    self._save()
+            report.append({"stage": stage.name, "status": status, "reason": reason,
+                           "seconds": time.perf_counter() - start})
+        self.fingerprint.prune()
+        self._save()
+        print_report(report)
+        return report
+
+
+def print_report(report):
+    width = max([len(r["stage"]) for r in report] + [5])
+    print(f"\n{'stage'.ljust(width)}  {'status':8} {'seconds':>8}  reason")
+    for r in report:
+        print(f"{r['stage'].ljust(width)}  {r['status']:8} {r['seconds']:8.2f}  {r['reason'] or ''}")
+    counts = {}
+    for r in report:
+        counts[r["status"]] = counts.get(r["status"], 0) + 1
+    total = sum(r["seconds"] for r in report)
+    print(f"共 {len(report)} 個階段（{', '.join(f'{k} {v}' for k, v in counts.items())}），耗時 {total:.1f}s")
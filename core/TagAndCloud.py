@@ -1,32 +1,64 @@
 import json
-import jieba
 from collections import Counter
 import matplotlib.pyplot as plt
 import matplotlib.font_manager as fm
 from wordcloud import WordCloud
 from keybert import KeyBERT
-from sklearn.feature_extraction.text import TfidfVectorizer
+from core.ModelRegistry import keybert_backend
+from core.KeywordTagger import KeywordTagger, store_doc_embeddings
+from core.Tokenizer import Tokenizer
+from core.QuestionStore import iter_questions
+from core.TfidfModel import TfidfModel, file_year, load_year_questions
 
 
 class QuizAnalyzer:
     def __init__(self,
                  stopwords_path: str = None,
-                 keybert_model: str = 'paraphrase-multilingual-MiniLM-L12-v2'):
+                 keybert_model: str = 'paraphrase-multilingual-MiniLM-L12-v2',
+                 batched: bool = True):
         self.stopwords = set()
         if stopwords_path:
             with open(stopwords_path, 'r', encoding='utf-8') as f:
                 self.stopwords = {w.strip() for w in f if w.strip()}
-        self.kb = KeyBERT(keybert_model)
+        self.keybert_model = keybert_model
+        self.batched = batched
+        self._kb = None
+        self._tagger = None
+        self._tokenizer = None
+        self.tfidf_model = None
+
+    @property
+    def kb(self):
+        if self._kb is None:
+            self._kb = KeyBERT(keybert_backend(self.keybert_model))
+        return self._kb
+
+    @property
+    def tagger(self):
+        # 整批抽標籤，候選詞向量跨年度快取（見 core/KeywordTagger.py）
+        if self._tagger is None:
+            self._tagger = KeywordTagger(self.keybert_model)
+        return self._tagger
+
+    @property
+    def tokenizer(self):
+        # 斷詞結果依文字與停用詞版本快取（見 core/Tokenizer.py）
+        if self._tokenizer is None:
+            self._tokenizer = Tokenizer(stopwords=self.stopwords, min_len=2)
+        return self._tokenizer
 
     def tokenize(self, text: str) -> list[str]:
-        return [w for w in jieba.lcut(text)
-                if w.strip() and w not in self.stopwords and len(w.strip()) > 1]
+        return self.tokenizer.tokenize(text)
+
+    def tokenize_many(self, texts: list[str], workers: int = None) -> list[list[str]]:
+        return self.tokenizer.tokenize_many(texts, workers=workers)
 
     def load_questions_from_json(self, json_path: str) -> tuple[list[str], list[dict]]:
-        with open(json_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        # .json 與 .jsonl 皆可（見 core/QuestionStore.py）
+        data = []
         questions = []
-        for item in data:
+        for item in iter_questions(json_path):
+            data.append(item)
             if 'stem' in item:
                 combined = ''
                 if item.get('group_context'):
@@ -37,10 +69,16 @@ class QuizAnalyzer:
 
     def extract_tags_keybert(self,
                              texts: list[str],
-                             top_k: int = 5) -> list[list[str]]:
+                             top_k: int = 5,
+                             doc_embeddings=None) -> list[list[str]]:
+        token_lists = self.tokenize_many(texts)
+        if self.batched:
+            docs = [' '.join(tokens) for tokens in token_lists]
+            kws_per_doc = self.tagger.extract(docs, top_n=top_k, ngram_range=(1, 1), doc_embeddings=doc_embeddings)
+            return [[kw for kw, _ in kws] for kws in kws_per_doc]
+
         all_tags = []
-        for txt in texts:
-            tokens = self.tokenize(txt)
+        for tokens in token_lists:
             joined = ' '.join(tokens)
             kws = self.kb.extract_keywords(
                 joined,
@@ -54,9 +92,13 @@ class QuizAnalyzer:
     def tag_json_and_save(self,
                           input_json: str,
                           output_path: str,
-                          top_k: int = 5) -> None:
+                          top_k: int = 5,
+                          store_path: str = None) -> None:
         questions, raw = self.load_questions_from_json(input_json)
-        tags = self.extract_tags_keybert(questions, top_k=top_k)
+        doc_embeddings = None
+        if store_path and self.batched:
+            doc_embeddings = store_doc_embeddings([item for item in raw if 'stem' in item], store_path)
+        tags = self.extract_tags_keybert(questions, top_k=top_k, doc_embeddings=doc_embeddings)
         all_tags_flat = []
         for item, tg in zip(raw, tags):
             item['tags'] = tg
@@ -94,21 +136,28 @@ class QuizAnalyzer:
             plt.show()
         plt.close()
 
+    def fit_tfidf(self, json_paths: list[str], years: list = None) -> TfidfModel:
+        # 所有年度共用一個 TF-IDF（見 core/TfidfModel.py），各年度詞雲的分數才能互相比較
+        self.tfidf_model = TfidfModel.from_questions(load_year_questions(json_paths, years=years), self.tokenizer)
+        return self.tfidf_model
+
     def generate_wordcloud_tfidf(self,
                                  texts: list[str],
                                  font_path: str,
                                  top_k: int = None,
-                                 output_path: str = None) -> None:
-        corpus = [' '.join(self.tokenize(t)) for t in texts]
-        vect = TfidfVectorizer()
-        mat = vect.fit_transform(corpus)
-        names = vect.get_feature_names_out()
-        scores = mat.sum(axis=0).A1
-        tfidf_dict = dict(zip(names, scores))
-        if top_k:
-            tfidf_dict = dict(sorted(tfidf_dict.items(),
-                                     key=lambda x: x[1],
-                                     reverse=True)[:top_k])
+                                 output_path: str = None,
+                                 year=None) -> None:
+        # 已用 fit_tfidf 建好整個題庫的模型且指定年度時，取該年度的列加總，分數跨年度可比；
+        # 否則和 TagGenerate 一樣只用這批題目計算
+        if self.tfidf_model is not None and year is not None:
+            tfidf_dict = self.tfidf_model.top_terms(top_k or len(self.tfidf_model.vocab), year=year)
+            if not tfidf_dict:
+                raise ValueError(f"TF-IDF 模型中沒有 {year} 年度的題目，請用含該年度檔的 fit_tfidf 重建模型")
+        else:
+            token_lists = self.tokenize_many(texts)
+            n = len(token_lists)
+            local = TfidfModel.fit(token_lists, range(n), [''] * n, [''] * n)
+            tfidf_dict = local.top_terms(top_k or len(local.vocab))
         wc = WordCloud(font_path=font_path,
                        background_color='white',
                        width=800,
@@ -134,19 +183,23 @@ class QuizAnalyzer:
                               json_path: str,
                               font_path: str,
                               top_k: int = None,
-                              output_path: str = None) -> None:
+                              output_path: str = None,
+                              year=None) -> None:
+        # 年度未給時由檔名取得（106.json → 106），與 fit_tfidf 標記的年度一致
         texts, _ = self.load_questions_from_json(json_path)
         self.generate_wordcloud_tfidf(
             texts,
             font_path=font_path,
             top_k=top_k,
-            output_path=output_path
+            output_path=output_path,
+            year=year or file_year(json_path)
         )
 
 
 if __name__ == '__main__':
     qa = QuizAnalyzer(stopwords_path='stopwords.txt')
     years = ['106', '107', '108', '109', '110', '111', '113']
+    qa.fit_tfidf([year + '.json' for year in years], years=years)
     #year = input('Please type the year of test:')
     for i in range(0,7):
         year = years[i]
@@ -1,41 +1,66 @@
 import json
-import jieba
 from collections import Counter
 import matplotlib.pyplot as plt
 from wordcloud import WordCloud
 from keybert import KeyBERT
 from matplotlib import font_manager
-from sklearn.feature_extraction.text import TfidfVectorizer
 import os
+from core.QuestionStore import iter_questions
+from core.ModelRegistry import keybert_backend
+from core.KeywordTagger import KeywordTagger, store_doc_embeddings
+from core.Tokenizer import BUILTIN_JUNK, analyzer_tokenizer
+from core.TfidfModel import TfidfModel, load_year_questions
 
 
 class QuizAnalyzer:
-    def __init__(self, stopwords_path=None, keybert_model='paraphrase-multilingual-MiniLM-L12-v2'):
+    def __init__(self, stopwords_path=None, keybert_model='paraphrase-multilingual-MiniLM-L12-v2', batched=True):
         self.stopwords = set()
         if stopwords_path:
             with open(stopwords_path, 'r', encoding='utf-8') as f:
                 self.stopwords = {w.strip() for w in f if w.strip()}
 
         # ✅ 加入內建雜訊詞（過濾掉「何者」、「正確」、「應選」等）
-        self.builtin_junk = {
-            '何者', '正確', '錯誤', '以下', '哪些', '有關', '關於', '描述',
-            '應選', '符合', '選項', '依據', '資料', '圖', '表', '請問',
-            '是何者', '為何', '敘述', '應為', '選出', '判斷', '說明'
-        }
+        self.builtin_junk = set(BUILTIN_JUNK)
+
+        self.keybert_model = keybert_model
+        # batched=True：整批抽標籤（core/KeywordTagger.py）；False 為逐題呼叫 KeyBERT 的舊做法
+        self.batched = batched
+        self._kb = None
+        self._tagger = None
+        self._tokenizer = None
+
+    @property
+    def kb(self):
+        # 第一次抽標籤時才建立，並與檢索端共用同一份 MiniLM
+        if self._kb is None:
+            self._kb = KeyBERT(keybert_backend(self.keybert_model))
+        return self._kb
 
-        self.kb = KeyBERT(keybert_model)
+    @property
+    def tagger(self):
+        if self._tagger is None:
+            self._tagger = KeywordTagger(self.keybert_model)
+        return self._tagger
+
+    @property
+    def tokenizer(self):
+        # 斷詞結果依文字與停用詞版本快取（見 core/Tokenizer.py），詞雲與標籤共用同一份
+        if self._tokenizer is None:
+            self._tokenizer = analyzer_tokenizer(self.stopwords | self.builtin_junk)
+        return self._tokenizer
 
     def tokenize(self, text: str) -> list[str]:
-        return [
-            w for w in jieba.lcut(text)
-            if w.strip() and w not in self.stopwords and w not in self.builtin_junk and len(w.strip()) > 1
-        ]
+        return self.tokenizer.tokenize(text)
+
+    def tokenize_many(self, texts: list[str], workers: int = None) -> list[list[str]]:
+        return self.tokenizer.tokenize_many(texts, workers=workers)
 
     def load_questions_from_json(self, json_path: str) -> tuple[list[str], list[dict]]:
-        with open(json_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        # .json 與 .jsonl 皆可（見 core/QuestionStore.py）
+        data = []
         questions = []
-        for item in data:
+        for item in iter_questions(json_path):
+            data.append(item)
             if 'stem' in item:
                 combined = ''
                 if item.get('group_context'):
@@ -44,10 +69,29 @@ class QuizAnalyzer:
                 questions.append(combined)
         return questions, data
 
-    def extract_tags_keybert(self, texts: list[str], top_k: int = 15) -> list[list[str]]:
+    def fit_tfidf(self, json_paths: list[str], output_path: str = None, trend_path: str = None,
+                  top_k_trend: int = 20, years: list = None) -> TfidfModel:
+        # 整個題庫只建一次 TF-IDF（見 core/TfidfModel.py），斷詞結果與詞雲、標籤共用同一份快取；
+        # 每列標上所在年度檔的年度（years 未給時由檔名取得），詞雲才能依 process_year_file 的年度切片
+        items = load_year_questions(json_paths, years=years)
+        model = TfidfModel.from_questions(items, self.tokenizer)
+        if output_path:
+            model.save(output_path)
+        if trend_path:
+            model.write_trend_report(trend_path, top_k=top_k_trend)
+        return model
+
+    def extract_tags_keybert(self, texts: list[str], top_k: int = 15, doc_embeddings=None,
+                             token_lists: list[list[str]] = None) -> list[list[str]]:
+        if token_lists is None:
+            token_lists = self.tokenize_many(texts)
+        if self.batched:
+            docs = [' '.join(tokens) for tokens in token_lists]
+            kws_per_doc = self.tagger.extract(docs, top_n=top_k, ngram_range=(1, 2), doc_embeddings=doc_embeddings)
+            return [[kw for kw, _ in kws if kw and len(kw) > 1 and kw not in self.stopwords] for kws in kws_per_doc]
+
         all_tags = []
-        for txt in texts:
-            tokens = self.tokenize(txt)
+        for tokens in token_lists:
             if not tokens:
                 all_tags.append([])
                 continue
@@ -63,9 +107,19 @@ class QuizAnalyzer:
         return all_tags
 
 
-    def tag_json_and_save(self, input_json: str, output_json: str, top_k: int = 15) -> list[str]:
+    def tag_json_and_save(self, input_json: str, output_json: str, top_k: int = 15,
+                          store_path: str = None) -> list[str]:
         questions, raw = self.load_questions_from_json(input_json)
-        tags = self.extract_tags_keybert(questions, top_k=top_k)
+        return self.tag_and_save(questions, raw, output_json, top_k=top_k, store_path=store_path)
+
+    def tag_and_save(self, questions: list[str], raw: list[dict], output_json: str, top_k: int = 15,
+                     store_path: str = None, token_lists: list[list[str]] = None) -> list[str]:
+        # 有向量檔時直接用裡面的文件向量，不必重新編碼每一題
+        doc_embeddings = None
+        if store_path and self.batched:
+            doc_embeddings = store_doc_embeddings([item for item in raw if 'stem' in item], store_path)
+        tags = self.extract_tags_keybert(questions, top_k=top_k, doc_embeddings=doc_embeddings,
+                                         token_lists=token_lists)
 
         all_tags_flat = []
         for item, tag_list in zip(raw, tags):
@@ -111,15 +165,21 @@ class QuizAnalyzer:
                                  texts: list[str],
                                  font_path: str,
                                  top_k: int,
-                                 output_path: str) -> None:
-        corpus = [' '.join(self.tokenize(t)) for t in texts]
-        vect = TfidfVectorizer()
-        mat = vect.fit_transform(corpus)
-        names = vect.get_feature_names_out()
-        scores = mat.sum(axis=0).A1
-        tfidf_dict = dict(zip(names, scores))
-        if top_k:
-            tfidf_dict = dict(sorted(tfidf_dict.items(), key=lambda x: x[1], reverse=True)[:top_k])
+                                 output_path: str,
+                                 token_lists: list[list[str]] = None,
+                                 tfidf_model: TfidfModel = None,
+                                 year=None) -> None:
+        # 有整個題庫的 TF-IDF 模型時直接取該年度的列加總，分數跨年度可比；沒給模型時才只用這批題目計算
+        if tfidf_model is not None:
+            tfidf_dict = tfidf_model.top_terms(top_k or len(tfidf_model.vocab), year=year)
+            if not tfidf_dict:
+                raise ValueError(f"TF-IDF 模型中沒有 {year} 年度的題目，請用含該年度檔的 fit_tfidf 重建模型")
+        else:
+            if token_lists is None:
+                token_lists = self.tokenize_many(texts)
+            n = len(token_lists)
+            local = TfidfModel.fit(token_lists, range(n), [''] * n, [''] * n)
+            tfidf_dict = local.top_terms(top_k or len(local.vocab))
         wc = WordCloud(font_path=font_path,
                        background_color='white',
                        width=800,
@@ -128,35 +188,87 @@ class QuizAnalyzer:
         wc.to_file(output_path)
         print(f"[INFO] 詞雲圖儲存於 {output_path}")
 
+    @staticmethod
+    def year_output_paths(year, output_dir: str = './results') -> dict:
+        return {
+            'tags': os.path.join(output_dir, f"{year}_with_tags.json"),
+            'wordcloud': os.path.join(output_dir, 'wordclouds', f"{year}.png"),
+            'keywords': os.path.join(output_dir, 'keywords', f"{year}.png"),
+        }
+
     def process_year_file(self, year: int,
                           font_path: str = 'NotoSansTC-Regular.otf',
                           top_k_wordcloud: int = 100,
-                          top_k_tags: int = 15):
-        input_json = f"./Quiz_json/{year}.json"
-        output_json = f"./results/{year}_with_tags.json"
-        wordcloud_path = f"./results/wordclouds/{year}.png"
-        tag_bar_path = f"./results/keywords/{year}.png"
+                          top_k_tags: int = 15,
+                          input_json: str = None,
+                          output_dir: str = './results',
+                          store_path: str = None,
+                          tfidf_model: TfidfModel = None):
+        input_json = input_json or f"./Quiz_clean_json/{year}.json"
+        paths = self.year_output_paths(year, output_dir)
+        output_json = paths['tags']
+        wordcloud_path = paths['wordcloud']
+        tag_bar_path = paths['keywords']
+        os.makedirs(os.path.dirname(wordcloud_path), exist_ok=True)
+        os.makedirs(os.path.dirname(tag_bar_path), exist_ok=True)
 
         print(f"[INFO] 處理中: {input_json}")
-        questions, _ = self.load_questions_from_json(input_json)
+        # 題目只讀一次、只斷一次詞，詞雲與標籤共用
+        questions, raw = self.load_questions_from_json(input_json)
+        token_lists = self.tokenize_many(questions)
 
         # 詞雲圖
-        self.generate_wordcloud_tfidf(questions, font_path, top_k_wordcloud, wordcloud_path)
+        self.generate_wordcloud_tfidf(questions, font_path, top_k_wordcloud, wordcloud_path, token_lists=token_lists,
+                                      tfidf_model=tfidf_model, year=year)
 
         # 標籤統計
-        all_tags = self.tag_json_and_save(input_json, output_json, top_k=top_k_tags)
+        all_tags = self.tag_and_save(questions, raw, output_json, top_k=top_k_tags, store_path=store_path,
+                                     token_lists=token_lists)
         self.plot_top_tags(all_tags, output_path=tag_bar_path)
 
 
 if __name__ == '__main__':
-    qa = QuizAnalyzer(stopwords_path='./core/stopwords.txt')
-
-    for year in range(106, 114):
-        if year == 112: continue
-        qa.process_year_file(
-            year=year,
-            font_path='C:/Windows/Fonts/msjh.ttc',
-            top_k_wordcloud=100,
-            top_k_tags=15
-        )
+    from core.StageGraph import StageGraph
+
+    stopwords_path = './core/stopwords.txt'
+    font_path = 'C:/Windows/Fonts/msjh.ttc'
+    qa = QuizAnalyzer(stopwords_path=stopwords_path)
 
+    # 只重跑 JSON、停用詞或參數有變動的年度（紀錄在 results/tag_manifest.json）
+    graph = StageGraph('./results/tag_manifest.json')
+    params = {'font_path': font_path, 'top_k_wordcloud': 100, 'top_k_tags': 15,
+              'keybert_model': qa.keybert_model}
+    years = [year for year in range(106, 114) if year != 112]
+    # 用清理後的 JSON：Quiz_clean_Embedding_npz 的向量就是由它算出來的，文件向量才能直接沿用
+    input_jsons = [f"./Quiz_clean_json/{year}.json" for year in years]
+
+    # 全題庫的 TF-IDF 與年度趨勢只算一次，各年度詞雲取其中的列加總
+    tfidf_path = './results/tfidf.npz'
+    graph.add('tfidf', lambda: qa.fit_tfidf(input_jsons, tfidf_path, './results/tfidf_trends.json', years=years),
+              inputs=input_jsons + [stopwords_path], outputs=[tfidf_path, './results/tfidf_trends.json'])
+    tfidf = {}
+
+    def tfidf_model():
+        if 'model' not in tfidf:
+            tfidf['model'] = TfidfModel.load(tfidf_path)
+        return tfidf['model']
+
+    for year, input_json in zip(years, input_jsons):
+        store_path = f"./Quiz_clean_Embedding_npz/{year}_clean.npz"
+        store_path = store_path if os.path.exists(store_path) else None
+        graph.add(
+            f"tag:{year}",
+            lambda year=year, input_json=input_json, store_path=store_path: qa.process_year_file(
+                year=year,
+                font_path=font_path,
+                top_k_wordcloud=100,
+                top_k_tags=15,
+                input_json=input_json,
+                store_path=store_path,
+                tfidf_model=tfidf_model()
+            ),
+            inputs=[input_json, stopwords_path, tfidf_path] + ([store_path] if store_path else []),
+            outputs=list(QuizAnalyzer.year_output_paths(year).values()),
+            params=params
+        )
+    graph.run()
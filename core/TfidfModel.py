@@ -0,0 +1,220 @@
+import os
+import re
+import json
+import glob
+import argparse
+import numpy as np
+from scipy import sparse
+from core.QuestionKey import question_key
+from core.QuestionStore import iter_questions
+from core.Tokenizer import analyzer_tokenizer
+
+MODEL_VERSION = 1
+
+# 整個題庫只建一次的 TF-IDF：
+#   - 詞表與 idf 以全部題目計算，各年度、各科目的分數因此可以互相比較
+#   - 文件-詞矩陣（CSR，每列 L2 正規化，與 sklearn TfidfVectorizer 預設相同）存成 .npz
+#   - 某年度 / 某科目的詞權重 = 對應列的加總，用一次稀疏矩陣乘法算出所有分組
+#   - 年度間的趨勢直接由同一個矩陣算，不必重新斷詞
+# 每列的年度取自所在的年度檔（106.json → 106），不看題目裡的 year：頁尾抓不到時題目的 year 是 unknown。
+# 用法：python -m core.TfidfModel --json Quiz_clean_json/*.json --output results/tfidf.npz --trend results/tfidf_trends.json
+
+
+def question_text(q):
+    # 與 QuizAnalyzer.load_questions_from_json 相同：題組說明 + 題幹
+    text = ''
+    if q.get('group_context'):
+        text += q['group_context'].strip() + ' '
+    return text + q['stem'].strip()
+
+
+def file_year(path):
+    # 年度檔名開頭的年份，例如 106.json、106.jsonl、106_clean.npz；合併檔（all.json）回傳 None
+    match = re.match(r"(\d{3,4})(?!\d)", os.path.basename(str(path)))
+    return match.group(1) if match else None
+
+
+def load_year_questions(json_paths, years=None):
+    # 讀入各年度檔的題目，year 改成該檔的年度（years 與 json_paths 一一對應，未給時由檔名取得）；
+    # 檔案看不出年度時保留題目原本的 year
+    if isinstance(json_paths, (str, os.PathLike)):
+        json_paths = [json_paths]
+    years = years or [file_year(p) for p in json_paths]
+    questions = []
+    for path, year in zip(json_paths, years):
+        for q in iter_questions(path):
+            if 'stem' in q:
+                questions.append(q if year is None else {**q, 'year': str(year)})
+    return questions
+
+
+class TfidfModel:
+    def __init__(self, vocab, idf, matrix, keys, years, subjects, tokenizer_version=None):
+        self.vocab = list(vocab)
+        self.idf = np.asarray(idf, dtype=np.float32)
+        self.matrix = sparse.csr_matrix(matrix, dtype=np.float32)
+        self.keys = list(keys)
+        self.years = np.asarray([str(y) for y in years])
+        self.subjects = np.asarray([str(s) for s in subjects])
+        self.tokenizer_version = tokenizer_version
+
+    def __len__(self):
+        return self.matrix.shape[0]
+
+    @classmethod
+    def fit(cls, token_lists, keys, years, subjects, tokenizer_version=None):
+        vocab = {}
+        indptr, indices = [0], []
+        for tokens in token_lists:
+            indices.extend(vocab.setdefault(w, len(vocab)) for w in tokens)
+            indptr.append(len(indices))
+        n_docs = len(indptr) - 1
+        counts = sparse.csr_matrix((np.ones(len(indices), dtype=np.float32), indices, indptr),
+                                   shape=(n_docs, len(vocab)))
+        counts.sum_duplicates()
+
+        # 詞表依字典序排列，結果與輸入順序無關
+        terms = sorted(vocab)
+        order = np.array([vocab[t] for t in terms], dtype=np.int64)
+        counts = counts[:, order].tocsr()
+
+        # smooth idf：ln((1 + n) / (1 + df)) + 1
+        df = np.bincount(counts.indices, minlength=len(terms))
+        idf = np.log((1 + n_docs) / (1 + df)) + 1
+        tfidf = counts.multiply(idf[None, :]).tocsr()
+        norms = np.sqrt(np.asarray(tfidf.multiply(tfidf).sum(axis=1)).ravel())
+        tfidf = sparse.diags(1 / np.maximum(norms, 1e-12)) @ tfidf
+        return cls(terms, idf, tfidf, keys, years, subjects, tokenizer_version=tokenizer_version)
+
+    @classmethod
+    def from_questions(cls, questions, tokenizer, workers=None):
+        token_lists = tokenizer.tokenize_many([question_text(q) for q in questions], workers=workers)
+        return cls.fit(token_lists, [question_key(q) for q in questions], [q.get('year', '') for q in questions],
+                       [q.get('subject', '') for q in questions], tokenizer_version=tokenizer.version)
+
+    def save(self, path):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, data=self.matrix.data, indices=self.matrix.indices, indptr=self.matrix.indptr,
+                     shape=np.asarray(self.matrix.shape), idf=self.idf,
+                     meta=np.asarray(json.dumps({
+                         "version": MODEL_VERSION,
+                         "vocab": self.vocab,
+                         "keys": self.keys,
+                         "years": self.years.tolist(),
+                         "subjects": self.subjects.tolist(),
+                         "tokenizer_version": self.tokenizer_version,
+                     }, ensure_ascii=False)))
+        os.replace(tmp_path, path)
+        return path
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as arr:
+            meta = json.loads(str(arr["meta"]))
+            if meta.get("version") != MODEL_VERSION:
+                raise ValueError(f"Unsupported TF-IDF model version: {meta.get('version')}")
+            matrix = sparse.csr_matrix((arr["data"], arr["indices"], arr["indptr"]), shape=tuple(arr["shape"]))
+            idf = arr["idf"]
+        return cls(meta["vocab"], idf, matrix, meta["keys"], meta["years"], meta["subjects"],
+                   tokenizer_version=meta.get("tokenizer_version"))
+
+    def _mask(self, year=None, subject=None):
+        mask = np.ones(len(self), dtype=bool)
+        if year is not None:
+            mask &= self.years == str(year)
+        if subject is not None:
+            mask &= self.subjects == str(subject)
+        return mask
+
+    def weights(self, year=None, subject=None):
+        # 符合條件的列加總，回傳長度為詞表大小的向量
+        mask = self._mask(year, subject)
+        return np.asarray(self.matrix[np.flatnonzero(mask)].sum(axis=0)).ravel()
+
+    def slice_weights(self, by="year"):
+        # 一次算出每個分組的詞權重：分組指示矩陣（分組 × 題目）乘上文件-詞矩陣
+        labels = self.years if by == "year" else self.subjects
+        groups, inverse = np.unique(labels, return_inverse=True)
+        indicator = sparse.csr_matrix((np.ones(len(labels), dtype=np.float32), (inverse, np.arange(len(labels)))),
+                                      shape=(len(groups), len(labels)))
+        sums = (indicator @ self.matrix).toarray()
+        counts = np.bincount(inverse, minlength=len(groups))
+        return {str(g): (sums[i], int(counts[i])) for i, g in enumerate(groups)}
+
+    def top_terms(self, top_k=100, year=None, subject=None):
+        w = self.weights(year, subject)
+        top_k = min(top_k, int(np.count_nonzero(w)))
+        if top_k <= 0:
+            return {}
+        part = np.argpartition(-w, top_k - 1)[:top_k]
+        part = part[np.argsort(-w[part], kind="stable")]
+        return {self.vocab[i]: float(w[i]) for i in part}
+
+    def trend_report(self, top_k=20, years=None):
+        # 各年度以平均每題的權重比較（題數不同的年度才可比），列出相鄰年度與首尾年度間上升 / 下降最多的詞
+        slices = self.slice_weights("year")
+        unknown = {y: n for y, (_, n) in slices.items() if not y.isdigit()}
+        if unknown and years is None:
+            print(f"[WARN] 年度不明的題目不列入趨勢：{unknown}（請由年度檔建立模型，見 load_year_questions）")
+        years = sorted(years or [y for y in slices if y.isdigit()], key=int)
+        means = {y: slices[y][0] / max(slices[y][1], 1) for y in years if y in slices}
+        years = [y for y in years if y in means]
+
+        def compare(a, b):
+            delta = means[b] - means[a]
+            order = np.argsort(-delta, kind="stable")
+
+            def entry(i):
+                return {"term": self.vocab[i], "from": float(means[a][i]), "to": float(means[b][i]),
+                        "delta": float(delta[i])}
+            return {
+                "from": a,
+                "to": b,
+                "rising": [entry(i) for i in order[:top_k] if delta[i] > 0],
+                "falling": [entry(i) for i in order[::-1][:top_k] if delta[i] < 0],
+            }
+
+        return {
+            "years": years,
+            "questions_per_year": {y: slices[y][1] for y in years},
+            "vocab_size": len(self.vocab),
+            "pairs": [compare(a, b) for a, b in zip(years, years[1:])],
+            "overall": compare(years[0], years[-1]) if len(years) > 1 else None,
+        }
+
+    def write_trend_report(self, path, top_k=20, years=None):
+        report = self.trend_report(top_k=top_k, years=years)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"[INFO] 年度趨勢報告儲存於 {path}")
+        return report
+
+
+def build_model(json_paths, output_path, stopwords_path=None, trend_path=None, top_k=20, workers=None, years=None):
+    stopwords = set()
+    if stopwords_path:
+        with open(stopwords_path, 'r', encoding='utf-8') as f:
+            stopwords = {w.strip() for w in f if w.strip()}
+    tokenizer = analyzer_tokenizer(stopwords)
+    questions = load_year_questions(json_paths, years=years)
+    model = TfidfModel.from_questions(questions, tokenizer, workers=workers)
+    model.save(output_path)
+    print(f"[INFO] TF-IDF 模型（{len(model)} 題、{len(model.vocab)} 詞）儲存於 {output_path}")
+    if trend_path:
+        model.write_trend_report(trend_path, top_k=top_k)
+    return model
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="以整個題庫建立 TF-IDF 並輸出年度趨勢")
+    parser.add_argument("--json", nargs="+", help="各年度的題目檔，預設為 Quiz_clean_json/*.json")
+    parser.add_argument("--output", default="results/tfidf.npz")
+    parser.add_argument("--trend", default="results/tfidf_trends.json")
+    parser.add_argument("--stopwords", default="core/stopwords.txt")
+    parser.add_argument("--top-k", type=int, default=20)
+    parser.add_argument("--workers", type=int)
+    args = parser.parse_args()
+    json_paths = args.json or sorted(glob.glob("Quiz_clean_json/*.json"))
+    build_model(json_paths, args.output, stopwords_path=args.stopwords, trend_path=args.trend, top_k=args.top_k,
+                workers=args.workers)
@@ -0,0 +1,156 @@
+import os
+import json
+import hashlib
+import sqlite3
+from contextlib import closing, contextmanager
+import threading
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor
+import jieba
+
+# 共用的 jieba 斷詞服務：
+#   - 詞典在每個行程只載入一次（jieba 本身是第一次 lcut 時才載入）
+#   - tokenize_many 先查 SQLite 斷詞快取，沒斷過的文字才斷詞；量大時分散到多個行程
+#   - 快取 key 為 hash(斷詞設定版本 + 文字)：停用詞或過濾規則一改，版本就變，舊結果自然不會被用到
+# TF-IDF、KeyBERT 標籤與 BM25 索引都從這裡取詞。
+
+TOKEN_CACHE_PATH = os.getenv("QUIZHUNTER_TOKEN_CACHE", "token_cache.sqlite")
+
+# 題目裡常見、但不帶主題資訊的詞（「何者」、「正確」、「應選」等），詞雲、標籤與 TF-IDF 都會濾掉
+BUILTIN_JUNK = frozenset({
+    '何者', '正確', '錯誤', '以下', '哪些', '有關', '關於', '描述',
+    '應選', '符合', '選項', '依據', '資料', '圖', '表', '請問',
+    '是何者', '為何', '敘述', '應為', '選出', '判斷', '說明'
+})
+
+_jieba_lock = threading.Lock()
+_jieba_ready = False
+
+
+def ensure_jieba():
+    global _jieba_ready
+    if not _jieba_ready:
+        with _jieba_lock:
+            if not _jieba_ready:
+                jieba.initialize()
+                _jieba_ready = True
+
+
+def is_noise(word):
+    # 空白、標點與符號不當作詞
+    return all(unicodedata.category(ch)[0] in "PZSC" for ch in word)
+
+
+def _cut_chunk(texts):
+    # 在子行程執行；詞典由 initializer 載入過一次
+    return [jieba.lcut(t) for t in texts]
+
+
+class TokenStore:
+    def __init__(self, path=TOKEN_CACHE_PATH):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS tokens (key TEXT PRIMARY KEY, tokens TEXT)")
+
+    @contextmanager
+    def _connect(self):
+        # sqlite3 的 with 只負責 commit / rollback，不會關閉連線，要另外 closing
+        with closing(sqlite3.connect(self.path, timeout=30)) as conn, conn:
+            yield conn
+
+    def get_many(self, keys):
+        found = {}
+        keys = list(dict.fromkeys(keys))
+        with self._connect() as conn:
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                rows = conn.execute(f"SELECT key, tokens FROM tokens WHERE key IN ({','.join('?' * len(chunk))})",
+                                    chunk)
+                for key, tokens in rows:
+                    found[key] = json.loads(tokens)
+        return found
+
+    def put_many(self, items):
+        with self._connect() as conn:
+            conn.executemany("INSERT OR REPLACE INTO tokens (key, tokens) VALUES (?, ?)",
+                             [(key, json.dumps(tokens, ensure_ascii=False)) for key, tokens in items])
+
+    def __len__(self):
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM tokens").fetchone()[0]
+
+
+class Tokenizer:
+    def __init__(self, stopwords=(), min_len=1, lowercase=False, drop_noise=False, store_path=TOKEN_CACHE_PATH):
+        self.stopwords = frozenset(stopwords)
+        self.min_len = min_len
+        self.lowercase = lowercase
+        self.drop_noise = drop_noise
+        config = {"min_len": min_len, "lowercase": lowercase, "drop_noise": drop_noise,
+                  "stopwords": sorted(self.stopwords)}
+        self.version = hashlib.sha256(json.dumps(config, ensure_ascii=False).encode("utf-8")).hexdigest()[:16]
+        self.store_path = store_path
+        self._store = None
+        self._memory = {}
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def store(self):
+        # 第一次批次斷詞時才開檔，只 import 不會產生快取檔
+        if self._store is None and self.store_path:
+            self._store = TokenStore(self.store_path)
+        return self._store
+
+    def _filter(self, words):
+        tokens = []
+        for w in words:
+            if not w.strip() or len(w.strip()) < self.min_len or w in self.stopwords:
+                continue
+            if self.drop_noise and is_noise(w):
+                continue
+            tokens.append(w.lower() if self.lowercase else w)
+        return tokens
+
+    def tokenize(self, text):
+        # 單筆（例如查詢字串）直接斷詞，不查也不寫快取
+        ensure_jieba()
+        return self._filter(jieba.lcut(text))
+
+    def _key(self, text):
+        return hashlib.sha256(f"{self.version}\0{text}".encode("utf-8")).hexdigest()
+
+    def tokenize_many(self, texts, workers=None, min_parallel=2000, chunksize=256):
+        texts = list(texts)
+        keys = [self._key(t) for t in texts]
+        found = {k: self._memory[k] for k in keys if k in self._memory}
+        missing = [k for k in dict.fromkeys(keys) if k not in found]
+        if missing and self.store is not None:
+            found.update(self.store.get_many(missing))
+            missing = [k for k in missing if k not in found]
+
+        if missing:
+            text_of = dict(zip(keys, texts))
+            todo = [text_of[k] for k in missing]
+            if workers and workers > 1 and len(todo) >= min_parallel:
+                chunks = [todo[i:i + chunksize] for i in range(0, len(todo), chunksize)]
+                with ProcessPoolExecutor(max_workers=workers, initializer=ensure_jieba) as pool:
+                    cut = [words for chunk in pool.map(_cut_chunk, chunks) for words in chunk]
+            else:
+                ensure_jieba()
+                cut = [jieba.lcut(t) for t in todo]
+            new = {k: self._filter(words) for k, words in zip(missing, cut)}
+            found.update(new)
+            if self.store is not None:
+                self.store.put_many(new.items())
+
+        self.hits += len(set(keys)) - len(missing)
+        self.misses += len(missing)
+        self._memory.update(found)
+        return [list(found[k]) for k in keys]
+
+
+def analyzer_tokenizer(stopwords=(), store_path=TOKEN_CACHE_PATH):
+    # 詞雲、標籤與全題庫 TF-IDF 共用的設定：設定相同，斷詞快取就能共用
+    return Tokenizer(stopwords=set(stopwords) | BUILTIN_JUNK, min_len=2, drop_noise=True, store_path=store_path)
@@ -1,34 +1,267 @@
-import os, json
+import os, re, sys, json
+import numpy as np
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from core.QuestionExtractor import QuestionExtractor
 from core.EmbeddingGenerator import EmbeddingGenerator
-from core.SimilaritySearcher import SimilaritySearcher
+from core.SimilaritySearcher import SimilaritySearcher, print_hits
+from core.NeighbourTable import NeighbourTable
+from core.QuestionKey import question_key
+from core.StageGraph import StageGraph
+from core.CombineJson import combine_json
+from core.QuestionStore import iter_questions, write_questions
 
-def run_pipeline(pdf_folder="pdf_data", output_folder="output_data", year_start=106, year_end=113):
-    Path(output_folder).mkdir(parents=True, exist_ok=True)
-    json_paths, npz_paths = [], []
+EMBEDDING_MODEL = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+INDEX_MODEL = "shibing624/text2vec-base-chinese"
+
+# 抽取結果中常見的版面殘留：頁首頁尾（「108年學測 第 2 頁 自然考科 共 19 頁」，順序不一）、
+# 下一大題的標題與說明被併進上一題的最後一個選項、分頁線與孤立的 markdown 標題符號
+_PAGE_FOOTER = re.compile(r"(?:\s*(?:\d{3}\s*年學測|第\s*\d+\s*頁|共\s*\d+\s*頁|\S{2}考科)){2,}")
+_SECTION_HEADER = re.compile(r"\s*#{1,6}\s*(?:[一二三四五六七八九十]+、|第[壹貳參肆伍陸柒捌玖拾]+部分).*$", re.S)
+_PAGE_RULE = re.compile(r"\s*-{5,}")
+_TRAILING_MARKS = re.compile(r"[\s#]+$")
+
+def _extract_year(pdf_path, json_path):
+    # 在子行程執行，每個 worker 處理一份 PDF
+    extractor = QuestionExtractor(pdf_path)
+    extractor.process_pdf(json_path)
+    with open(json_path, encoding="utf-8") as f:
+        return json.load(f)
+
+def _clean_text(text):
+    text = _SECTION_HEADER.sub("", _PAGE_FOOTER.sub("", text))
+    return _TRAILING_MARKS.sub("", _PAGE_RULE.sub("", text)).strip()
+
+def _clean_year(json_path, clean_path):
+    # 清掉版面殘留，並丟掉清完後沒有題幹的題目；輸出為 JSONL（見 core/QuestionStore.py）
+    total = 0
+    cleaned = []
+    for q in iter_questions(json_path):
+        total += 1
+        q = {**q, "stem": _clean_text(q.get("stem", "")),
+             "group_context": _clean_text(q.get("group_context") or ""),
+             "options": {k: _clean_text(v) for k, v in q.get("options", {}).items()}}
+        if q["stem"]:
+            cleaned.append(q)
+    write_questions(clean_path, cleaned)
+    print(f"🧹 {clean_path}：保留 {len(cleaned)}/{total} 題")
 
-    # Step 1: Extract questions from PDFs
-    for year in range(year_start, year_end + 1):
+def _run_sequential(pdf_folder, output_folder, years, embedder):
+    json_paths, npz_paths = [], []
+    for year in years:
         pdf_path = os.path.join(pdf_folder, f"{year}_q.pdf")
         json_path = os.path.join(output_folder, f"{year}.json")
-        npz_path = os.path.join(output_folder, f"{year}.npz")
+        npz_path = os.path.join(output_folder, f"{year}.qstore")
 
+        # Step 1: Extract questions from PDFs
         print(f"\n📄 處理中：{pdf_path}")
         extractor = QuestionExtractor(pdf_path)
         extractor.process_pdf(json_path)
         json_paths.append(json_path)
 
         # Step 2: Generate embeddings
-        embedder = EmbeddingGenerator(json_path)
-        embedder.generate_embeddings(npz_path)
+        embedder.generate_embeddings(npz_path, json_path=json_path)
         npz_paths.append(npz_path)
+    return json_paths, npz_paths
+
+def _run_parallel(pdf_folder, output_folder, years, embedder, workers=None, batch_size=256):
+    json_paths, npz_paths = [], []
+    pending = []  # 已抽取完、等待編碼的 (year, questions)
+
+    def flush():
+        # 把多個年度累積的題目併成一個 batch 交給同一個模型編碼
+        texts = [embedder.make_embedding_text(q) for _, questions in pending for q in questions]
+        embs = embedder.encode(texts)
+        start = 0
+        for year, questions in pending:
+            npz_path = os.path.join(output_folder, f"{year}.qstore")
+            embedder.write_embeddings(questions, embs[start:start + len(questions)], npz_path)
+            start += len(questions)
+            npz_paths.append(npz_path)
+        pending.clear()
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {}
+        for year in years:
+            pdf_path = os.path.join(pdf_folder, f"{year}_q.pdf")
+            if not os.path.exists(pdf_path):
+                print(f"⚠️ 找不到 {pdf_path}，略過")
+                continue
+            json_path = os.path.join(output_folder, f"{year}.json")
+            futures[pool.submit(_extract_year, pdf_path, json_path)] = (year, json_path)
+
+        # 主行程一邊收抽取結果一邊編碼，其他 PDF 同時在子行程裡抽取
+        for future in as_completed(futures):
+            year, json_path = futures[future]
+            try:
+                questions = future.result()
+            except Exception as e:
+                print(f"❌ {year} 抽取失敗：", e)
+                continue
+            json_paths.append(json_path)
+            pending.append((year, questions))
+            if sum(len(q) for _, q in pending) >= batch_size:
+                flush()
+        if pending:
+            flush()
+
+    return sorted(json_paths), sorted(npz_paths)
+
+def _run_streaming(pdf_folder, output_folder, years, embedder, workers=None, batch_size=32):
+    json_paths, npz_paths = [], []
+    for year in years:
+        pdf_path = os.path.join(pdf_folder, f"{year}_q.pdf")
+        if not os.path.exists(pdf_path):
+            print(f"⚠️ 找不到 {pdf_path}，略過")
+            continue
+        json_path = os.path.join(output_folder, f"{year}.json")
+        npz_path = os.path.join(output_folder, f"{year}.qstore")
+        print(f"\n📄 串流處理中：{pdf_path}")
+
+        # 頁面在子行程裡轉 markdown，主行程題目一湊滿 batch_size 就先編碼
+        extractor = QuestionExtractor(pdf_path)
+        questions, embs, batch = [], [], []
+        for q in extractor.iter_questions(workers=workers):
+            batch.append(q)
+            if len(batch) >= batch_size:
+                embs.append(embedder.encode([embedder.make_embedding_text(x) for x in batch]))
+                questions.extend(batch)
+                batch = []
+        if batch:
+            embs.append(embedder.encode([embedder.make_embedding_text(x) for x in batch]))
+            questions.extend(batch)
+        if not questions:
+            print(f"⚠️ {pdf_path} 沒有抽到題目，略過")
+            continue
+
+        # 輸出順序與一般模式相同（依題號排序）
+        order = sorted(range(len(questions)), key=lambda i: questions[i]["id"])
+        questions = [questions[i] for i in order]
+        embs = np.vstack(embs)[order]
+        Path(json_path).write_text(json.dumps(questions, ensure_ascii=False, indent=2), encoding="utf-8")
+        embedder.write_embeddings(questions, embs, npz_path)
+        json_paths.append(json_path)
+        npz_paths.append(npz_path)
+    return json_paths, npz_paths
+
+def run_build(pdf_folder="pdf_data", output_folder="output_data", year_start=106, year_end=113,
+              model_name=EMBEDDING_MODEL, index_model_name=INDEX_MODEL, tags=True,
+              font_path="NotoSansTC-Regular.otf", stopwords_path="./core/stopwords.txt", force=()):
+    # 增量建置：extract → clean → combine → tfidf / embed → neighbours / index → tag，
+    # 依 output_folder/manifest.json 的紀錄只重跑輸入、參數或輸出有變動的階段（見 core/StageGraph.py）
+    out = Path(output_folder)
+    for sub in ("clean", "results"):
+        (out / sub).mkdir(parents=True, exist_ok=True)
+    graph = StageGraph(out / "manifest.json")
+    models = {}
+
+    def embedder():
+        # 只有真的要編碼時才載入模型
+        if "embedder" not in models:
+            models["embedder"] = EmbeddingGenerator(model_name=model_name)
+        return models["embedder"]
+
+    years = [y for y in range(year_start, year_end + 1) if os.path.exists(os.path.join(pdf_folder, f"{y}_q.pdf"))]
+    json_paths, clean_paths, npz_paths = {}, {}, {}
+    for year in years:
+        pdf_path = os.path.join(pdf_folder, f"{year}_q.pdf")
+        json_paths[year] = str(out / f"{year}.json")
+        clean_paths[year] = str(out / "clean" / f"{year}.jsonl")
+        npz_paths[year] = str(out / f"{year}.qstore")
+
+        graph.add(f"extract:{year}", lambda p=pdf_path, j=json_paths[year]: QuestionExtractor(p).process_pdf(j),
+                  inputs=[pdf_path], outputs=[json_paths[year]])
+        graph.add(f"clean:{year}", lambda j=json_paths[year], c=clean_paths[year]: _clean_year(j, c),
+                  inputs=[json_paths[year]], outputs=[clean_paths[year]])
+
+    # 各年度的 JSONL 直接接起來就是整份題庫
+    all_json = str(out / "all.jsonl")
+    graph.add("combine", lambda: combine_json(list(clean_paths.values()), all_json),
+              inputs=list(clean_paths.values()), outputs=[all_json])
+
+    # 全題庫只建一次 TF-IDF，並輸出年度間上升 / 下降的詞（core/TfidfModel.py）；
+    # 由各年度檔建立，每列的年度取自所在的年度檔，頁尾抓不到年度的題目也能依年度切片
+    tfidf_path = str(out / "results" / "tfidf.npz")
+    trend_path = str(out / "results" / "tfidf_trends.json")
+
+    def build_tfidf():
+        from core.TfidfModel import build_model
+        models["tfidf"] = build_model(list(clean_paths.values()), tfidf_path, stopwords_path=stopwords_path,
+                                      trend_path=trend_path, years=list(clean_paths))
+
+    graph.add("tfidf", build_tfidf, inputs=list(clean_paths.values()) + [stopwords_path],
+              outputs=[tfidf_path, trend_path])
+
+    for year in years:
+        graph.add(f"embed:{year}",
+                  lambda c=clean_paths[year], n=npz_paths[year]: embedder().generate_embeddings(n, json_path=c),
+                  inputs=[clean_paths[year]], outputs=[npz_paths[year]], params={"model_name": model_name})
+
+    neighbours_path = str(out / "neighbours.npz")
+    graph.add("neighbours", lambda: NeighbourTable.refresh(list(npz_paths.values()), neighbours_path),
+              inputs=list(npz_paths.values()), outputs=[neighbours_path])
+
+    snapshot_dir = str(out / "index_snapshots")
+
+    def build_index():
+        from core.BmHnsw import BM25HNSWRetriever
+        BM25HNSWRetriever(all_json, model_name=index_model_name).load_or_build(snapshot_dir)
+
+    graph.add("index", build_index, inputs=[all_json], outputs=[snapshot_dir],
+              params={"model_name": index_model_name})
+
+    if tags:
+        results_dir = str(out / "results")
+
+        def tag_year(year):
+            # 詞雲與 KeyBERT 的相依套件較重，只有要重跑標籤時才載入
+            from core.TagGenerate import QuizAnalyzer
+            from core.TfidfModel import TfidfModel
+            if "analyzer" not in models:
+                models["analyzer"] = QuizAnalyzer(stopwords_path=stopwords_path)
+            if "tfidf" not in models:
+                models["tfidf"] = TfidfModel.load(tfidf_path)
+            models["analyzer"].process_year_file(year=year, font_path=font_path, input_json=clean_paths[year],
+                                                 output_dir=results_dir, store_path=npz_paths[year],
+                                                 tfidf_model=models["tfidf"])
+
+        for year in years:
+            outputs = [os.path.join(results_dir, f"{year}_with_tags.json"),
+                       os.path.join(results_dir, "wordclouds", f"{year}.png"),
+                       os.path.join(results_dir, "keywords", f"{year}.png")]
+            graph.add(f"tag:{year}", lambda y=year: tag_year(y),
+                      inputs=[clean_paths[year], npz_paths[year], stopwords_path, tfidf_path],
+                      outputs=outputs, params={"font_path": font_path, "top_k_wordcloud": 100, "top_k_tags": 15})
+
+    report = graph.run(force=force)
+    return report, [json_paths[y] for y in years], [npz_paths[y] for y in years]
+
+def run_pipeline(pdf_folder="pdf_data", output_folder="output_data", year_start=106, year_end=113,
+                 parallel=False, workers=None, streaming=False, incremental=False):
+    Path(output_folder).mkdir(parents=True, exist_ok=True)
+    years = range(year_start, year_end + 1)
+
+    # 整個 pipeline 共用同一個模型（core/ModelRegistry.py）：抽取不需要模型，編碼與搜尋共用一份
+    embedder = EmbeddingGenerator()
+    if incremental:
+        _, json_paths, npz_paths = run_build(pdf_folder, output_folder, year_start, year_end,
+                                             model_name=embedder.model_name, tags=False)
+    elif streaming:
+        json_paths, npz_paths = _run_streaming(pdf_folder, output_folder, years, embedder, workers=workers)
+    elif parallel:
+        json_paths, npz_paths = _run_parallel(pdf_folder, output_folder, years, embedder, workers=workers)
+    else:
+        json_paths, npz_paths = _run_sequential(pdf_folder, output_folder, years, embedder)
 
     print("\n✅ 所有 PDF 處理與 Embedding 完成")
 
-    # Step 3 (optional): Search similar questions
+    # Step 3: 題庫內每題的前 k 名相似題，新增年度時只補算新的部分
+    table = NeighbourTable.refresh(npz_paths, os.path.join(output_folder, "neighbours.npz"))
+
+    # Step 4 (optional): Search similar questions
+    # 題庫內的題目直接查表；模型是延遲載入的，只有查表查不到時才會真的載入
     print("\n🔍 初始化 Similarity Searcher...")
-    searcher = SimilaritySearcher(npz_paths)
+    searcher = SimilaritySearcher(npz_paths, model_name=embedder.model_name)
 
     while True:
         try:
@@ -46,9 +279,25 @@ def run_pipeline(pdf_folder="pdf_data", output_folder="output_data", year_start=
                 print("⚠️ 題號無效。")
                 continue
             q = questions[qid - 1]
-            searcher.search(q.get("group_context", ""), q["stem"], top_k=5)
+            # 同一個 key 可能對到多題（年度 unknown、重複收錄），以向量化文字分辨，分辨不出來就即時搜尋
+            key = question_key({**q, "year": q.get("year", year)})
+            text = EmbeddingGenerator.make_embedding_text(q)
+            if table.find(key, text) is not None:
+                print_hits(table.similar(key, top_k=5, text=text))
+            else:
+                searcher.search(q.get("group_context", ""), q["stem"], top_k=5)
         except Exception as e:
             print("❌ 發生錯誤：", e)
 
 if __name__ == "__main__":
-    run_pipeline()
+    # python pipeline.py --parallel：PDF 抽取分散到多個行程
+    # python pipeline.py --stream：逐頁抽取（頁面分散到多個行程），邊抽邊編碼
+    # python pipeline.py --incremental：只重跑有變動的階段後進入查詢
+    # python pipeline.py --build [--force extract:108 ...]：只做增量建置（含標籤與詞雲），印出各階段報告
+    if "--build" in sys.argv:
+        forced = sys.argv[sys.argv.index("--force") + 1:] if "--force" in sys.argv else []
+        run_build(force=forced)
+    else:
+        run_pipeline(parallel="--parallel" in sys.argv, streaming="--stream" in sys.argv,
+                     incremental="--incremental" in sys.argv,
+                     workers=os.cpu_count() if "--stream" in sys.argv else None)
@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+
+faiss = pytest.importorskip("faiss")
+
+from core.AnnIndex import AnnIndex
+
+KINDS = {
+    "flat": {},
+    "hnsw": {"m": 16},
+    "ivfpq": {"nlist": 8, "pq_m": 4, "nbits": 4},
+}
+
+
+def unit(n, dim=32, seed=0):
+    x = np.random.default_rng(seed).standard_normal((n, dim)).astype(np.float32)
+    return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+
+@pytest.mark.parametrize("kind", sorted(KINDS))
+def test_save_load_add(tmp_path, kind):
+    base, extra = unit(1000), unit(20, seed=1)
+    AnnIndex(kind, **KINDS[kind]).build(base).save(str(tmp_path / "ann"))
+
+    ann = AnnIndex.load(str(tmp_path / "ann"))
+    assert ann.kind == kind and ann.ntotal == len(base)
+    # 從快照載入後還要能增量加題（BM25HNSWRetriever.add_questions）
+    ann.add(extra)
+    assert ann.ntotal == len(base) + len(extra)
+
+    scores, ids = ann.search(extra[:5], 10, ef_search=64, nprobe=8)
+    assert ids.shape == (5, 10)
+    if kind != "ivfpq":
+        # 精確 / 圖索引要能找回剛加進去的向量本身
+        assert list(ids[:, 0]) == list(range(len(base), len(base) + 5))
@@ -0,0 +1,14 @@
+import os
+import sys
+import subprocess
+import pytest
+
+pytest.importorskip("langchain")
+
+
+def test_import_does_not_load_retriever_stack():
+    # 批次評分只需要 build_content，不應該載入 faiss 與 BM25/HNSW retriever
+    code = "import sys, core.BatchScorer; print('faiss' in sys.modules, 'core.BmHnsw' in sys.modules)"
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                         cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    assert out.stdout.split() == ["False", "False"]
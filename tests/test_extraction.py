@@ -0,0 +1,68 @@
+import os
+import re
+import json
+import glob
+import pytest
+import core.QuestionExtractor as qe
+from core.QuestionExtractor import QuestionExtractor
+
+# 以 pdf_data 各份試卷的 pymupdf4llm 輸出（tests/fixtures/extract）做回歸測試：
+#   {year}.md             整份轉換的 markdown（process_pdf 的輸入）
+#   {year}.pages.json     逐頁轉換的 markdown（iter_questions 的輸入，每兩頁一批）
+#   {year}.baseline.json  baseline 版 QuestionExtractor 由 {year}.md 解析出的題目
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures", "extract")
+YEARS = sorted(os.path.basename(p).split(".")[0] for p in glob.glob(os.path.join(FIXTURES, "*.md")))
+
+
+def read(year, suffix):
+    with open(os.path.join(FIXTURES, f"{year}{suffix}"), encoding="utf-8") as f:
+        return f.read()
+
+
+def batch_questions(year):
+    # 與 process_pdf 相同的步驟，只是不重新轉換 PDF、不寫檔
+    md = read(year, ".md")
+    extractor = QuestionExtractor(f"{year}_q.pdf")
+    extractor.extract_exam_info(md)
+    clean = extractor.clean_md_text(md)
+    return extractor, clean, extractor.extract_questions(clean, extractor.extract_groups(clean))
+
+
+def canonical_headings(value):
+    # 串流模式的標題一律是單一個 #；比對時把兩邊的標題層級都換成單一個 #
+    return json.loads(re.sub(r'(?<!\S)#{1,6}(?=\s|")', '#', json.dumps(value, ensure_ascii=False)))
+
+
+def test_fixtures_present():
+    assert YEARS
+
+
+@pytest.mark.parametrize("year", YEARS)
+def test_batch_matches_baseline(year):
+    _, _, questions = batch_questions(year)
+    assert questions == json.loads(read(year, ".baseline.json"))
+
+
+@pytest.mark.parametrize("year", YEARS)
+def test_streaming_matches_batch(year, monkeypatch):
+    pages = json.loads(read(year, ".pages.json"))
+    monkeypatch.setattr(qe, "iter_page_markdown", lambda *args, **kwargs: iter(pages))
+    streamed = sorted(QuestionExtractor(f"{year}_q.pdf").iter_questions(), key=lambda q: q["id"])
+    _, _, questions = batch_questions(year)
+    assert canonical_headings(streamed) == canonical_headings(questions)
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_section_header_cleaned_from_options(streaming, monkeypatch):
+    # 106-22 的選項 E 後面接著下一大題的標題與說明，清理時要靠標題符號辨識並切掉（pipeline._clean_text）
+    from pipeline import _clean_text
+    if streaming:
+        pages = json.loads(read("106", ".pages.json"))
+        monkeypatch.setattr(qe, "iter_page_markdown", lambda *args, **kwargs: iter(pages))
+        questions = list(QuestionExtractor("106_q.pdf").iter_questions())
+    else:
+        questions = batch_questions("106")[2]
+    option = next(q for q in questions if q["id"] == 22)["options"]["E"]
+    assert "多選題" in option
+    assert "多選題" not in _clean_text(option)
@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+from core.ColumnarStore import write_store
+from core.NeighbourTable import NeighbourTable
+
+
+def make_store(path, texts, year="unknown", seed=0):
+    embs = np.random.default_rng(seed).standard_normal((len(texts), 8)).astype(np.float32)
+    embs /= np.linalg.norm(embs, axis=1, keepdims=True)
+    n = len(texts)
+    write_store(path, list(range(1, n + 1)), embs, texts, texts, [""] * n, [{}] * n, [year] * n, ["自然"] * n)
+    return path
+
+
+def test_duplicate_keys_are_not_confused(tmp_path):
+    # 兩個年度 unknown 的檔案，題號 1..3 撞號但內容不同
+    a = make_store(str(tmp_path / "a.qstore"), ["甲題一", "甲題二", "甲題三"], seed=0)
+    b = make_store(str(tmp_path / "b.qstore"), ["乙題一", "乙題二", "乙題三"], seed=1)
+    c = make_store(str(tmp_path / "c.qstore"), ["丙題一", "丙題二"], year="108", seed=2)
+    table = NeighbourTable.build([a, b, c], str(tmp_path / "neighbours.npz"), k=3)
+
+    assert "108-1" in table
+    assert "unknown-1" not in table
+    assert table.find("unknown-1") is None
+    assert table.find("unknown-1", "甲題一") == 0
+    assert table.find("unknown-1", "乙題一") == 3
+    assert table.find("unknown-1", "其他題") is None
+
+    # 用文字分辨出來的那一列（第 5 列，乙題二），鄰居就是該列自己算出來的鄰居
+    stems = ["甲題一", "甲題二", "甲題三", "乙題一", "乙題二", "乙題三", "丙題一", "丙題二"]
+    hits = table.similar("unknown-2", top_k=3, text="乙題二")
+    assert [h["stem"] for h in hits] == [stems[i] for i in table.indices[4] if i >= 0]
+    assert "乙題二" not in [h["stem"] for h in hits]
+
+def test_ambiguous_key_raises(tmp_path):
+    a = make_store(str(tmp_path / "a.qstore"), ["甲題一", "甲題二"], seed=0)
+    b = make_store(str(tmp_path / "b.qstore"), ["乙題一", "乙題二"], seed=1)
+    table = NeighbourTable.build([a, b], str(tmp_path / "neighbours.npz"), k=2)
+    with pytest.raises(KeyError):
+        table.similar("unknown-1")
+    with pytest.raises(KeyError):
+        table.neighbours("unknown-2")
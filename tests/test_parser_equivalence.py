@@ -0,0 +1,41 @@
+import os
+import glob
+import pytest
+from core.QuestionExtractor import QuestionExtractor
+from benchmarks.legacy_parser import extract_groups_regex, extract_questions_regex
+from benchmarks.parser_bench import CASES
+from tests.test_extraction import YEARS, batch_questions
+
+# 逐行狀態機與舊版 regex 解析（benchmarks/legacy_parser.py）必須輸出完全相同的 JSON：
+# 真實試卷（擷取好的 markdown 與 pdf_data 現場轉換）與 parser_bench 刻意構造的輸入都要比對。
+
+PDF_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "pdf_data")
+
+
+def both(extractor, clean):
+    new = extractor.extract_questions(clean, extractor.extract_groups(clean))
+    old = extract_questions_regex(clean, extract_groups_regex(clean), year=extractor.year, subject=extractor.subject)
+    return new, old
+
+
+@pytest.mark.parametrize("year", YEARS)
+def test_captured_markdown(year):
+    extractor, clean, _ = batch_questions(year)
+    new, old = both(extractor, clean)
+    assert new == old
+
+
+@pytest.mark.parametrize("pdf_path", sorted(glob.glob(os.path.join(PDF_DIR, "*_q.pdf"))))
+def test_pdf_data(pdf_path):
+    pymupdf4llm = pytest.importorskip("pymupdf4llm")
+    extractor = QuestionExtractor(pdf_path)
+    md = pymupdf4llm.to_markdown(pdf_path)
+    extractor.extract_exam_info(md)
+    new, old = both(extractor, extractor.clean_md_text(md))
+    assert new and new == old
+
+
+@pytest.mark.parametrize("case", sorted(CASES))
+def test_bench_cases(case):
+    new, old = both(QuestionExtractor("bench.pdf"), CASES[case](200))
+    assert new == old
@@ -0,0 +1,54 @@
+import time
+import threading
+import pytest
+
+pytest.importorskip("langchain")
+
+from core import Score
+from core.Score import DifficultyScorer, GuardedLLM, TokenBucket
+from benchmarks.fake_llm import FakeLLM
+
+QUESTION = {"content": "下列何者為氧化還原反應？ (A) 甲 (B) 乙 (C) 丙 (D) 丁 (E) 戊"}
+
+
+class BlockingLLM:
+    # 第一次呼叫卡住直到 release，之後立刻回覆
+    def __init__(self):
+        self.release = threading.Event()
+
+    def _call(self, prompt, stop=None):
+        self.release.wait()
+        return "ok"
+
+
+def test_slot_wait_is_bounded_by_timeout():
+    inner = BlockingLLM()
+    llm = GuardedLLM(inner, timeout=0.2, max_retries=0, max_workers=1)
+    try:
+        with pytest.raises(TimeoutError):
+            llm._call("first")
+        # 唯一的名額還被逾時的第一個呼叫佔著，第二個呼叫等不到名額也要在 timeout 內放棄
+        start = time.monotonic()
+        with pytest.raises(TimeoutError):
+            llm._call("second")
+        assert time.monotonic() - start < 1.0
+    finally:
+        inner.release.set()
+        llm.shutdown(wait=True)
+
+
+def test_shared_llm_uses_scorer_settings(monkeypatch):
+    monkeypatch.setattr(Score, "_shared_llms", {})
+    monkeypatch.setattr(DifficultyScorer, "google_llm_model", staticmethod(lambda: FakeLLM()))
+    scorer = DifficultyScorer(QUESTION, rate_per_second=2.0, burst=1, timeout=5.0, max_retries=1, backoff=0.1,
+                              max_workers=3)
+    llm = scorer.models["gold"]
+    assert isinstance(llm.limiter, TokenBucket)
+    assert (llm.limiter.rate, llm.limiter.burst, llm.timeout, llm.max_retries, llm.backoff, llm.max_workers) \
+        == (2.0, 1, 5.0, 1, 0.1, 3)
+    # 相同設定共用同一份，不同設定各自一份
+    assert DifficultyScorer(QUESTION, rate_per_second=2.0, burst=1, timeout=5.0, max_retries=1, backoff=0.1,
+                            max_workers=3).models["gold"] is llm
+    assert DifficultyScorer(QUESTION).models["gold"] is not llm
+    for shared in Score._shared_llms.values():
+        shared.shutdown()
@@ -0,0 +1,59 @@
+import json
+import pytest
+
+pytest.importorskip("matplotlib")
+pytest.importorskip("wordcloud")
+pytest.importorskip("keybert")
+
+from core import TagAndCloud
+from core.TagAndCloud import QuizAnalyzer
+
+
+class RecordingCloud:
+    # 代替 WordCloud，只記下要畫的詞權重
+    last = None
+
+    def __init__(self, **kwargs):
+        pass
+
+    def generate_from_frequencies(self, freqs):
+        RecordingCloud.last = dict(freqs)
+
+    def to_file(self, path):
+        pass
+
+
+@pytest.fixture
+def analyzer(monkeypatch):
+    monkeypatch.setattr(TagAndCloud, "WordCloud", RecordingCloud)
+    monkeypatch.setattr(TagAndCloud.plt, "show", lambda: None)
+    qa = QuizAnalyzer()
+    monkeypatch.setattr(qa, "tokenize_many", lambda texts, workers=None: [t.split() for t in texts])
+    return qa
+
+
+def write_year(path, stems):
+    path.write_text(json.dumps([{"id": i + 1, "stem": s} for i, s in enumerate(stems)], ensure_ascii=False),
+                    encoding="utf-8")
+    return str(path)
+
+
+def test_texts_without_model(analyzer):
+    # 沒有 fit_tfidf 時與 TagGenerate 相同，只用傳入的題目計算
+    analyzer.generate_wordcloud_tfidf(["氧化 還原", "氧化 酸鹼"], font_path=None, top_k=1)
+    assert list(RecordingCloud.last) == ["氧化"]
+
+
+def test_fitted_model_by_year(analyzer, tmp_path):
+    a = write_year(tmp_path / "106.json", ["氧化 還原", "氧化 電池"])
+    b = write_year(tmp_path / "107.json", ["光合 作用", "細胞 分裂"])
+    analyzer.fit_tfidf([a, b])
+
+    analyzer.process_and_visualize(b, font_path=None)
+    assert set(RecordingCloud.last) == {"光合", "作用", "細胞", "分裂"}
+    # 指定模型裡沒有的年度時直接報錯，不靜默改用別的資料
+    with pytest.raises(ValueError):
+        analyzer.generate_wordcloud_tfidf(["氧化"], font_path=None, year="999")
+    # 不指定年度時仍用傳入的題目
+    analyzer.generate_wordcloud_tfidf(["酸鹼 中和"], font_path=None)
+    assert set(RecordingCloud.last) == {"酸鹼", "中和"}